@@ -87,8 +87,52 @@ class RecommendationService {
     }
   }
 
+  /// Get recommended clubs for a student
+  ///
+  /// [studentUid] - Firebase UID of the student
+  /// [topN] - Number of clubs to fetch (default: 5)
+  ///
+  /// Returns a list of club IDs or empty list if error
+  static Future<List<String>> getClubRecommendations(
+    String studentUid, {
+    int topN = 5,
+  }) async {
+    try {
+      final url = Uri.parse(
+          '$baseUrl/api/recommendations/$studentUid/clubs?top_n=$topN');
+
+      final response = await http.get(
+        url,
+        headers: {'Content-Type': 'application/json'},
+      ).timeout(const Duration(seconds: 10));
+
+      if (response.statusCode == 200) {
+        final data = json.decode(response.body) as Map<String, dynamic>;
+        final clubs = data['clubs'] as List<dynamic>? ?? [];
+        return clubs.map((club) => club['clubId'] as String).toList();
+      } else if (response.statusCode == 404) {
+        print('Student not found: $studentUid');
+        return [];
+      } else {
+        print('Error fetching club recommendations: ${response.statusCode}');
+        return [];
+      }
+    } catch (e) {
+      print('Exception while fetching club recommendations: $e');
+      return [];
+    }
+  }
+
   /// Refresh the recommendation system (after adding new events)
-  static Future<bool> refreshRecommendations() async {
+  ///
+  /// The API runs the refresh in the background and answers 202 with a job
+  /// id (one per shard behind the router). This polls /api/refresh/<jobId>
+  /// until every job is done or failed, or [timeout] runs out.
+  ///
+  /// Returns true if every refresh job finished successfully
+  static Future<bool> refreshRecommendations({
+    Duration timeout = const Duration(minutes: 2),
+  }) async {
     try {
       final url = Uri.parse('$baseUrl/api/refresh');
 
@@ -97,13 +141,68 @@ class RecommendationService {
         headers: {'Content-Type': 'application/json'},
       ).timeout(const Duration(seconds: 30));
 
-      return response.statusCode == 200;
+      if (response.statusCode != 202 && response.statusCode != 200) {
+        print('Error starting refresh: ${response.statusCode}');
+        print('Response: ${response.body}');
+        return false;
+      }
+
+      final data = json.decode(response.body) as Map<String, dynamic>;
+      final jobs = data.containsKey('jobs')
+          ? (data['jobs'] as List<dynamic>).cast<Map<String, dynamic>>()
+          : [data];
+
+      final deadline = DateTime.now().add(timeout);
+      for (final job in jobs) {
+        final jobId = job['jobId'] as String?;
+        if (jobId == null) {
+          print('Refresh failed to start: ${job['error']}');
+          return false;
+        }
+        final status = await _waitForRefreshJob(jobId, deadline);
+        if (status != 'done') {
+          print('Refresh job $jobId ended as $status');
+          return false;
+        }
+      }
+      return true;
     } catch (e) {
       print('Exception while refreshing: $e');
       return false;
     }
   }
 
+  /// Poll a refresh job until it is done or failed
+  ///
+  /// Returns the final status, or 'timeout' if [deadline] passes first
+  static Future<String> _waitForRefreshJob(
+    String jobId,
+    DateTime deadline,
+  ) async {
+    final url = Uri.parse('$baseUrl/api/refresh/$jobId');
+
+    while (DateTime.now().isBefore(deadline)) {
+      final response = await http.get(
+        url,
+        headers: {'Content-Type': 'application/json'},
+      ).timeout(const Duration(seconds: 5));
+
+      if (response.statusCode != 200) {
+        print('Error polling refresh job $jobId: ${response.statusCode}');
+        return 'unknown';
+      }
+
+      final job = json.decode(response.body) as Map<String, dynamic>;
+      final status = job['status'] as String?;
+      if (status == 'done' || status == 'failed') {
+        return status!;
+      }
+
+      await Future.delayed(const Duration(seconds: 1));
+    }
+    return 'timeout';
+  }
+
   /// Get system statistics
   static Future<Map<String, dynamic>?> getStats() async {
     try {
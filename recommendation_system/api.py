@@ -1,35 +1,740 @@
 """
 api.py
 Flask API for ClubHub event recommendations
+
+Importing this module is cheap: pandas, scikit-learn, firebase_admin and the
+model itself are loaded by warm_up(), which create_app() starts.
 """
 
-from flask import Flask, request, jsonify
+import time
+api_import_started = time.perf_counter()
+
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
-from clubhub_recommender import ClubHubRecommender
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from metrics import stage_seconds
+from request_coalescer import RequestCoalescer
+from response_cache import ResponseCache
+from sharding import ShardClient, shard_of
+import gc
+import hashlib
+import json
+import metrics
 import os
+import threading
 import traceback
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process build lock
+    fcntl = None
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Flutter app
 
-# Initialize recommendation system once on startup
-print("🚀 Starting ClubHub Recommendation API...")
+# Imported by import_model_modules() during warm-up
+ClubHubRecommender = None
+model_snapshot = None
+
+# When create_app() warms up: 'background', 'eager' or 'preload' (see create_app)
+WARM_UP_MODE = os.getenv('API_WARM_UP', 'background')
+warm_up_lock = threading.Lock()
+warm_up_state = {'status': 'pending', 'stage': None, 'error': None}
+# Seconds per startup phase (see /health/ready and /metrics)
+startup_seconds = {}
+
+recommender = None
 FIREBASE_CRED = os.getenv('FIREBASE_CRED_PATH', 'serviceAccountKey.json')
+FIRESTORE_EMULATOR = os.getenv('FIRESTORE_EMULATOR_HOST')
+
+# Shared model snapshots for multi-worker deployments (see model_snapshot.py)
+SNAPSHOT_DIR = os.getenv('MODEL_SNAPSHOT_DIR')
+SNAPSHOT_POLL_SECONDS = float(os.getenv('MODEL_SNAPSHOT_POLL_SECONDS', '5'))
+# Snapshots older than this are reconciled with Firestore after a cold start
+RECONCILE_AFTER_SECONDS = float(os.getenv('MODEL_RECONCILE_AFTER_SECONDS', '60'))
+snapshot_check_lock = threading.Lock()
+last_snapshot_check = 0.0
+
+# Precomputed recommendations (python clubhub_recommender.py precompute <dir>)
+TABLE_DIR = os.getenv('RECOMMENDATION_TABLE_DIR')
+TABLE_MAX_AGE_SECONDS = float(os.getenv('RECOMMENDATION_TABLE_MAX_AGE_SECONDS', '86400'))
+recommendation_table = None
+
+# Serialized /api/recommendations/<uid> responses, keyed by (uid, top_n)
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '300'))
+)
+
+# Bounded pool that runs all recommendation scoring; request threads wait on it,
+# so concurrent requests can't oversubscribe the CPUs (or the GIL)
+SCORING_THREADS = int(os.getenv('SCORING_THREADS', str(os.cpu_count() or 1)))
+scoring_pool = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix='scoring')
+
+# Concurrent /api/recommendations/<uid> requests are scored together in one batch
+# (max_size becomes ClubHubRecommender.BATCH_CHUNK_SIZE once it's imported)
+request_coalescer = RequestCoalescer(
+    lambda rec, student_uids, top_n: scoring_pool.submit(rec.recommend_many, student_uids, top_n).result(),
+    window=float(os.getenv('RECOMMEND_COALESCE_WINDOW_MS', '2')) / 1000
+)
+
+# Background refresh jobs (see /api/refresh)
+MAX_REFRESH_JOBS = 20
+refresh_lock = threading.Lock()
+refresh_jobs = {}
+active_refresh_job = None
+startup_reconcile_job = None
+
+# Partitioned mode: a shard node serves the students with shard_of(uid, SHARD_COUNT) == SHARD_INDEX
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+SHARD = (int(os.getenv('SHARD_INDEX', '0')), SHARD_COUNT) if SHARD_COUNT > 1 else None
+# A router node has no model and sends requests to these shard nodes (base URLs, in shard order)
+SHARD_URLS = [url.strip() for url in os.getenv('SHARD_URLS', '').split(',') if url.strip()]
+shard_client = ShardClient(
+    SHARD_URLS, timeout=float(os.getenv('SHARD_TIMEOUT_SECONDS', '30'))
+) if SHARD_URLS else None
+
+# Students per /api/recommendations/batch request
+MAX_BATCH_STUDENTS = int(os.getenv('MAX_BATCH_STUDENTS', '500'))
+# Students per /api/recommendations/batch/stream request
+MAX_STREAM_STUDENTS = int(os.getenv('MAX_STREAM_STUDENTS', '100000'))
+
+# Request latency per route (see /metrics)
+request_seconds = metrics.Histogram(
+    'clubhub_http_request_seconds', 'Time to handle an API request', ('method', 'route', 'status')
+)
+
+
+def import_model_modules():
+    """Import the model stack (pandas, scikit-learn, firebase_admin) once per process"""
+    global ClubHubRecommender, model_snapshot
+    
+    if ClubHubRecommender is not None:
+        return
+    started = time.perf_counter()
+    import model_snapshot
+    from clubhub_recommender import ClubHubRecommender
+    request_coalescer.max_size = ClubHubRecommender.BATCH_CHUNK_SIZE
+    startup_seconds['model_imports'] = time.perf_counter() - started
+
+
+def build_recommender(on_progress=None):
+    """Build a model from Firestore, or from the emulator if FIRESTORE_EMULATOR_HOST is set"""
+    if FIRESTORE_EMULATOR:
+        from google.cloud import firestore as gcloud_firestore
+        project = os.getenv('GOOGLE_CLOUD_PROJECT', 'demo-clubhub')
+        return ClubHubRecommender(
+            on_progress=on_progress, db=gcloud_firestore.Client(project=project), shard=SHARD
+        )
+    return ClubHubRecommender(FIREBASE_CRED, on_progress=on_progress, shard=SHARD)
+
+
+def batch_error(student_uid, message):
+    """A /api/recommendations/batch entry for a student that couldn't be scored"""
+    return {'studentUid': student_uid, 'type': 'error', 'message': message, 'recommendations': []}
+
+
+def score_batch(student_uids, top_n):
+    """
+    recommend_many() on scoring_pool, split into BATCH_CHUNK_SIZE chunks that run in parallel
+    
+    Non-string uids, and the students of a chunk that fails to score, get a
+    batch_error() entry; the rest of the batch is still served.
+    """
+    rec = recommender  # every chunk uses the same model, even if a refresh swaps it
+    chunk_size = rec.BATCH_CHUNK_SIZE
+    valid = [uid for uid in student_uids if isinstance(uid, str)]
+    chunks = [valid[i:i + chunk_size] for i in range(0, len(valid), chunk_size)]
+    
+    def score(chunk):
+        try:
+            return rec.recommend_many(chunk, top_n=top_n)
+        except Exception as e:
+            print(f"❌ Error scoring batch chunk: {str(e)}")
+            traceback.print_exc()
+            return [batch_error(uid, f'Scoring failed: {e}') for uid in chunk]
+    
+    scored = (result for part in scoring_pool.map(score, chunks) for result in part)
+    return [
+        next(scored) if isinstance(uid, str) else batch_error(uid, 'studentUid must be a string')
+        for uid in student_uids
+    ]
+
+
+def stream_batch(rec, student_uids, top_n):
+    """
+    NDJSON lines of recommend_many() results, sent one BATCH_CHUNK_SIZE chunk at a time
+    
+    Chunks are scored on scoring_pool, at most SCORING_THREADS ahead of the
+    one being sent, so memory stays bounded however many students are asked
+    for. Non-string uids and chunks that fail to score get one error record
+    per student and the stream goes on. The last line is a summary record.
+    """
+    chunk_size = rec.BATCH_CHUNK_SIZE
+    chunks = (student_uids[i:i + chunk_size] for i in range(0, len(student_uids), chunk_size))
+    
+    def submit(chunk):
+        valid = [uid for uid in chunk if isinstance(uid, str)]
+        return chunk, scoring_pool.submit(rec.recommend_many, valid, top_n)
+    
+    pending = deque(submit(chunk) for chunk in islice(chunks, SCORING_THREADS))
+    total = errors = 0
+    try:
+        while pending:
+            chunk, future = pending.popleft()
+            for next_chunk in islice(chunks, 1):
+                pending.append(submit(next_chunk))
+            
+            failure = None
+            try:
+                results = iter(future.result())
+            except Exception as e:
+                print(f"❌ Error scoring batch chunk: {str(e)}")
+                traceback.print_exc()
+                failure = f'Scoring failed: {e}'
+            
+            lines = []
+            for student_uid in chunk:
+                if not isinstance(student_uid, str):
+                    record = {'studentUid': student_uid, 'type': 'error', 'message': 'studentUid must be a string'}
+                elif failure:
+                    record = {'studentUid': student_uid, 'type': 'error', 'message': failure}
+                else:
+                    record = next(results)
+                errors += record.get('type') == 'error'
+                lines.append(app.json.dumps(record))
+            total += len(chunk)
+            yield '\n'.join(lines) + '\n'
+        
+        yield app.json.dumps({'type': 'summary', 'total': total, 'errors': errors}) + '\n'
+    finally:
+        # Client went away: don't score the chunks queued for it
+        for chunk, future in pending:
+            future.cancel()
+
+
+def snapshot_is_fresh(meta):
+    """True if a snapshot is recent enough to serve without reconciling"""
+    return meta is not None and time.time() - meta['createdAt'] < RECONCILE_AFTER_SECONDS
+
+
+def start_listeners(rec):
+    """Attach Firestore listeners so /api/refresh can apply deltas"""
+    try:
+        rec.start_sync()
+    except Exception as e:
+        print(f"⚠️  Firestore listeners unavailable, /api/refresh will reload everything: {e}")
+
 
-# Check if credentials file exists
-if not os.path.exists(FIREBASE_CRED):
-    print(f"❌ Error: {FIREBASE_CRED} not found!")
-    print("Please place your Firebase service account key in this directory.")
-    recommender = None
-else:
+def publish_snapshot(rec):
+    """Save rec as the current snapshot so other workers map it instead of rebuilding"""
+    if not SNAPSHOT_DIR:
+        return
     try:
-        recommender = ClubHubRecommender(FIREBASE_CRED)
-        print("✅ Recommendation system ready!")
+        version = rec.save_snapshot(SNAPSHOT_DIR)
+        print(f"💾 Published model snapshot {version}")
+    except Exception as e:
+        print(f"⚠️  Failed to publish model snapshot: {e}")
+        traceback.print_exc()
+
+
+@contextmanager
+def snapshot_build_lock():
+    """Let one worker build from Firestore while the others wait for its snapshot"""
+    if not SNAPSHOT_DIR or fcntl is None:
+        yield
+        return
+    
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(os.path.join(SNAPSHOT_DIR, '.build.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_or_build(on_progress=None):
+    """
+    Map the current model snapshot if one is published, else build from Firestore
+    
+    Starts no threads; start_background_work() attaches the listeners.
+    """
+    with snapshot_build_lock():
+        if SNAPSHOT_DIR and model_snapshot.current_version(SNAPSHOT_DIR):
+            try:
+                rec = ClubHubRecommender.from_snapshot(SNAPSHOT_DIR)
+                if rec.shard != SHARD:
+                    raise ValueError(f"snapshot is for shard {rec.shard}, not {SHARD}")
+                print(f"✅ Loaded model snapshot {rec.snapshot_version}")
+                return rec
+            except Exception as e:
+                print(f"⚠️  Failed to load model snapshot, building from Firestore: {e}")
+        
+        # Check if credentials file exists
+        if not FIRESTORE_EMULATOR and not os.path.exists(FIREBASE_CRED):
+            print(f"❌ Error: {FIREBASE_CRED} not found!")
+            print("Please place your Firebase service account key in this directory.")
+            return None
+        
+        rec = build_recommender(on_progress=on_progress)
+        publish_snapshot(rec)
+        return rec
+
+
+def _update_warm_up(**fields):
+    with warm_up_lock:
+        warm_up_state.update(fields)
+
+
+def warm_up(start_background=True):
+    """
+    Import the model stack and load (or build) the model; runs once per process
+    
+    With start_background=False no threads are left running, so the process
+    can fork afterwards; each child then calls start_background_work().
+    """
+    global recommender
+    
+    with warm_up_lock:
+        if warm_up_state['status'] != 'pending':
+            return
+        # A model set from outside (benchmark.py) is served as is
+        warm_up_state['status'] = 'ready' if recommender else 'warming'
+    if recommender:
+        return
+    if shard_client is not None:
+        print(f"🔀 Routing to {len(shard_client)} shards: {', '.join(shard_client.urls)}")
+        _update_warm_up(status='ready', stage='routing')
+        return
+    
+    started = time.perf_counter()
+    try:
+        _update_warm_up(stage='importing')
+        import_model_modules()
+        _update_warm_up(stage='loading model')
+        model_started = time.perf_counter()
+        rec = load_or_build(on_progress=lambda stage: _update_warm_up(stage=stage))
+        startup_seconds['model_load'] = time.perf_counter() - model_started
+        if rec:
+            recommender = rec
+            _update_warm_up(status='ready', stage='done')
+            print("✅ Recommendation system ready!")
+        else:
+            _update_warm_up(status='failed', stage='done', error='No Firebase credentials')
     except Exception as e:
         print(f"❌ Failed to initialize recommender: {e}")
-        import traceback
         traceback.print_exc()
-        recommender = None
+        _update_warm_up(status='failed', error=str(e))
+    
+    startup_seconds['warm_up'] = time.perf_counter() - started
+    print("⏱️  Startup: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_seconds.items()))
+    if start_background:
+        start_background_work()
+
+
+def start_background_work():
+    """Attach Firestore listeners, and reconcile a stale snapshot in the background"""
+    global startup_reconcile_job
+    
+    rec = recommender
+    if rec is None:
+        return
+    if rec.db is not None and not rec.sync_enabled:
+        start_listeners(rec)
+    
+    # A model mapped from a stale snapshot serves right away; catch up with Firestore in the background
+    if rec.db is None and not snapshot_is_fresh(model_snapshot.read_meta(SNAPSHOT_DIR, rec.snapshot_version)):
+        startup_reconcile_job = start_refresh(full=True, reconcile=True)['jobId']
+
+
+def create_app(warm_up_mode=None):
+    """
+    The API's Flask app, with model warm-up started as warm_up_mode says
+    
+    - 'background' (default, or API_WARM_UP): warm up on a thread and return
+      at once; /health/live answers right away and model routes return 503
+      until /health/ready does.
+    - 'eager': warm up before returning.
+    - 'preload': warm up before returning, leaving no threads behind, and
+      freeze the heap for copy-on-write sharing. For servers that fork
+      workers after loading the app (gunicorn --preload, see
+      gunicorn.conf.py); each worker calls start_background_work().
+    """
+    mode = warm_up_mode or WARM_UP_MODE
+    if mode not in ('background', 'eager', 'preload'):
+        raise ValueError(f"Unknown warm-up mode {mode!r}")
+    
+    print("🚀 Starting ClubHub Recommendation API...")
+    if mode == 'background':
+        start_warm_up()
+    else:
+        warm_up(start_background=mode == 'eager')
+        if mode == 'preload':
+            # Keep the collector from touching (and so copying) the shared pages in every worker
+            gc.collect()
+            gc.freeze()
+    return app
+
+
+def start_warm_up():
+    """Run warm_up() on a thread unless it has started already"""
+    if warm_up_state['status'] == 'pending':
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+
+def pick_up_new_model():
+    """Swap in the current model snapshot if another worker published a newer one"""
+    global recommender
+    
+    version = model_snapshot.current_version(SNAPSHOT_DIR)
+    if version and (recommender is None or recommender.snapshot_version != version):
+        new_recommender = ClubHubRecommender.from_snapshot(SNAPSHOT_DIR, version)
+        old_recommender, recommender = recommender, new_recommender
+        if old_recommender:
+            old_recommender.stop_sync()
+        print(f"🔁 Switched to model snapshot {version}")
+
+
+def pick_up_new_table():
+    """Map the current recommendation table if it changed since the last check"""
+    global recommendation_table
+    
+    version = model_snapshot.current_version(TABLE_DIR)
+    if version and (recommendation_table is None or recommendation_table.version != version):
+        recommendation_table = model_snapshot.load_recommendation_table(TABLE_DIR, version)
+        print(f"🔁 Loaded recommendation table {version} ({len(recommendation_table)} students)")
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.before_request
+def warm_up_on_first_request():
+    """Start warming up when the app is served without create_app() (e.g. gunicorn api:app)"""
+    start_warm_up()
+
+
+@app.after_request
+def observe_request(response):
+    """Record the request's latency, labelled by route pattern to keep the series few"""
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_seconds.observe(
+            time.perf_counter() - started, request.method, route, str(response.status_code)
+        )
+    return response
+
+
+@app.before_request
+def pick_up_new_versions():
+    """Pick up model snapshots and recommendation tables published by other processes"""
+    global last_snapshot_check
+    
+    if shard_client or not (SNAPSHOT_DIR or TABLE_DIR):
+        return
+    if time.monotonic() - last_snapshot_check < SNAPSHOT_POLL_SECONDS:
+        return
+    if warm_up_state['status'] not in ('ready', 'failed'):
+        return
+    if not snapshot_check_lock.acquire(blocking=False):
+        return
+    
+    try:
+        last_snapshot_check = time.monotonic()
+        for directory, pick_up, name in (
+            (SNAPSHOT_DIR, pick_up_new_model, 'model snapshot'),
+            (TABLE_DIR, pick_up_new_table, 'recommendation table'),
+        ):
+            if directory:
+                try:
+                    pick_up()
+                except Exception as e:
+                    print(f"⚠️  Failed to load {name}: {e}")
+    finally:
+        snapshot_check_lock.release()
+
+
+@app.before_request
+def route_to_shards():
+    """Router mode: answer model routes from the shard nodes (see SHARD_URLS)"""
+    if shard_client is None or request.endpoint not in SHARD_ROUTES:
+        return None
+    try:
+        return SHARD_ROUTES[request.endpoint]()
+    except Exception as e:
+        print(f"❌ Error routing {request.path}: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'error': 'Shard unavailable',
+            'message': str(e)
+        }), 503
+
+
+# Shard response headers the router passes on
+FORWARDED_HEADERS = ('Content-Type', 'ETag', 'Cache-Control', 'X-Recommendation-Source')
+
+
+def _shard_path():
+    query = request.query_string.decode('latin-1')
+    return f'{request.path}?{query}' if query else request.path
+
+
+def _shard_response(result):
+    """A shard's (status, headers, body) as a Flask response; 503 if it failed"""
+    if isinstance(result, Exception):
+        return jsonify({
+            'error': 'Shard unavailable',
+            'message': str(result)
+        }), 503
+    status, headers, body = result
+    return app.response_class(
+        body, status=status, headers={name: headers[name] for name in FORWARDED_HEADERS if name in headers}
+    )
+
+
+def _forward(shard):
+    """Send the current request to one shard unchanged"""
+    headers = {'Content-Type': request.content_type} if request.content_type else {}
+    if 'If-None-Match' in request.headers:
+        headers['If-None-Match'] = request.headers['If-None-Match']
+    return shard_client.request(shard, request.method, _shard_path(), request.get_data(), headers)
+
+
+def _broadcast():
+    """Send the current request to every shard; one result per shard"""
+    headers = {'Content-Type': request.content_type} if request.content_type else {}
+    return shard_client.request_all([
+        (shard, request.method, _shard_path(), request.get_data(), headers)
+        for shard in range(len(shard_client))
+    ])
+
+
+def _shard_json(results):
+    """Decoded bodies of the shards' results, or the first failure as a response"""
+    for result in results:
+        if isinstance(result, Exception) or result[0] >= 300:
+            return None, _shard_response(result)
+    return [json.loads(body) for status, headers, body in results], None
+
+
+def _route_to_owner():
+    """Single-student routes go to the shard that owns the student"""
+    return _shard_response(_forward(shard_client.shard_of(request.view_args['student_uid'])))
+
+
+def _route_to_any():
+    """Event-only routes can use any shard; the same URL always goes to the same one, for its cache"""
+    return _shard_response(_forward(shard_of(_shard_path(), len(shard_client))))
+
+
+def _split_batch(max_students):
+    """(student_uids, top_n) of a batch body the router can split, else None"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('student_uids'), list):
+        return None
+    if len(data['student_uids']) > max_students or not isinstance(data.get('top_n', 5), int):
+        return None
+    return data['student_uids'], data.get('top_n', 5)
+
+
+def _route_batch():
+    """Batch routes: each shard scores its own students, merged back into request order"""
+    batch = _split_batch(MAX_BATCH_STUDENTS)
+    if batch is None:
+        # Let a shard answer with the validation error
+        return _shard_response(_forward(0))
+    student_uids, top_n = batch
+    
+    merged = [None] * len(student_uids)
+    groups = {}
+    for position, student_uid in enumerate(student_uids):
+        if isinstance(student_uid, str):
+            groups.setdefault(shard_client.shard_of(student_uid), []).append(position)
+        else:
+            merged[position] = batch_error(student_uid, 'studentUid must be a string')
+    results = shard_client.request_all([
+        (shard, 'POST', '/api/recommendations/batch',
+         json.dumps({'student_uids': [student_uids[i] for i in positions], 'top_n': top_n}),
+         {'Content-Type': 'application/json'})
+        for shard, positions in groups.items()
+    ])
+    bodies, failure = _shard_json(results)
+    if failure:
+        return failure
+    
+    for positions, body in zip(groups.values(), bodies):
+        for position, result in zip(positions, body['recommendations']):
+            merged[position] = result
+    return jsonify({
+        'total': len(merged),
+        'recommendations': merged
+    }), 200
+
+
+def _route_batch_stream():
+    """
+    Streamed batches: one stream per shard, interleaved back into request order
+    
+    Lines are read from each shard's stream as the merge reaches its
+    students, so the router holds a few lines, not the batch. A shard that
+    fails gives error records for the rest of its students.
+    """
+    batch = _split_batch(MAX_STREAM_STUDENTS)
+    if batch is None:
+        return _shard_response(_forward(0))
+    student_uids, top_n = batch
+    
+    owners = [shard_client.shard_of(uid) if isinstance(uid, str) else None for uid in student_uids]
+    groups = {}
+    for student_uid, owner in zip(student_uids, owners):
+        if owner is not None:
+            groups.setdefault(owner, []).append(student_uid)
+    streams, failures = {}, {}
+    for shard, uids in groups.items():
+        try:
+            streams[shard] = shard_client.stream_lines(
+                shard, '/api/recommendations/batch/stream', {'student_uids': uids, 'top_n': top_n}
+            )
+        except Exception as e:
+            failures[shard] = f'Shard unavailable: {e}'
+    
+    def merge():
+        total = errors = 0
+        lines = []
+        try:
+            for student_uid, owner in zip(student_uids, owners):
+                if owner is None:
+                    record = {'studentUid': student_uid, 'type': 'error', 'message': 'studentUid must be a string'}
+                elif owner in failures:
+                    record = {'studentUid': student_uid, 'type': 'error', 'message': failures[owner]}
+                else:
+                    try:
+                        record = json.loads(next(streams[owner]))
+                    except Exception as e:
+                        failures[owner] = f'Shard unavailable: {str(e) or "stream ended early"}'
+                        record = {'studentUid': student_uid, 'type': 'error', 'message': failures[owner]}
+                total += 1
+                errors += record.get('type') == 'error'
+                lines.append(app.json.dumps(record))
+                if len(lines) >= STREAM_LINES_PER_WRITE:
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+            lines.append(app.json.dumps({'type': 'summary', 'total': total, 'errors': errors}))
+            yield '\n'.join(lines) + '\n'
+        finally:
+            for stream in streams.values():
+                stream.close()
+    
+    response = app.response_class(merge(), mimetype='application/x-ndjson')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _route_registration():
+    """
+    Registration changes go to every shard: the owner updates the student, all update popularity
+    
+    The owner (shard 0 for cancellations) goes first, so a change it
+    rejects (e.g. an unknown student) reaches no other shard.
+    """
+    data = request.get_json(silent=True)
+    student_uid = data.get('studentUid') if isinstance(data, dict) else None
+    owner = shard_client.shard_of(student_uid) if isinstance(student_uid, str) else 0
+    first = _forward(owner)
+    if first[0] != 200:
+        return _shard_response(first)
+    
+    headers = {'Content-Type': request.content_type} if request.content_type else {}
+    results = [first] + shard_client.request_all([
+        (shard, request.method, _shard_path(), request.get_data(), headers)
+        for shard in range(len(shard_client)) if shard != owner
+    ])
+    bodies, failure = _shard_json(results)
+    if failure:
+        return failure
+    response = {
+        'registrationId': bodies[0]['registrationId'],
+        'updatedStudents': sorted({uid for body in bodies for uid in body['updatedStudents']})
+    }
+    if 'message' in bodies[0]:
+        response['message'] = bodies[0]['message']
+    return jsonify(response), 200
+
+
+def _route_refresh():
+    """Refreshes start on every shard; poll each job at /api/refresh/<job_id>"""
+    results = _broadcast()
+    return jsonify({
+        'jobs': [
+            json.loads(result[2]) if not isinstance(result, Exception) else {'error': str(result)}
+            for result in results
+        ]
+    }), 202
+
+
+def _route_refresh_status():
+    """A refresh job lives on one shard; ask them all"""
+    results = _broadcast()
+    for result in results:
+        if not isinstance(result, Exception) and result[0] == 200:
+            return _shard_response(result)
+    return _shard_response(results[0])
+
+
+def _route_stats():
+    """Students are summed over the shards; everything else is replicated"""
+    bodies, failure = _shard_json(_broadcast())
+    if failure:
+        return failure
+    stats = dict(bodies[0])
+    stats['total_students'] = sum(body['total_students'] for body in bodies)
+    stats['shards'] = len(bodies)
+    return jsonify(stats), 200
+
+
+def _route_health():
+    """Ready when every shard is"""
+    shards = []
+    for url, result in zip(shard_client.urls, shard_client.request_all([
+        (shard, 'GET', '/health/ready', None, None) for shard in range(len(shard_client))
+    ])):
+        if isinstance(result, Exception):
+            shards.append({'url': url, 'status': 'unreachable', 'error': str(result)})
+        else:
+            shards.append(dict(json.loads(result[2]), url=url))
+    ready = all(shard['status'] == 'ready' for shard in shards)
+    return jsonify({
+        'status': 'ready' if ready else 'not ready',
+        'shards': shards
+    }), 200 if ready else 503
+
+
+# Streamed lines the router buffers per write
+STREAM_LINES_PER_WRITE = 64
+
+# View functions the router replaces, by endpoint name
+SHARD_ROUTES = {
+    'get_recommendations': _route_to_owner,
+    'get_club_recommendations': _route_to_owner,
+    'get_batch_recommendations': _route_batch,
+    'stream_batch_recommendations': _route_batch_stream,
+    'get_similar_events': _route_to_any,
+    'get_trending': _route_to_any,
+    'ingest_registration': _route_registration,
+    'refresh_data': _route_refresh,
+    'refresh_status': _route_refresh_status,
+    'get_stats': _route_stats,
+    'health_check': _route_health,
+    'readiness_check': _route_health,
+}
 
 
 @app.route('/', methods=['GET'])
@@ -41,10 +746,19 @@ def home():
         'status': 'running',
         'endpoints': {
             'health': '/health',
+            'liveness': '/health/live',
+            'readiness': '/health/ready',
             'recommendations': '/api/recommendations/<student_uid>',
+            'club_recommendations': '/api/recommendations/<student_uid>/clubs',
             'batch': '/api/recommendations/batch',
+            'batch_stream': '/api/recommendations/batch/stream',
+            'similar_events': '/api/events/<event_id>/similar',
+            'registration': '/api/events/registration',
+            'trending': '/api/trending',
             'refresh': '/api/refresh',
-            'stats': '/api/stats'
+            'refresh_status': '/api/refresh/<job_id>',
+            'stats': '/api/stats',
+            'metrics': '/metrics'
         }
     }), 200
 
@@ -52,10 +766,40 @@ def home():
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    response = {
         'status': 'healthy' if recommender else 'unhealthy',
         'message': 'Recommendation API is running' if recommender else 'Recommender not initialized'
-    }), 200 if recommender else 503
+    }
+    if recommender and recommender.snapshot_version:
+        response['snapshot_version'] = recommender.snapshot_version
+    if startup_reconcile_job:
+        # Poll /api/refresh/<job_id> for the reconcile that follows a snapshot cold start
+        response['reconcile_job'] = startup_reconcile_job
+    return jsonify(response), 200 if recommender else 503
+
+
+@app.route('/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness: the process is up and serving, whether or not the model is loaded"""
+    return jsonify({
+        'status': 'alive',
+        'uptime_seconds': round(time.perf_counter() - api_import_started, 3)
+    }), 200
+
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: a model is loaded and recommendations can be served"""
+    with warm_up_lock:
+        response = dict(warm_up_state)
+    rec = recommender
+    response['status'] = 'ready' if rec else response['status']
+    response['startup_seconds'] = {phase: round(seconds, 3) for phase, seconds in startup_seconds.items()}
+    if rec and rec.snapshot_version:
+        response['snapshot_version'] = rec.snapshot_version
+    if startup_reconcile_job:
+        response['reconcile_job'] = startup_reconcile_job
+    return jsonify(response), 200 if rec else 503
 
 
 @app.route('/api/recommendations/<student_uid>', methods=['GET'])
@@ -66,6 +810,9 @@ def get_recommendations(student_uid):
     Query parameters:
         - top_n: Number of recommendations (default: 5, max: 20)
     
+    Responses carry an ETag; send it back in If-None-Match to get a 304
+    while the recommendations haven't changed.
+    
     Example: GET /api/recommendations/abc123?top_n=10
     """
     if not recommender:
@@ -85,15 +832,38 @@ def get_recommendations(student_uid):
                 'message': 'top_n must be between 1 and 20'
             }), 400
         
-        # Get recommendations
-        recommendations = recommender.recommend(student_uid, top_n=top_n)
-        
-        # Check for errors
-        if recommendations.get('type') == 'error':
-            return jsonify(recommendations), 404
+        # Cached responses are dropped when the model, the student's
+        # registrations, the started events or the precomputed table change
+        table = recommendation_table
+        table_fresh = bool(table and table.is_fresh(TABLE_MAX_AGE_SECONDS))
+        token = (recommender.cache_token(student_uid), table.version if table_fresh else None)
+        cached = response_cache.get((student_uid, top_n), token)
         
-        return jsonify(recommendations), 200
+        if cached is None:
+            # Serve from the precomputed table when it's fresh, else compute live
+            recommendations = None
+            if table_fresh and top_n <= table.top_k:
+                recommendations = recommender.recommend_precomputed(table, student_uid, top_n=top_n)
+            source = 'precomputed' if recommendations else 'live'
+            if recommendations is None:
+                recommendations = request_coalescer.recommend(recommender, student_uid, top_n=top_n)
+            
+            # Check for errors
+            if recommendations.get('type') == 'error':
+                return jsonify(recommendations), 404
+            
+            with stage_seconds.time('api.serialize'):
+                body = jsonify(recommendations).get_data()
+            cached = (body, hashlib.sha1(body).hexdigest(), source)
+            response_cache.put((student_uid, top_n), token, cached)
         
+        body, etag, source = cached
+        response = app.response_class(body, mimetype='application/json')
+        response.headers['X-Recommendation-Source'] = source
+        response.headers['Cache-Control'] = 'no-cache'
+        response.set_etag(etag)
+        return response.make_conditional(request)
+    
     except Exception as e:
         print(f"❌ Error in get_recommendations: {str(e)}")
         traceback.print_exc()
@@ -103,6 +873,56 @@ def get_recommendations(student_uid):
         }), 500
 
 
+@app.route('/api/recommendations/<student_uid>/clubs', methods=['GET'])
+def get_club_recommendations(student_uid):
+    """
+    Get club recommendations for a student
+    
+    Clubs are ranked against the student's attended events and interests,
+    using each club's events and category. Responses are cached like
+    event recommendations.
+    
+    Query parameters:
+        - top_n: Number of clubs (default: 5, max: 20)
+    
+    Example: GET /api/recommendations/abc123/clubs?top_n=10
+    """
+    if not recommender:
+        return jsonify({
+            'error': 'Recommendation system not available',
+            'message': 'System is still initializing or failed to start'
+        }), 503
+    
+    try:
+        top_n = request.args.get('top_n', default=5, type=int)
+        if top_n < 1 or top_n > 20:
+            return jsonify({
+                'error': 'Invalid top_n parameter',
+                'message': 'top_n must be between 1 and 20'
+            }), 400
+        
+        rec = recommender
+        key = ('clubs', student_uid, top_n)
+        token = rec.cache_token(student_uid)
+        body = response_cache.get(key, token)
+        if body is None:
+            clubs = scoring_pool.submit(rec.recommend_clubs, student_uid, top_n=top_n).result()
+            if clubs.get('type') == 'error':
+                return jsonify(clubs), 404
+            body = jsonify(clubs).get_data()
+            response_cache.put(key, token, body)
+        
+        return app.response_class(body, mimetype='application/json')
+    
+    except Exception as e:
+        print(f"❌ Error in get_club_recommendations: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
+
 @app.route('/api/recommendations/batch', methods=['POST'])
 def get_batch_recommendations():
     """
@@ -119,10 +939,13 @@ def get_batch_recommendations():
         "total": 3,
         "recommendations": [
             { "studentUid": "uid1", "recommendations": [...] },
-            { "studentUid": "uid2", "recommendations": [...] },
+            { "studentUid": "uid2", "type": "error", "message": "...", "recommendations": [] },
             ...
         ]
     }
+    
+    Entries that can't be scored (e.g. a non-string uid) get a "type": "error"
+    entry instead of failing the request.
     """
     if not recommender:
         return jsonify({
@@ -145,31 +968,26 @@ def get_batch_recommendations():
                 'error': 'student_uids must be an array'
             }), 400
         
-        if len(student_uids) > 50:
+        if len(student_uids) > MAX_BATCH_STUDENTS:
             return jsonify({
-                'error': 'Maximum 50 students per batch request'
+                'error': f'Maximum {MAX_BATCH_STUDENTS} students per batch request'
             }), 400
         
-        # Get recommendations for each student
-        results = []
-        for uid in student_uids:
-            try:
-                rec = recommender.recommend(uid, top_n=top_n)
-                results.append(rec)
-            except Exception as e:
-                print(f"Error for student {uid}: {e}")
-                results.append({
-                    'studentUid': uid,
-                    'type': 'error',
-                    'message': str(e),
-                    'recommendations': []
-                })
+        if not isinstance(top_n, int):
+            return jsonify({
+                'error': 'top_n must be an integer'
+            }), 400
         
-        return jsonify({
-            'total': len(results),
-            'recommendations': results
-        }), 200
+        # Score all students together, large batches in parallel chunks
+        results = score_batch(student_uids, top_n)
         
+        with stage_seconds.time('api.serialize'):
+            response = jsonify({
+                'total': len(results),
+                'recommendations': results
+            })
+        return response, 200
+    
     except Exception as e:
         print(f"❌ Error in batch_recommendations: {str(e)}")
         traceback.print_exc()
@@ -179,35 +997,383 @@ def get_batch_recommendations():
         }), 500
 
 
-@app.route('/api/refresh', methods=['POST'])
-def refresh_data():
+@app.route('/api/recommendations/batch/stream', methods=['POST'])
+def stream_batch_recommendations():
     """
-    Refresh the recommendation system with latest data from Firestore
-    Call this endpoint after adding new events or registrations
+    Recommendations for many students, streamed as newline-delimited JSON
+    
+    Takes the same body as /api/recommendations/batch, for up to
+    MAX_STREAM_STUDENTS students. Each line is one student's result, in
+    request order, sent as soon as its chunk is scored; students that can't
+    be scored get a "type": "error" record instead of failing the request.
+    The last line is {"type": "summary", "total": ..., "errors": ...}.
     
-    Warning: This reloads all data and rebuilds the model - may take 10-30 seconds
+    Example: curl -N -X POST /api/recommendations/batch/stream -H 'Content-Type: application/json'
+             -d '{"student_uids": ["uid1", "uid2"], "top_n": 5}'
     """
-    global recommender
+    rec = recommender  # the whole stream uses one model, even if a refresh swaps it
+    if not rec:
+        return jsonify({
+            'error': 'Recommendation system not available'
+        }), 503
+    
+    data = request.get_json()
+    if not data or 'student_uids' not in data:
+        return jsonify({
+            'error': 'Missing required field: student_uids'
+        }), 400
+    
+    student_uids = data['student_uids']
+    top_n = data.get('top_n', 5)
+    
+    if not isinstance(student_uids, list):
+        return jsonify({
+            'error': 'student_uids must be an array'
+        }), 400
+    
+    if len(student_uids) > MAX_STREAM_STUDENTS:
+        return jsonify({
+            'error': f'Maximum {MAX_STREAM_STUDENTS} students per streamed batch request'
+        }), 400
+    
+    if not isinstance(top_n, int):
+        return jsonify({
+            'error': 'top_n must be an integer'
+        }), 400
+    
+    response = app.response_class(stream_batch(rec, student_uids, top_n), mimetype='application/x-ndjson')
+    # Let reverse proxies pass each chunk on as it comes
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _update_job(job_id, **fields):
+    """Update a refresh job's status record"""
+    with refresh_lock:
+        refresh_jobs[job_id].update(fields)
+
+
+def _reconcile(job_id):
+    """
+    Replace a snapshot-loaded model with one built from Firestore
+    
+    Runs under the build lock, so when several workers cold-start from the same
+    stale snapshot only the first rebuilds; the rest map the snapshot it publishes.
+    """
+    with snapshot_build_lock():
+        meta = model_snapshot.read_meta(SNAPSHOT_DIR) if SNAPSHOT_DIR else None
+        if snapshot_is_fresh(meta):
+            if meta['version'] == recommender.snapshot_version:
+                return recommender
+            _update_job(job_id, stage='loading snapshot')
+            return ClubHubRecommender.from_snapshot(SNAPSHOT_DIR, meta['version'])
+        
+        new_recommender = build_recommender(on_progress=lambda stage: _update_job(job_id, stage=stage))
+        start_listeners(new_recommender)
+        _update_job(job_id, stage='publishing snapshot')
+        publish_snapshot(new_recommender)
+        return new_recommender
+
+
+def _run_refresh(job_id, full, reconcile=False):
+    """Background worker: sync or rebuild, then swap the new model in"""
+    global recommender, active_refresh_job
     
     try:
-        print("🔄 Refreshing recommendation system...")
-        recommender = ClubHubRecommender(FIREBASE_CRED)
-        print("✅ Refresh complete!")
+        import_model_modules()
+        if reconcile:
+            print("🔄 Reconciling model snapshot with Firestore...")
+            _update_job(job_id, status='running', stage='connecting')
+            new_recommender = _reconcile(job_id)
+            if new_recommender is not recommender:
+                old_recommender, recommender = recommender, new_recommender
+                if old_recommender:
+                    old_recommender.stop_sync()
+            print("✅ Reconcile complete!")
         
-        return jsonify({
-            'status': 'success',
-            'message': 'Recommendation system refreshed successfully'
-        }), 200
+        elif recommender and recommender.sync_enabled and not full:
+            print("🔄 Applying Firestore changes...")
+            _update_job(job_id, status='running', stage='syncing')
+            # Built on a copy; requests keep using the current model until the assignment
+            new_recommender, changes = recommender.sync()
+            recommender = new_recommender
+            print(f"✅ Sync complete: {changes}")
+            _update_job(job_id, changes=changes)
+            if any(count for name, count in changes.items() if name != 'refit'):
+                _update_job(job_id, stage='publishing snapshot')
+                publish_snapshot(new_recommender)
+        else:
+            print("🔄 Refreshing recommendation system...")
+            _update_job(job_id, status='running', mode='full', stage='connecting')
+            new_recommender = build_recommender(on_progress=lambda stage: _update_job(job_id, stage=stage))
+            start_listeners(new_recommender)
+            _update_job(job_id, stage='publishing snapshot')
+            publish_snapshot(new_recommender)
+            
+            # Requests keep using the old model until this single assignment
+            old_recommender, recommender = recommender, new_recommender
+            if old_recommender:
+                old_recommender.stop_sync()
+            print("✅ Refresh complete!")
         
+        _update_job(job_id, status='done', stage='done', finishedAt=time.time())
+    
     except Exception as e:
         print(f"❌ Error refreshing: {str(e)}")
         traceback.print_exc()
+        _update_job(job_id, status='failed', error=str(e), finishedAt=time.time())
+    
+    finally:
+        with refresh_lock:
+            active_refresh_job = None
+
+
+@app.route('/api/events/<event_id>/similar', methods=['GET'])
+def get_similar_events(event_id):
+    """
+    Get the events most similar to an event ("more like this")
+    
+    Query parameters:
+        - top_n: Number of similar events (default: 5, max: 20)
+        - upcoming_only: Only return upcoming events (default: true)
+    
+    Example: GET /api/events/event123/similar?top_n=10&upcoming_only=false
+    """
+    if not recommender:
+        return jsonify({
+            'error': 'Recommendation system not available',
+            'message': 'System is still initializing or failed to start'
+        }), 503
+    
+    try:
+        top_n = request.args.get('top_n', default=5, type=int)
+        if top_n < 1 or top_n > 20:
+            return jsonify({
+                'error': 'Invalid top_n parameter',
+                'message': 'top_n must be between 1 and 20'
+            }), 400
+        upcoming_only = request.args.get('upcoming_only', 'true').lower() != 'false'
+        
+        similar = recommender.similar_events(event_id, top_n=top_n, upcoming_only=upcoming_only)
+        if similar.get('type') == 'error':
+            return jsonify(similar), 404
+        
+        return jsonify(similar)
+    
+    except Exception as e:
+        print(f"❌ Error in get_similar_events: {str(e)}")
+        traceback.print_exc()
         return jsonify({
-            'error': 'Failed to refresh system',
+            'error': 'Internal server error',
             'message': str(e)
         }), 500
 
 
+@app.route('/api/trending', methods=['GET'])
+def get_trending():
+    """
+    Events and clubs with the most recent registrations
+    
+    Ranked by registration counts that halve every TRENDING_HALF_LIFE_DAYS,
+    kept up to date as registrations arrive. Responses are cached until the
+    counts change or an event starts.
+    
+    Query parameters:
+        - top_n: Number of events and of clubs (default: 10, max: 50)
+        - upcoming_only: Only return upcoming events (default: true)
+    
+    Example: GET /api/trending?top_n=5
+    """
+    if not recommender:
+        return jsonify({
+            'error': 'Recommendation system not available',
+            'message': 'System is still initializing or failed to start'
+        }), 503
+    
+    try:
+        top_n = request.args.get('top_n', default=10, type=int)
+        if top_n < 1 or top_n > 50:
+            return jsonify({
+                'error': 'Invalid top_n parameter',
+                'message': 'top_n must be between 1 and 50'
+            }), 400
+        upcoming_only = request.args.get('upcoming_only', 'true').lower() != 'false'
+        
+        rec = recommender
+        key = ('trending', top_n, upcoming_only)
+        token = rec.trending_token()
+        body = response_cache.get(key, token)
+        if body is None:
+            body = jsonify({
+                'halfLifeDays': rec.trending.half_life / 86400,
+                'events': rec.trending_events(top_n=top_n, upcoming_only=upcoming_only),
+                'clubs': rec.trending_clubs(top_n=top_n)
+            }).get_data()
+            response_cache.put(key, token, body)
+        
+        return app.response_class(body, mimetype='application/json')
+    
+    except Exception as e:
+        print(f"❌ Error in get_trending: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/events/registration', methods=['POST'])
+def ingest_registration():
+    """
+    Apply a registration change right away, without /api/refresh
+    
+    Call this after a student registers for, attends or cancels an event.
+    Only that student's cached recommendations are invalidated. Unknown
+    students and events get 404 (on a shard, students of other shards only
+    count towards popularity). With MODEL_SNAPSHOT_DIR, only the worker
+    that receives the call is updated; the others see the change once a
+    refresh publishes a new snapshot.
+    
+    Request body:
+    {
+        "registrationId": "reg123",
+        "studentUid": "uid1",
+        "eventId": "event123",
+        "attended": false
+    }
+    
+    Send {"registrationId": "reg123", "removed": true} for a cancellation.
+    """
+    if not recommender:
+        return jsonify({
+            'error': 'Recommendation system not available'
+        }), 503
+    
+    try:
+        data = request.get_json(silent=True)
+        
+        if not data or not isinstance(data.get('registrationId'), str):
+            return jsonify({
+                'error': 'Missing required field: registrationId'
+            }), 400
+        
+        record = None
+        if not data.get('removed', False):
+            if not isinstance(data.get('studentUid'), str) or not isinstance(data.get('eventId'), str):
+                return jsonify({
+                    'error': 'studentUid and eventId must be strings'
+                }), 400
+            if not isinstance(data.get('attended', False), bool):
+                return jsonify({
+                    'error': 'attended must be a boolean'
+                }), 400
+            if recommender.owns_student(data['studentUid']) and data['studentUid'] not in recommender.student_index:
+                return jsonify({
+                    'error': 'Student not found',
+                    'message': f"No student with uid {data['studentUid']}"
+                }), 404
+            if data['eventId'] not in recommender.event_index:
+                return jsonify({
+                    'error': 'Event not found',
+                    'message': f"No event with id {data['eventId']}"
+                }), 404
+            record = {field: data[field] for field in ('studentUid', 'eventId', 'attended') if field in data}
+        
+        affected = recommender.apply_registration(data['registrationId'], record)
+        response = {
+            'registrationId': data['registrationId'],
+            'updatedStudents': sorted(affected)
+        }
+        if SNAPSHOT_DIR:
+            response['message'] = (
+                'Applied to this worker only; workers sharing the model snapshot '
+                'see it after the next refresh'
+            )
+        return jsonify(response), 200
+    
+    except Exception as e:
+        print(f"❌ Error in ingest_registration: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/refresh', methods=['POST'])
+def refresh_data():
+    """
+    Refresh the recommendation system with latest data from Firestore
+    Call this endpoint after adding new events or registrations
+    
+    Query parameters:
+        - full: Reload everything instead of applying changed documents (default: false)
+    
+    The refresh runs in the background and the current model keeps serving
+    until the new one is ready. Returns a job id to poll at
+    /api/refresh/<job_id>. A refresh requested while another one is running
+    joins the running job.
+    
+    By default only documents changed since the last load/refresh are applied.
+    Warning: A full refresh reloads all data and rebuilds the model - may take 10-30 seconds
+    """
+    full = request.args.get('full', 'false').lower() == 'true'
+    return jsonify(start_refresh(full)), 202
+
+
+def start_refresh(full, reconcile=False):
+    """Start a background refresh job, or join the running one; returns the job record"""
+    global active_refresh_job
+    
+    with refresh_lock:
+        if active_refresh_job:
+            return dict(refresh_jobs[active_refresh_job], coalesced=True)
+        
+        if reconcile:
+            mode = 'reconcile'
+        elif full or not (recommender and recommender.sync_enabled):
+            mode = 'full'
+        else:
+            mode = 'delta'
+        
+        job_id = uuid.uuid4().hex
+        refresh_jobs[job_id] = {
+            'jobId': job_id,
+            'mode': mode,
+            'status': 'queued',
+            'stage': 'queued',
+            'startedAt': time.time(),
+            'finishedAt': None,
+            'error': None
+        }
+        active_refresh_job = job_id
+        
+        # Keep only the most recent jobs
+        while len(refresh_jobs) > MAX_REFRESH_JOBS:
+            refresh_jobs.pop(next(iter(refresh_jobs)))
+        
+        job = dict(refresh_jobs[job_id], coalesced=False)
+    
+    threading.Thread(target=_run_refresh, args=(job_id, full, reconcile), daemon=True).start()
+    return job
+
+
+@app.route('/api/refresh/<job_id>', methods=['GET'])
+def refresh_status(job_id):
+    """Get the status and progress of a refresh job"""
+    with refresh_lock:
+        job = refresh_jobs.get(job_id)
+        job = dict(job) if job else None
+    
+    if not job:
+        return jsonify({
+            'error': 'Refresh job not found',
+            'message': f'No refresh job with id {job_id}'
+        }), 404
+    
+    return jsonify(job), 200
+
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get system statistics"""
@@ -217,18 +1383,12 @@ def get_stats():
         }), 503
     
     try:
-        stats = {
-            'total_students': len(recommender.students_df),
-            'total_events': len(recommender.events_df),
-            'total_clubs': len(recommender.clubs_df),
-            'total_registrations': len(recommender.registrations_df),
-            'upcoming_events': len(recommender.events_df[
-                recommender.events_df['eventId'].apply(recommender._is_upcoming)
-            ])
-        }
+        stats = recommender.get_stats()
+        stats['response_cache'] = response_cache.stats()
+        stats['coalesced_requests'] = request_coalescer.stats()
         
         return jsonify(stats), 200
-        
+    
     except Exception as e:
         print(f"❌ Error getting stats: {str(e)}")
         return jsonify({
@@ -237,6 +1397,63 @@ def get_stats():
         }), 500
 
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus text-format metrics
+    
+    Stage and request latency histograms, model build time and age, row
+    counts and response cache hit rates.
+    """
+    lines = stage_seconds.render() + request_seconds.render()
+    lines += metrics.render_values(
+        'clubhub_model_ready', 'Whether a model is loaded', 'gauge', int(recommender is not None)
+    )
+    lines += metrics.render_values(
+        'clubhub_startup_seconds', 'Time each startup phase took', 'gauge',
+        {(phase,): seconds for phase, seconds in startup_seconds.items()}, ('phase',)
+    )
+    
+    if recommender:
+        lines += metrics.render_values(
+            'clubhub_model_build_seconds', 'Time it took to build or map the current model',
+            'gauge', recommender.build_seconds
+        )
+        if recommender.built_at is not None:
+            lines += metrics.render_values(
+                'clubhub_model_age_seconds', 'Seconds since the current model read its data',
+                'gauge', time.time() - recommender.built_at
+            )
+        lines += metrics.render_values(
+            'clubhub_vocabulary_drift', 'Share of the TF-IDF vocabulary a refit would change',
+            'gauge', recommender.vocabulary_drift
+        )
+        stats = recommender.get_stats()
+        lines += metrics.render_values(
+            'clubhub_model_rows', 'Rows in the current model', 'gauge',
+            {(name.replace('total_', ''),): value for name, value in stats.items()},
+            ('collection',)
+        )
+    
+    cache = response_cache.stats()
+    lookups = cache['hits'] + cache['misses']
+    lines += metrics.render_values(
+        'clubhub_response_cache_hits_total', 'Response cache hits', 'counter', cache['hits']
+    )
+    lines += metrics.render_values(
+        'clubhub_response_cache_misses_total', 'Response cache misses', 'counter', cache['misses']
+    )
+    lines += metrics.render_values(
+        'clubhub_response_cache_entries', 'Responses in the cache', 'gauge', cache['entries']
+    )
+    lines += metrics.render_values(
+        'clubhub_response_cache_hit_ratio', 'Share of lookups answered from the cache',
+        'gauge', cache['hits'] / lookups if lookups else None
+    )
+    
+    return app.response_class('\n'.join(lines) + '\n', content_type=metrics.CONTENT_TYPE)
+
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -253,16 +1470,22 @@ def internal_error(error):
     }), 500
 
 
+startup_seconds['api_import'] = time.perf_counter() - api_import_started
+
+
 if __name__ == '__main__':
+    PORT = int(os.getenv('PORT', '5000'))
+    create_app()
+    
     # For development
     print("\n" + "="*60)
     print("🚀 ClubHub Recommendation API")
     print("="*60)
-    print("📍 Local: http://localhost:5000")
-    print("📍 Network: http://0.0.0.0:5000")
+    print(f"📍 Local: http://localhost:{PORT}")
+    print(f"📍 Network: http://0.0.0.0:{PORT}")
     print("="*60 + "\n")
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(debug=True, host='0.0.0.0', port=PORT)
     
     # For production, use gunicorn:
-    # gunicorn -w 4 -b 0.0.0.0:5000 api:app
\ No newline at end of file
+    # gunicorn -c gunicorn.conf.py 'api:create_app()'
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+asgi.py
+ASGI entry point for the recommendation API
+
+Serves the Flask app from api.py unchanged (same routes, hooks and CORS
+headers), but each request runs on a thread pool instead of holding the
+server's event loop. Scoring itself is bounded by api.scoring_pool, so the
+request threads mostly wait: many requests can be in flight at once, which
+lets concurrent single-student requests be coalesced into batch scoring.
+Other routes (health, stats, metrics, refresh) run on a separate pool, so
+they answer promptly while scoring is backed up. Streamed responses
+(/api/recommendations/batch/stream) are sent on as each chunk is produced.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+Each worker starts warming up its model on import (see api.create_app).
+"""
+
+from api import create_app
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import io
+import os
+import sys
+
+# Scoring requests in flight per process; the rest queue for a free thread
+REQUEST_THREADS = int(os.getenv('ASGI_REQUEST_THREADS', '64'))
+# Threads for every other route
+CONTROL_THREADS = int(os.getenv('ASGI_CONTROL_THREADS', '4'))
+
+# Path prefixes of the routes that score recommendations
+SCORING_PATHS = ('/api/recommendations/', '/api/events/')
+
+request_executor = ThreadPoolExecutor(max_workers=REQUEST_THREADS, thread_name_prefix='asgi-request')
+control_executor = ThreadPoolExecutor(max_workers=CONTROL_THREADS, thread_name_prefix='asgi-control')
+
+flask_app = create_app()
+
+
+def _wsgi_environ(scope, body):
+    """PEP 3333 environ for an ASGI http scope"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server_name),
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _call_flask(environ):
+    """
+    Run the WSGI app; returns (status code, headers, body, rest of the body)
+    
+    Responses with a Content-Length are read whole and rest is None. For
+    streamed responses (no Content-Length), rest is the WSGI iterable of the
+    chunks still to send.
+    """
+    response = {}
+    
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [
+            (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+        ]
+        return chunks.append
+    
+    chunks = []
+    result = flask_app(environ, start_response)
+    if not any(name == b'content-length' for name, value in response['headers']):
+        return response['status'], response['headers'], b''.join(chunks), result
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks), None
+
+
+async def _send_stream(send, executor, content, result):
+    """Send a streamed body chunk by chunk, pulling each one from result on executor"""
+    loop = asyncio.get_running_loop()
+    rest = iter(result)
+    try:
+        if content:
+            await send({'type': 'http.response.body', 'body': content, 'more_body': True})
+        while True:
+            chunk = await loop.run_in_executor(executor, next, rest, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            await loop.run_in_executor(executor, result.close)
+
+
+async def _read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body.extend(message.get('body', b''))
+        if not message.get('more_body', False):
+            return bytes(body)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            request_executor.shutdown(wait=False)
+            control_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    
+    body = await _read_body(receive)
+    if body is None:
+        return
+    
+    executor = request_executor if scope['path'].startswith(SCORING_PATHS) else control_executor
+    status, headers, content, rest = await asyncio.get_running_loop().run_in_executor(
+        executor, _call_flask, _wsgi_environ(scope, body)
+    )
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    if rest is None:
+        await send({'type': 'http.response.body', 'body': content})
+    else:
+        await _send_stream(send, executor, content, rest)
@@ -0,0 +1,494 @@
+"""
+benchmark.py
+Latency benchmarks for the recommender and API against a synthetic Firestore
+
+No Firebase project is needed: synthetic students, clubs, events and
+registrations are served by an in-memory fake of the Firestore client.
+
+Usage:
+    python benchmark.py --scale small
+    python benchmark.py --scale medium --output results/medium.json
+    python benchmark.py --scale medium --compare results/medium.json
+"""
+
+from bisect import bisect_right
+from clubhub_recommender import ClubHubRecommender
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+import argparse
+import asyncio
+import io
+import json
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+
+# Synthetic catalog sizes; any field can be overridden on the command line
+SCALES = {
+    'small': {'events': 1000, 'students': 10000, 'clubs': 50, 'registrations_per_student': 5},
+    'medium': {'events': 10000, 'students': 100000, 'clubs': 200, 'registrations_per_student': 10},
+    'large': {'events': 100000, 'students': 100000, 'clubs': 1000, 'registrations_per_student': 10},
+}
+
+# Words per interest, so interest matching has something to find
+INTEREST_WORDS = {
+    'Technology & Programming': ['programming', 'hackathon', 'python', 'web', 'robot', 'ai', 'app'],
+    'Sports & Fitness': ['football', 'cricket', 'badminton', 'tournament', 'fitness', 'marathon'],
+    'Arts & Culture': ['drama', 'theater', 'festival', 'painting', 'exhibition', 'cultural'],
+    'Music & Dance': ['music', 'band', 'concert', 'singing', 'dance', 'acoustic'],
+    'Photography': ['photography', 'camera', 'portrait', 'landscape', 'shoot', 'editing'],
+    'Social Service': ['volunteer', 'community', 'blood', 'donation', 'charity', 'teaching'],
+    'Debate & Public Speaking': ['debate', 'speech', 'mun', 'parliamentary', 'diplomacy'],
+    'Academic Research': ['research', 'paper', 'thesis', 'journal', 'seminar', 'conference'],
+    'Entrepreneurship': ['startup', 'pitch', 'business', 'marketing', 'finance', 'innovation'],
+    'Environment': ['green', 'climate', 'plantation', 'conservation', 'waste', 'nature'],
+}
+FILLER_WORDS = [
+    'annual', 'campus', 'students', 'session', 'open', 'join', 'learn', 'meet', 'night',
+    'week', 'grand', 'final', 'round', 'club', 'special', 'guest', 'talk', 'hands-on',
+]
+
+
+class FakeDocument:
+    """A document snapshot: id, to_dict() and update_time"""
+    
+    def __init__(self, doc_id, data, update_time):
+        self.id = doc_id
+        self._data = data
+        self.update_time = update_time
+    
+    def to_dict(self):
+        return dict(self._data)
+
+
+class _FakeWatch:
+    def unsubscribe(self):
+        pass
+
+
+class FakeQuery:
+    """
+    The slice of the Firestore query API the recommender uses
+    
+    Documents are kept sorted by id, so order_by('__name__') is a no-op and
+    start_after is a binary search.
+    """
+    
+    def __init__(self, ids, docs, update_time, fields=None, limit=None, offset=0):
+        self._ids = ids
+        self._docs = docs
+        self._update_time = update_time
+        self._fields = fields
+        self._limit = limit
+        self._offset = offset
+    
+    def _replace(self, **changes):
+        state = {'fields': self._fields, 'limit': self._limit, 'offset': self._offset}
+        state.update(changes)
+        return FakeQuery(self._ids, self._docs, self._update_time, **state)
+    
+    def select(self, fields):
+        return self._replace(fields=list(fields))
+    
+    def order_by(self, field):
+        return self
+    
+    def limit(self, count):
+        return self._replace(limit=count)
+    
+    def start_after(self, doc):
+        return self._replace(offset=bisect_right(self._ids, doc.id))
+    
+    def stream(self):
+        end = len(self._ids) if self._limit is None else min(len(self._ids), self._offset + self._limit)
+        for pos in range(self._offset, end):
+            data = self._docs[pos]
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            yield FakeDocument(self._ids[pos], data, self._update_time)
+    
+    def on_snapshot(self, callback):
+        # The data never changes, so there is nothing to report
+        return _FakeWatch()
+
+
+class FakeFirestore:
+    """In-memory stand-in for a Firestore client: {collection: [(doc_id, data)]}"""
+    
+    def __init__(self, collections):
+        self.update_time = datetime.now(timezone.utc)
+        self._collections = {}
+        for name, docs in collections.items():
+            docs = sorted(docs, key=lambda doc: doc[0])
+            self._collections[name] = ([doc_id for doc_id, _ in docs], [data for _, data in docs])
+    
+    def collection(self, name):
+        ids, docs = self._collections.get(name, ([], []))
+        return FakeQuery(ids, docs, self.update_time)
+
+
+def make_dataset(events, students, clubs, registrations_per_student, seed=0):
+    """
+    Synthetic collections shaped like the app's Firestore data
+    
+    Event dates spread over 90 days either side of now; registrations favour
+    popular events, and past events are mostly attended.
+    """
+    rng = np.random.default_rng(seed)
+    interests = list(INTEREST_WORDS)
+    now = datetime.now(timezone.utc)
+    
+    club_docs = []
+    for i in range(clubs):
+        interest = interests[i % len(interests)]
+        club_docs.append((f'club{i:06d}', {
+            'clubName': f'{interest.split()[0]} Club {i}',
+            'clubCategory': interest.split(' & ')[0],
+        }))
+    
+    event_docs = []
+    event_starts = []
+    for i in range(events):
+        interest = interests[rng.integers(len(interests))]
+        topic = list(rng.choice(INTEREST_WORDS[interest], size=3))
+        words = topic + list(rng.choice(FILLER_WORDS, size=rng.integers(5, 40)))
+        rng.shuffle(words)
+        start = now + timedelta(days=float(rng.uniform(-90, 90)))
+        event_starts.append(start)
+        event_docs.append((f'event{i:07d}', {
+            'eventName': ' '.join(topic).title(),
+            'eventDescription': ' '.join(words),
+            'clubId': club_docs[rng.integers(clubs)][0] if clubs else None,
+            'eventDate': start,
+            'isCompleted': bool(start < now and rng.random() < 0.8),
+        }))
+    
+    student_docs = []
+    for i in range(students):
+        chosen = rng.choice(interests, size=rng.integers(0, 4), replace=False)
+        student_docs.append((f'student{i:07d}', {
+            'fullName': f'Student {i}',
+            'fieldOfInterest': [str(interest) for interest in chosen],
+        }))
+    
+    registration_docs = []
+    if events and students:
+        # Zipf-like popularity
+        weights = 1.0 / np.arange(1, events + 1) ** 0.8
+        picks = rng.choice(events, size=students * registrations_per_student, p=weights / weights.sum())
+        attended = rng.random(len(picks)) < 0.7
+        registered_days = rng.uniform(0, 30, len(picks))
+        for i, event_pos in enumerate(picks):
+            registration_docs.append((f'reg{i:09d}', {
+                'studentUid': student_docs[i // registrations_per_student][0],
+                'eventId': event_docs[event_pos][0],
+                'attended': bool(attended[i] and event_starts[event_pos] < now),
+                'registeredAt': min(event_starts[event_pos], now) - timedelta(days=float(registered_days[i])),
+            }))
+    
+    return {
+        'students': student_docs,
+        'clubs': club_docs,
+        'events': event_docs,
+        'event_registrations': registration_docs,
+    }
+
+
+def latency_summary(samples):
+    """mean/p50/p95/p99/max in milliseconds for a list of durations in seconds"""
+    if not samples:
+        return {'n': 0}
+    ms = np.array(samples) * 1000
+    return {
+        'n': len(samples),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+
+
+def time_calls(function, args_list, warmup=3):
+    """Durations of function(*args) for each args tuple, after a few untimed calls"""
+    for args in args_list[:warmup]:
+        function(*args)
+    
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        function(*args)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def build_model(db):
+    """Build a recommender from db, timing _load_data and _prepare_data"""
+    stages = {}
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        recommender = ClubHubRecommender(
+            db=db, on_progress=lambda stage: stages.setdefault(stage, time.perf_counter())
+        )
+    finished = time.perf_counter()
+    
+    load_started = stages.get('loading data', started)
+    prepare_started = stages.get('building model', finished)
+    return recommender, {
+        'load_data_s': round(prepare_started - load_started, 4),
+        'prepare_data_s': round(finished - prepare_started, 4),
+        'build_total_s': round(finished - started, 4),
+    }
+
+
+def load_api(recommender):
+    """Import the Flask app without letting it build its own model"""
+    os.environ['FIREBASE_CRED_PATH'] = os.path.join(os.path.dirname(__file__), '.benchmark-no-credentials')
+    for name in ('FIRESTORE_EMULATOR_HOST', 'MODEL_SNAPSHOT_DIR', 'RECOMMENDATION_TABLE_DIR'):
+        os.environ.pop(name, None)
+    
+    with redirect_stdout(io.StringIO()):
+        import api
+    api.recommender = recommender
+    return api
+
+
+async def _asgi_get(app, path):
+    """Send one GET through an ASGI app; returns the status code"""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(),
+        'headers': [], 'http_version': '1.1', 'scheme': 'http', 'server': ('benchmark', 80),
+    }
+    response = {}
+    
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+    
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+    
+    await app(scope, receive, send)
+    return response.get('status')
+
+
+def concurrent_throughput(api, student_uids, concurrency):
+    """Uncached /api/recommendations/<uid> requests per second through asgi.py"""
+    import asgi
+    
+    async def load():
+        slots = asyncio.Semaphore(concurrency)
+        
+        async def one(student_uid):
+            async with slots:
+                await _asgi_get(asgi.app, f'/api/recommendations/{student_uid}?top_n=5')
+        
+        await asyncio.gather(*(one(student_uid) for student_uid in student_uids))
+    
+    api.response_cache.clear()
+    started = time.perf_counter()
+    asyncio.run(load())
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(student_uids),
+        'requests_per_s': round(len(student_uids) / elapsed, 1),
+        'ms_per_request': round(elapsed * 1000 / len(student_uids), 3),
+    }
+
+
+def run(config, samples=200, batch_size=100, batches=10, seed=0, concurrency=32):
+    """Run every benchmark and return the results document"""
+    rng = np.random.default_rng(seed)
+    
+    print(f"🧪 Generating {config['events']} events, {config['students']} students...")
+    started = time.perf_counter()
+    data = make_dataset(seed=seed, **config)
+    generate_s = time.perf_counter() - started
+    
+    print("🛠️ Building model...")
+    recommender, metrics = build_model(FakeFirestore(data))
+    
+    student_uids = [doc_id for doc_id, _ in data['students']]
+    event_ids = [doc_id for doc_id, _ in data['events']]
+    sampled_students = list(rng.choice(student_uids, size=min(samples, len(student_uids)), replace=False))
+    sampled_events = list(rng.choice(event_ids, size=min(samples, len(event_ids)), replace=False))
+    student_batches = [
+        list(rng.choice(student_uids, size=min(batch_size, len(student_uids)), replace=False))
+        for _ in range(batches)
+    ]
+    
+    print("⏱️ Timing recommender calls...")
+    latencies = {
+        'recommend': latency_summary(time_calls(
+            recommender.recommend, [(uid, 5) for uid in sampled_students]
+        )),
+        'recommend_many': latency_summary(time_calls(
+            recommender.recommend_many, [(batch, 5) for batch in student_batches], warmup=1
+        )),
+        'similar_events': latency_summary(time_calls(
+            recommender.similar_events, [(event_id, 5) for event_id in sampled_events]
+        )),
+        'recommend_clubs': latency_summary(time_calls(
+            recommender.recommend_clubs, [(uid, 5) for uid in sampled_students]
+        )),
+    }
+    
+    print("⏱️ Timing API endpoints...")
+    api = load_api(recommender)
+    client = api.app.test_client()
+    
+    def get_uncached(path):
+        api.response_cache.clear()
+        client.get(path)
+    
+    latencies['GET /api/recommendations/<uid> (uncached)'] = latency_summary(time_calls(
+        get_uncached, [(f'/api/recommendations/{uid}?top_n=5',) for uid in sampled_students]
+    ))
+    latencies['GET /api/recommendations/<uid> (cached)'] = latency_summary(time_calls(
+        client.get, [(f'/api/recommendations/{sampled_students[0]}?top_n=5',)] * len(sampled_students)
+    ))
+    latencies['POST /api/recommendations/batch'] = latency_summary(time_calls(
+        lambda batch: client.post('/api/recommendations/batch', json={'student_uids': batch, 'top_n': 5}),
+        [(batch,) for batch in student_batches],
+        warmup=1
+    ))
+    latencies['POST /api/recommendations/batch/stream'] = latency_summary(time_calls(
+        lambda batch: client.post('/api/recommendations/batch/stream', json={'student_uids': batch, 'top_n': 5}),
+        [(batch,) for batch in student_batches],
+        warmup=1
+    ))
+    latencies['GET /api/events/<id>/similar'] = latency_summary(time_calls(
+        client.get, [(f'/api/events/{event_id}/similar?top_n=5',) for event_id in sampled_events]
+    ))
+    latencies['GET /api/stats'] = latency_summary(time_calls(client.get, [('/api/stats',)] * 20))
+    
+    print("⏱️ Timing concurrent load through asgi.py...")
+    load_students = list(rng.choice(student_uids, size=min(1000, len(student_uids)), replace=False))
+    throughput = {
+        f'asgi concurrency={level}': concurrent_throughput(api, load_students, level)
+        for level in sorted({1, concurrency})
+    }
+    
+    if resource is not None:
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        metrics['peak_rss_mb'] = round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': dict(config, samples=samples, batch_size=batch_size, batches=batches, seed=seed),
+        'generate_data_s': round(generate_s, 4),
+        'build': metrics,
+        'latency': latencies,
+        'throughput': throughput,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _flatten(results):
+    """name -> value of every timed metric (build seconds, latency p50/p95)"""
+    flat = {f'build.{name}': value for name, value in results['build'].items()}
+    for name, summary in results['latency'].items():
+        for stat in ('p50_ms', 'p95_ms'):
+            if stat in summary:
+                flat[f'{name} {stat}'] = summary[stat]
+    for name, summary in results.get('throughput', {}).items():
+        flat[f'{name} ms_per_request'] = summary['ms_per_request']
+    return flat
+
+
+def compare(baseline, results, tolerance):
+    """Print new/old ratios against a baseline run; True if nothing got slower than tolerance"""
+    old, new = _flatten(baseline), _flatten(results)
+    print(f"\n📊 Compared with {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp')})")
+    
+    ok = True
+    for name in new:
+        if name not in old or not old[name]:
+            continue
+        ratio = new[name] / old[name]
+        flag = ''
+        if ratio > tolerance and not name.startswith('build.peak_rss'):
+            flag = '  ⚠️  slower'
+            ok = False
+        print(f"   {name:<55} {old[name]:>10} -> {new[name]:>10}  x{ratio:.2f}{flag}")
+    return ok
+
+
+def print_summary(results):
+    print("\n📋 Build")
+    for name, value in results['build'].items():
+        print(f"   {name:<20} {value}")
+    print("\n📋 Latency (ms)")
+    for name, summary in results['latency'].items():
+        print(f"   {name:<45} p50 {summary.get('p50_ms')}  p95 {summary.get('p95_ms')}  (n={summary['n']})")
+    print("\n📋 Throughput (uncached recommendations)")
+    for name, summary in results['throughput'].items():
+        print(f"   {name:<45} {summary['requests_per_s']} req/s")
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the ClubHub recommender on synthetic data')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help='Catalog size preset')
+    parser.add_argument('--events', type=int, help='Override the number of events')
+    parser.add_argument('--students', type=int, help='Override the number of students')
+    parser.add_argument('--clubs', type=int, help='Override the number of clubs')
+    parser.add_argument('--registrations-per-student', type=int, help='Override registrations per student')
+    parser.add_argument('--samples', type=int, default=200, help='Timed calls per single-item benchmark')
+    parser.add_argument('--batch-size', type=int, default=100, help='Students per batch call')
+    parser.add_argument('--batches', type=int, default=10, help='Timed batch calls')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data')
+    parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight for the load test')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='Results JSON of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='Slowdown ratio that counts as a regression with --compare (exit code 1)')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    config = dict(SCALES[args.scale])
+    for name in config:
+        override = getattr(args, name)
+        if override is not None:
+            config[name] = override
+    
+    results = run(config, samples=args.samples, batch_size=args.batch_size,
+                  batches=args.batches, seed=args.seed, concurrency=args.concurrency)
+    results['scale'] = args.scale
+    print_summary(results)
+    
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(baseline, results, args.tolerance):
+            exit(1)
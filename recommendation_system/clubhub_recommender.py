@@ -10,23 +10,122 @@ import pandas as pd
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 import firebase_admin
 from firebase_admin import credentials, firestore
+from scipy.sparse import csr_matrix, vstack
 from datetime import datetime
+import copy
+from collections import Counter, defaultdict
+from itertools import count
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import metrics
+import model_snapshot
+from sharding import shard_of
+from trending import Trending, timestamp_seconds
+
+
+# Source of ClubHubRecommender.model_version values (unique within a process)
+_model_versions = count(1)
+
+# Durations of model build and recommendation stages (rendered at /metrics)
+stage_seconds = metrics.stage_seconds
+
+
+def _analysed_terms(terms):
+    """TfidfVectorizer analyzer for documents that are already lists of terms"""
+    return terms
 
 
 class ClubHubRecommender:
+
+    # Firestore collection -> frame column holding the document id
+    COLLECTION_ID_COLUMNS = {
+        'students': 'uid',
+        'clubs': 'clubId',
+        'events': 'eventId',
+        'event_registrations': 'registrationId',
+    }
+    
+    # Document fields the recommender reads; loads fetch only these
+    COLLECTION_FIELDS = {
+        'students': ['fullName', 'fieldOfInterest'],
+        'clubs': ['clubName', 'clubCategory'],
+        'events': ['eventName', 'eventDescription', 'clubId', 'eventDate', 'isCompleted'],
+        'event_registrations': ['studentUid', 'eventId', 'attended', 'registeredAt'],
+    }
+    
+    # Fields interned with sys.intern as documents are read, so every event of
+    # a club shares one clubId string (and the clubs frame shares it too).
+    # eventIds are unique per event, so interning them would only add entries
+    # to the intern table.
+    INTERNED_FIELDS = {
+        'clubs': ['clubId'],
+        'events': ['clubId'],
+    }
+    
+    # registrations_df columns kept after _compact_registrations
+    REGISTRATION_COLUMNS = ['registrationId', 'studentUid', 'eventId', 'attended', 'registeredAt']
+    
+    # Documents per paginated read in _load_data
+    LOAD_PAGE_SIZE = 2000
+    
+    # Students scored together in recommend_many (bounds the students x events matrices)
+    BATCH_CHUNK_SIZE = 64
+    
+    # Characters of eventDescription kept in responses (longer ones get '...')
+    DESCRIPTION_SNIPPET_LENGTH = 150
+    
+    # Share of the TF-IDF vocabulary that may go stale before sync() refits;
+    # below it, changed events are transformed with the fitted vocabulary and IDF
+    VOCABULARY_DRIFT_THRESHOLD = 0.05
+    
+    # Registrations lose half their weight in popularity and trending every this many days
+    TRENDING_HALF_LIFE_DAYS = 7
+    
+    # Event neighbour index (see _build_neighbour_index)
+    NEIGHBOURS_K = 50
+    # From this many events, neighbours come from random-projection LSH buckets
+    APPROX_NEIGHBOURS_MIN_EVENTS = 50000
+    LSH_BANDS = 16
+    LSH_BITS = 8
+    LSH_MAX_BUCKET = 1000
+    # From this many events, attended-event similarity is read from the
+    # neighbour lists instead of computed exactly for every candidate
+    NEIGHBOUR_SCORING_MIN_EVENTS = 5000
     
-    def __init__(self, firebase_cred_path=None):
-        """Initialize with Firebase credentials"""
+    def __init__(self, firebase_cred_path=None, on_progress=None, db=None, shard=None):
+        """
+        Initialize with Firebase credentials
+        
+        on_progress, if given, is called with the name of each build stage.
+        db, if given, is used instead of the firebase_admin client, e.g. a
+        client for the Firestore emulator or a local fake in tests.
+        shard, if given, is (index, count): the model then only holds the
+        students with sharding.shard_of(uid, count) == index (see owns_student).
+        """
+        self._init_runtime_state(on_progress)
+        self.shard = shard
+        started = time.perf_counter()
+        
         print("🔥 Connecting to Firebase...")
         
         try:
-            if firebase_cred_path and not firebase_admin._apps:
-                cred = credentials.Certificate(firebase_cred_path)
-                firebase_admin.initialize_app(cred)
-            
-            self.db = firestore.client()
+            if db is not None:
+                self.db = db
+            else:
+                if firebase_cred_path and not firebase_admin._apps:
+                    cred = credentials.Certificate(firebase_cred_path)
+                    firebase_admin.initialize_app(cred)
+                
+                self.db = firestore.client()
         except Exception as e:
             print(f"❌ Failed to connect to Firebase: {e}")
             print("Make sure your serviceAccountKey.json is valid!")
@@ -81,121 +180,1338 @@ class ClubHubRecommender:
                 'climate', 'nature', 'conservation', 'waste', 'pollution'
             ]
         }
+        self._compile_interest_keywords()
         
         print("📊 Loading data from Firestore...")
         self._load_data()
         
         print("🛠️ Building recommendation model...")
+        self.on_progress('building model')
         self._prepare_data()
+        
+        self.build_seconds = time.perf_counter() - started
+        self.built_at = time.time()
+        stage_seconds.observe(self.build_seconds, 'build')
         print("✅ System ready!\n")
     
-    def _load_data(self):
-        """Load data from Firestore"""
-        # Load students
-        students_ref = self.db.collection('students')
-        students_data = []
-        for doc in students_ref.stream():
-            data = doc.to_dict()
-            data['uid'] = doc.id
-            students_data.append(data)
+    def _init_runtime_state(self, on_progress=None):
+        """State shared by Firestore-built and snapshot-loaded models"""
+        self.on_progress = on_progress or (lambda stage: None)
         
-        self.students_df = pd.DataFrame(students_data)
-        print(f"   ✓ Loaded {len(self.students_df)} students")
+        # (index, count) when this model only serves one shard of the students
+        self.shard = None
         
-        # Load clubs
-        clubs_ref = self.db.collection('clubs')
-        clubs_data = []
-        for doc in clubs_ref.stream():
-            data = doc.to_dict()
-            data['clubId'] = doc.id
-            clubs_data.append(data)
+        # Set when the model is saved to / loaded from a snapshot (see model_snapshot)
+        self.snapshot_version = None
+        self.snapshot_created_at = None
+        self.snapshot_counts = None
         
-        self.clubs_df = pd.DataFrame(clubs_data)
-        print(f"   ✓ Loaded {len(self.clubs_df)} clubs")
+        # Event fields shown in responses (see _build_event_columns)
+        self.event_columns = None
         
-        # Load events
-        events_ref = self.db.collection('events')
-        events_data = []
-        for doc in events_ref.stream():
-            data = doc.to_dict()
-            data['eventId'] = doc.id
+        # Wall-clock time the model's data was read, and how long building it took
+        self.built_at = None
+        self.build_seconds = None
+        
+        # Bumped when results may change: for everyone, or for one student (see cache_token)
+        self.model_version = next(_model_versions)
+        self.student_versions = {}
+        # Wall-clock time of each student's last change since built_at (see recommend_precomputed)
+        self.student_changed_at = {}
+        
+        # Incremental sync state (see start_sync/sync), shared with the copies sync() publishes
+        self.sync_enabled = False
+        self._sync_watches = []
+        self._pending_changes = {}
+        self._pending_lock = threading.Lock()
+        self._sync_lock = threading.RLock()
+        # The newest of those copies, which listeners and apply_registration update
+        self._latest = [self]
+        # Share of the TF-IDF vocabulary a refit would change (see _vocabulary_drift)
+        self.vocabulary_drift = 0.0
+        
+        # Registration changes applied since registration_index was built (see apply_registration)
+        self._live_registrations = {}
+        self._registration_positions = None
+        # What a snapshot-loaded model holds per registration (see model_snapshot.RegistrationRecords)
+        self.registration_records = None
+        # Decayed registration weight per event row (see _calculate_popularity)
+        self.popularity_counts = None
+        self.trending = Trending(self.TRENDING_HALF_LIFE_DAYS * 86400)
+        self._club_rows = {}
+        # Club centroids for recommend_clubs (see _build_club_profiles)
+        self.club_features = None
+    
+    @classmethod
+    def from_snapshot(cls, snapshot_dir, version=None):
+        """
+        Load a model published with save_snapshot() without touching Firestore
+        
+        Arrays are memory-mapped read-only, so worker processes serving the
+        same snapshot share one copy of its pages. The loaded model has no
+        DataFrames and can't sync; rebuild from Firestore to refresh it.
+        """
+        self = cls.__new__(cls)
+        self._init_runtime_state()
+        started = time.perf_counter()
+        self.db = None
+        self.students_df = self.clubs_df = self.events_df = self.registrations_df = None
+        self.__dict__.update(model_snapshot.load_snapshot(snapshot_dir, version))
+        self._scale_popularity()
+        self._build_trending(Trending(self._trending_half_life, self._trending_origin))
+        
+        self.build_seconds = time.perf_counter() - started
+        self.built_at = self.snapshot_created_at
+        stage_seconds.observe(self.build_seconds, 'load_snapshot')
+        return self
+    
+    def save_snapshot(self, snapshot_dir):
+        """Publish this model as the current snapshot in snapshot_dir"""
+        self.snapshot_version, self.snapshot_created_at = model_snapshot.save_snapshot(self, snapshot_dir)
+        return self.snapshot_version
+    
+    def _compile_interest_keywords(self):
+        """Flatten interest_keywords into unique keywords and a membership matrix"""
+        self.interest_names = list(self.interest_keywords)
+        self.interest_columns = {name: j for j, name in enumerate(self.interest_names)}
+        
+        self.keywords = []
+        keyword_columns = {}
+        for keywords in self.interest_keywords.values():
+            for keyword in keywords:
+                if keyword not in keyword_columns:
+                    keyword_columns[keyword] = len(self.keywords)
+                    self.keywords.append(keyword)
+        
+        # keyword_membership[k, j] = 1 if keyword k belongs to interest j
+        self.keyword_membership = np.zeros(
+            (len(self.keywords), len(self.interest_names)), dtype=np.int64
+        )
+        for j, keywords in enumerate(self.interest_keywords.values()):
+            for keyword in set(keywords):
+                self.keyword_membership[keyword_columns[keyword], j] = 1
+    
+    @staticmethod
+    def _strip_timezone(value):
+        """Drop tzinfo from a datetime, keeping anything else as is"""
+        if value is None:
+            return value
+        try:
+            return value.replace(tzinfo=None)
+        except (AttributeError, TypeError):
+            # If it's already a datetime or invalid, keep as is
+            return value
+    
+    def _record_from_doc(self, collection, doc_id, data):
+        """Turn a single changed Firestore document into the row stored in the matching frame"""
+        record = {field: data[field] for field in self.COLLECTION_FIELDS[collection] if field in data}
+        record[self.COLLECTION_ID_COLUMNS[collection]] = doc_id
+        self._intern_fields(collection, record)
+        
+        if collection == 'events' and 'eventDate' in record:
             # Convert timestamp to datetime
-            if 'eventDate' in data and data['eventDate'] is not None:
-                try:
-                    data['eventDate'] = data['eventDate'].replace(tzinfo=None)
-                except AttributeError:
-                    # If it's already a datetime or invalid, keep as is
-                    pass
-            events_data.append(data)
-        
-        self.events_df = pd.DataFrame(events_data)
-        
-        # Join with clubs to get club names and categories
-        if len(self.clubs_df) > 0:
-            self.events_df = self.events_df.merge(
+            record['eventDate'] = self._strip_timezone(record['eventDate'])
+        return record
+    
+    @classmethod
+    def _intern_fields(cls, collection, record):
+        """Intern a document's INTERNED_FIELDS in place"""
+        for field in cls.INTERNED_FIELDS.get(collection, ()):
+            if isinstance(record.get(field), str):
+                record[field] = sys.intern(record[field])
+    
+    def _read_collection(self, collection):
+        """
+        Read a collection page by page, fetching only COLLECTION_FIELDS
+        
+        Returns the row dicts, each document's update_time, and the seconds taken.
+        """
+        started = time.perf_counter()
+        id_column = self.COLLECTION_ID_COLUMNS[collection]
+        query = (
+            self.db.collection(collection)
+            .select(self.COLLECTION_FIELDS[collection])
+            .order_by('__name__')
+            .limit(self.LOAD_PAGE_SIZE)
+        )
+        
+        records = []
+        versions = {}
+        page = query
+        while True:
+            docs = list(page.stream())
+            for doc in docs:
+                data = doc.to_dict()
+                data[id_column] = doc.id
+                self._intern_fields(collection, data)
+                records.append(data)
+                versions[doc.id] = getattr(doc, 'update_time', None)
+            
+            if len(docs) < self.LOAD_PAGE_SIZE:
+                break
+            page = query.start_after(docs[-1])
+        
+        return records, versions, time.perf_counter() - started
+    
+    @classmethod
+    def _normalize_event_dates(cls, events_df):
+        """Strip timezones from eventDate for the whole column at once"""
+        if 'eventDate' not in events_df.columns:
+            return events_df
+        
+        dates = events_df['eventDate']
+        if isinstance(dates.dtype, pd.DatetimeTZDtype):
+            events_df['eventDate'] = dates.dt.tz_localize(None)
+        elif dates.dtype == object:
+            # Mixed timezones or non-datetime values: fall back to per-value stripping
+            events_df['eventDate'] = dates.map(cls._strip_timezone)
+        return events_df
+    
+    def _merge_club_columns(self, events_df):
+        """Join with clubs to get club names and categories"""
+        if len(self.clubs_df) > 0 and 'clubId' in events_df.columns:
+            events_df = events_df.merge(
                 self.clubs_df[['clubId', 'clubName', 'clubCategory']], 
                 on='clubId', 
                 how='left'
             )
+        return events_df
+    
+    def _load_data(self):
+        """Load data from Firestore, reading all collections concurrently"""
+        self.on_progress('loading data')
+        collections = list(self.COLLECTION_ID_COLUMNS)
+        with ThreadPoolExecutor(max_workers=len(collections)) as pool:
+            results = dict(zip(collections, pool.map(self._read_collection, collections)))
+        
+        self._doc_versions = {collection: results[collection][1] for collection in collections}
+        timings = {collection: results[collection][2] for collection in collections}
+        for collection, seconds in timings.items():
+            stage_seconds.observe(seconds, f'load.{collection}')
+        frames_started = time.perf_counter()
+        
+        # Load students
+        self.students_df = pd.DataFrame(results['students'][0])
+        print(f"   ✓ Loaded {len(self.students_df)} students ({timings['students']:.2f}s)")
+        if self.shard is not None:
+            self.students_df = self._own_students(self.students_df)
+            print(f"   ✓ Kept {len(self.students_df)} students of shard {self.shard[0]}/{self.shard[1]}")
         
-        print(f"   ✓ Loaded {len(self.events_df)} events")
+        # Load clubs
+        self.clubs_df = pd.DataFrame(results['clubs'][0])
+        print(f"   ✓ Loaded {len(self.clubs_df)} clubs ({timings['clubs']:.2f}s)")
+        
+        # Load events
+        self.events_df = self._merge_club_columns(
+            self._normalize_event_dates(pd.DataFrame(results['events'][0]))
+        )
+        print(f"   ✓ Loaded {len(self.events_df)} events ({timings['events']:.2f}s)")
         
         # Load registrations with attendance
-        registrations_ref = self.db.collection('event_registrations')
-        registrations_data = []
-        for doc in registrations_ref.stream():
-            data = doc.to_dict()
-            registrations_data.append(data)
+        registrations_data = results['event_registrations'][0]
         
         if len(registrations_data) > 0:
-            self.registrations_df = pd.DataFrame(registrations_data)
-            print(f"   ✓ Loaded {len(self.registrations_df)} registrations")
+            registrations_df = pd.DataFrame(registrations_data)
+            print(f"   ✓ Loaded {len(registrations_df)} registrations ({timings['event_registrations']:.2f}s)")
         else:
             print("   ⚠️  No registrations found")
-            self.registrations_df = pd.DataFrame(columns=['studentUid', 'eventId', 'attended'])
+            registrations_df = pd.DataFrame(columns=self.REGISTRATION_COLUMNS)
+        
+        raw_bytes = registrations_df.memory_usage(deep=True).sum()
+        self.registrations_df = self._own_registrations(self._compact_registrations(registrations_df))
+        compact_bytes = self.registrations_df.memory_usage(deep=True).sum()
+        print(f"   ✓ Compacted registrations: {raw_bytes / 1e6:.1f} MB -> {compact_bytes / 1e6:.1f} MB")
+        stage_seconds.observe(time.perf_counter() - frames_started, 'load.frames')
+    
+    def _build_indexes(self):
+        """Build hash indexes so request-path lookups don't scan DataFrames"""
+        self._build_event_index()
+        self._build_student_index()
+        self._build_registration_index()
+    
+    def _build_event_index(self):
+        """eventId -> row position in events_df / event_vectors (first row wins)"""
+        event_index = {}
+        event_ids = (
+            self.events_df['eventId'].values
+            if 'eventId' in self.events_df.columns
+            else np.array([], dtype=object)
+        )
+        for pos, event_id in enumerate(event_ids):
+            event_index.setdefault(event_id, pos)
+        
+        self.event_ids = event_ids
+        self.event_index = event_index
+        self.event_columns = self._build_event_columns(self.events_df)
+        self._build_upcoming_schedule()
+    
+    @classmethod
+    def _build_event_columns(cls, events_df):
+        """
+        Columnar copies of the event fields shown in responses (missing -> None)
+        
+        eventDescription is kept as its response snippet, so formatting a
+        result is a few array lookups.
+        """
+        columns = {}
+        for column in model_snapshot.EVENT_COLUMNS:
+            if column in events_df.columns:
+                values = events_df[column].astype(object)
+                columns[column] = values.where(values.notna(), None).to_numpy(dtype=object)
+            else:
+                columns[column] = np.full(len(events_df), None, dtype=object)
+        
+        limit = cls.DESCRIPTION_SNIPPET_LENGTH
+        columns['eventDescription'] = np.array([
+            text[:limit] + '...' if isinstance(text, str) and len(text) > limit else text
+            for text in columns['eventDescription']
+        ], dtype=object)
+        return columns
+    
+    def _build_student_index(self, student_uids=None):
+        """uid -> student record; only re-indexes student_uids when given"""
+        students = self.students_df
+        if 'uid' not in students.columns:
+            students = pd.DataFrame(columns=['uid'])
+        if student_uids is not None:
+            students = students[students['uid'].isin(student_uids)]
+        
+        index = {}
+        for record in students.to_dict('records'):
+            index.setdefault(record['uid'], record)
+        
+        if student_uids is None:
+            self.student_index = index
+        else:
+            for student_uid in student_uids:
+                if student_uid in index:
+                    self.student_index[student_uid] = index[student_uid]
+                else:
+                    self.student_index.pop(student_uid, None)
+    
+    @classmethod
+    def _compact_registrations(cls, registrations):
+        """
+        Registrations reduced to REGISTRATION_COLUMNS, with studentUid and
+        eventId interned as categoricals, attended as a bool and registeredAt
+        as Unix seconds (NaN when missing)
+        
+        Applied to the loaded frame and to the rows each sync upserts.
+        """
+        compact = {}
+        for column in cls.REGISTRATION_COLUMNS:
+            if column in registrations.columns:
+                compact[column] = registrations[column].values
+            else:
+                compact[column] = np.full(len(registrations), None, dtype=object)
+        
+        compact = pd.DataFrame(compact)
+        for column in ('studentUid', 'eventId'):
+            compact[column] = compact[column].astype('category')
+        # Only a literal True counts as attended (matches the index built before)
+        if compact['attended'].dtype != bool:
+            compact['attended'] = (compact['attended'] == True).astype(bool)
+        if compact['registeredAt'].dtype != float:
+            # Same as trending.timestamp_seconds, for the whole column
+            times = pd.to_datetime(compact['registeredAt'], utc=True, errors='coerce')
+            compact['registeredAt'] = (times - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy(dtype=float)
+        return compact
+    
+    def owns_student(self, student_uid):
+        """True if student_uid belongs to this model's shard (always, when unsharded)"""
+        if self.shard is None:
+            return True
+        return isinstance(student_uid, str) and shard_of(student_uid, self.shard[1]) == self.shard[0]
+    
+    def _own_students(self, students):
+        """Rows of a students frame that belong to this model's shard"""
+        if self.shard is None or 'uid' not in students.columns:
+            return students
+        return students[np.array([self.owns_student(uid) for uid in students['uid']], dtype=bool)]
+    
+    def _own_registrations(self, registrations):
+        """
+        A compacted registrations frame with other shards' studentUids blanked
+        
+        Their rows stay, since event popularity counts every registration, but
+        they drop out of the studentUid categories and the registration index.
+        """
+        if self.shard is None:
+            return registrations
+        student_uids = registrations['studentUid'].cat.categories
+        owned = np.array([self.owns_student(uid) for uid in student_uids], dtype=bool)
+        if owned.all():
+            return registrations
+        registrations = registrations.copy(deep=False)
+        registrations['studentUid'] = registrations['studentUid'].cat.set_categories(student_uids[owned])
+        return registrations
+    
+    @staticmethod
+    def _share_registration_categories(registrations, rows):
+        """
+        Give two compacted registration frames the same categories, so
+        concatenating them keeps the categorical columns
+        
+        New ids are appended after the existing categories, so the codes
+        already in registrations don't change.
+        """
+        registrations, rows = registrations.copy(deep=False), rows.copy(deep=False)
+        for column in ('studentUid', 'eventId'):
+            categories = registrations[column].cat.categories
+            new_ids = rows[column].cat.categories.difference(categories)
+            if len(new_ids) > 0:
+                registrations[column] = registrations[column].cat.add_categories(new_ids)
+            rows[column] = rows[column].cat.set_categories(registrations[column].cat.categories)
+        return registrations, rows
+    
+    def _build_registration_index(self):
+        """
+        studentUid -> (registered eventIds, attended eventIds) as a CSR table
+        
+        Each student's registrations are a sorted run of event codes with a
+        parallel attended bitmask, built from the categorical codes of
+        registrations_df without touching individual rows. Duplicate
+        (student, event) registrations collapse into one entry that is
+        attended if any of them was.
+        """
+        registrations = self.registrations_df
+        student_uids = registrations['studentUid'].cat.categories
+        event_ids = registrations['eventId'].cat.categories.to_numpy(dtype=object)
+        student_codes = registrations['studentUid'].cat.codes.to_numpy()
+        event_codes = registrations['eventId'].cat.codes.to_numpy().astype(np.int32)
+        attended = registrations['attended'].to_numpy(dtype=bool)
+        
+        # A missing eventId still counts as a registration, as its own code
+        event_ids = np.append(event_ids, np.array([np.nan], dtype=object))
+        event_codes[event_codes < 0] = len(event_ids) - 1
+        
+        keep = student_codes >= 0
+        student_codes, event_codes, attended = student_codes[keep], event_codes[keep], attended[keep]
+        order = np.lexsort((event_codes, student_codes))
+        student_codes, event_codes, attended = student_codes[order], event_codes[order], attended[order]
+        
+        starts = np.flatnonzero(np.concatenate([
+            [True],
+            (student_codes[1:] != student_codes[:-1]) | (event_codes[1:] != event_codes[:-1])
+        ])) if len(order) > 0 else np.zeros(0, dtype=int)
+        if len(starts) > 0:
+            attended = np.logical_or.reduceat(attended, starts)
+        student_codes, event_codes = student_codes[starts], event_codes[starts]
+        
+        self.registration_index = model_snapshot.RegistrationTable(
+            dict(zip(student_uids, range(len(student_uids)))),
+            np.searchsorted(student_codes, np.arange(len(student_uids) + 1)),
+            event_codes,
+            attended,
+            event_ids
+        )
+        # The new table covers everything in registrations_df
+        self._live_registrations = {}
+        self._registration_positions = None
+    
+    def _build_upcoming_schedule(self):
+        """
+        Sort dated events by start time so the upcoming set is a suffix
+        
+        Upcoming events are then found with a binary search against the
+        current time, so the set rolls forward as events start without a
+        rebuild or /api/refresh.
+        """
+        starts = np.full(len(self.events_df), np.datetime64('NaT'), dtype='datetime64[ns]')
+        
+        if len(self.events_df) > 0 and 'eventDate' in self.events_df.columns:
+            dates = self.events_df['eventDate']
+            if not pd.api.types.is_datetime64_dtype(dates):
+                # Only naive datetimes compare with datetime.now(); others never qualify
+                dates = pd.to_datetime(dates.map(
+                    lambda d: d if isinstance(d, datetime) and d.tzinfo is None else pd.NaT
+                ))
+            starts = dates.values.astype('datetime64[ns]')
+            
+            if 'isCompleted' in self.events_df.columns:
+                completed = self.events_df['isCompleted'].map(bool).values.astype(bool)
+                starts[completed] = np.datetime64('NaT')
+        
+        self.event_starts = starts
+        
+        # One row per eventId, ordered by start time (ties keep events_df order)
+        canonical = np.zeros(len(starts), dtype=bool)
+        canonical[list(self.event_index.values())] = True
+        eligible = np.flatnonzero(canonical & ~np.isnat(starts))
+        order = np.argsort(starts[eligible], kind='stable')
+        self._schedule_rows = eligible[order]
+        self._schedule_starts = starts[eligible][order]
+        self._upcoming_cache = None
     
     def _prepare_data(self):
         """Prepare data for recommendations"""
+        with stage_seconds.time('prepare.indexes'):
+            self._build_indexes()
+        
         if len(self.events_df) == 0:
             print("   ⚠️  No events available")
             return
         
+        with stage_seconds.time('prepare.searchable_content'):
+            self.events_df['searchable_content'] = self._build_searchable_content(self.events_df)
+        with stage_seconds.time('prepare.tfidf'):
+            self._fit_vectorizer()
+        with stage_seconds.time('prepare.popularity'):
+            self._calculate_popularity()
+        
+        # Per-interest match scores for every event (events x interests)
+        with stage_seconds.time('prepare.interest_scores'):
+            self.interest_scores = self._compute_interest_scores(
+                self.events_df['searchable_content']
+            )
+        with stage_seconds.time('prepare.neighbour_index'):
+            self._build_neighbour_index()
+        with stage_seconds.time('prepare.club_profiles'):
+            self._build_club_profiles()
+    
+    def _build_club_profiles(self):
+        """
+        Club centroids for recommend_clubs, as one dense matrix
+        
+        club_features has a row per club: the TF-IDF terms, then the
+        interest scores, of the mean of its events' rows and a row for its
+        clubCategory text, with the TF-IDF part L2-normalised. club_events
+        (clubs x events, 1 where the event belongs to the club) sums event
+        popularity per club.
+        """
+        clubs = self.clubs_df
+        if len(clubs) > 0 and 'clubId' in clubs.columns:
+            clubs = clubs.drop_duplicates('clubId')
+        else:
+            clubs = pd.DataFrame(columns=['clubId', 'clubName', 'clubCategory'])
+        
+        club_columns = {}
+        for column in ('clubId', 'clubName', 'clubCategory'):
+            if column in clubs.columns:
+                values = clubs[column].astype(object)
+                club_columns[column] = values.where(values.notna(), None).to_numpy(dtype=object)
+            else:
+                club_columns[column] = np.full(len(clubs), None, dtype=object)
+        
+        n_clubs, n_events = len(clubs), len(self.event_ids)
+        event_clubs = pd.Index(club_columns['clubId']).get_indexer(
+            pd.Index(self.event_columns['clubId'], dtype=object)
+        )
+        in_club = np.flatnonzero(event_clubs >= 0)
+        club_events = csr_matrix(
+            (np.ones(len(in_club)), (event_clubs[in_club], in_club)), shape=(n_clubs, n_events)
+        )
+        
+        categories = pd.Series(club_columns['clubCategory'], dtype=object).fillna('').astype(str).str.lower()
+        sizes = np.asarray(club_events.sum(axis=1)).ravel() + 1
+        terms = (club_events @ self.event_vectors + self.vectorizer.transform(categories)).multiply(1 / sizes[:, None])
+        interests = (club_events @ self.interest_scores + self._compute_interest_scores(categories)) / sizes[:, None]
+        
+        self.club_columns = club_columns
+        self.club_events = club_events
+        self.club_features = np.hstack([normalize(csr_matrix(terms)).toarray(), interests])
+    
+    def _build_searchable_content(self, events_df):
+        """Lower-cased text that TF-IDF and interest matching run on"""
         # Create searchable content with error handling
         try:
-            self.events_df['searchable_content'] = (
-                self.events_df['eventName'].fillna('').astype(str) + ' ' +
-                self.events_df['eventDescription'].fillna('').astype(str) + ' ' +
-                self.events_df['clubName'].fillna('').astype(str) + ' ' +
-                self.events_df['clubCategory'].fillna('').astype(str)
+            return (
+                events_df['eventName'].fillna('').astype(str) + ' ' +
+                events_df['eventDescription'].fillna('').astype(str) + ' ' +
+                events_df['clubName'].fillna('').astype(str) + ' ' +
+                events_df['clubCategory'].fillna('').astype(str)
             ).str.lower()
         except Exception as e:
             print(f"   ⚠️  Error creating searchable content: {e}")
-            self.events_df['searchable_content'] = self.events_df['eventName'].fillna('').astype(str).str.lower()
+            return events_df['eventName'].fillna('').astype(str).str.lower()
+    
+    def _fit_vectorizer(self):
+        """
+        Create TF-IDF vectors
         
-        # Create TF-IDF vectors
+        Each event's text is analysed once: its terms feed both the corpus-wide
+        term counts (so sync() can tell when the top terms change) and the
+        fit, which runs on the analysed terms with the word analyzer restored
+        afterwards for transform().
+        """
         self.vectorizer = TfidfVectorizer(
             max_features=200,
             stop_words='english',
             ngram_range=(1, 2),
             min_df=1
         )
-        self.event_vectors = self.vectorizer.fit_transform(
-            self.events_df['searchable_content']
-        )
+        analyze = self.vectorizer.build_analyzer()
+        documents = [analyze(text) for text in self.events_df['searchable_content']]
+        self._term_counts = Counter(term for terms in documents for term in terms)
+        
+        params = self.vectorizer.get_params()
+        self.vectorizer.set_params(analyzer=_analysed_terms, stop_words=None, ngram_range=(1, 1))
+        try:
+            self.event_vectors = self.vectorizer.fit_transform(documents)
+        finally:
+            self.vectorizer.set_params(**params)
+        self.vocabulary_drift = 0.0
+    
+    def _build_neighbour_index(self):
+        """
+        Sparse events x events graph of each event's NEIGHBOURS_K most similar events
+        
+        Similarities are exact cosine products, computed in row blocks. From
+        APPROX_NEIGHBOURS_MIN_EVENTS events on, only pairs that share a
+        random-projection LSH bucket are compared.
+        """
+        n_events = self.event_vectors.shape[0]
+        k = min(self.NEIGHBOURS_K, n_events - 1)
+        if k <= 0:
+            self.event_neighbours = csr_matrix((n_events, n_events))
+            return
         
-        # Calculate popularity
-        if len(self.registrations_df) > 0:
-            event_counts = self.registrations_df['eventId'].value_counts()
-            self.events_df['popularity'] = self.events_df['eventId'].map(event_counts).fillna(0)
+        # At most 200 TF-IDF features, so dense rows keep the products in BLAS
+        vectors = normalize(self.event_vectors).toarray()
+        if n_events >= self.APPROX_NEIGHBOURS_MIN_EVENTS:
+            pairs = self._approximate_neighbour_pairs(vectors, k)
         else:
-            self.events_df['popularity'] = 0
+            pairs = self._exact_neighbour_pairs(vectors, np.arange(n_events), k)
+        self.event_neighbours = self._neighbour_graph(*pairs, n_events, k)
+    
+    def _update_neighbour_index(self, source, stale):
+        """
+        Patch the neighbour graph after an incremental event sync
+        
+        source and stale are as in _sync_events (event vectors of the other
+        rows are unchanged). Rows of new or edited events, and rows that lost a
+        neighbour, are recomputed; every other row keeps its list, merged with
+        the new or edited events that now rank among its most similar. Only
+        rows whose list changes are re-ranked; the rest are copied as they are.
+        """
+        n_events = len(source)
+        k = min(self.NEIGHBOURS_K, n_events - 1)
+        if k <= 0 or stale.sum() * 4 > n_events or not hasattr(self, 'event_neighbours'):
+            self._build_neighbour_index()
+            return
+        
+        old = self.event_neighbours.tocoo()
+        old_to_new = np.full(old.shape[0], -1)
+        old_to_new[source[~stale]] = np.flatnonzero(~stale)
+        rows, columns = old_to_new[old.row], old_to_new[old.col]
+        
+        recompute = stale.copy()
+        recompute[rows[(rows >= 0) & (columns < 0)]] = True
+        kept = (rows >= 0) & (columns >= 0)
+        kept[kept] = ~recompute[rows[kept]]
+        
+        vectors = normalize(self.event_vectors).toarray()
+        fresh = self._exact_neighbour_pairs(vectors, np.flatnonzero(recompute), k)
+        
+        # Similarity is symmetric: column j of a stale row's products is what
+        # that event scores in row j's list
+        stale_rows = np.flatnonzero(stale)
+        others = np.flatnonzero(~recompute)
+        similarity = vectors[stale_rows] @ vectors[others].T
+        
+        # A stale event enters a full row's list by reaching its k-th similarity
+        # (ties too: their column order decides)
+        bar = np.full(n_events, np.inf)
+        np.minimum.at(bar, rows[kept], old.data[kept])
+        bar[np.bincount(rows[kept], minlength=n_events) < k] = 0
+        entering_stale, entering_row = np.nonzero(
+            (similarity > 0) & (similarity >= bar[others][None, :])
+        )
+        
+        changed = recompute.copy()
+        changed[others[entering_row]] = True
+        settled = kept & ~changed[rows]
+        kept &= changed[rows]
+        
+        self.event_neighbours = self._neighbour_graph(
+            np.concatenate([rows[kept], fresh[0], others[entering_row]]),
+            np.concatenate([columns[kept], fresh[1], stale_rows[entering_stale]]),
+            np.concatenate([
+                old.data[kept], fresh[2], similarity[entering_stale, entering_row]
+            ]),
+            n_events,
+            k
+        ) + csr_matrix(
+            (old.data[settled], (rows[settled], columns[settled])), shape=(n_events, n_events)
+        )
+    
+    @staticmethod
+    def _neighbour_graph(rows, columns, similarities, n_events, k):
+        """
+        csr graph of each row's k most similar columns from (row, column, similarity) pairs
+        
+        Ties keep column order. np.unique drops pairs found twice and sorts by
+        (row, column); two stable sorts then order each row by similarity.
+        """
+        keep = similarities > 0
+        rows, columns, similarities = rows[keep], columns[keep], similarities[keep]
+        _, first = np.unique(rows * n_events + columns, return_index=True)
+        order = first[np.argsort(-similarities[first], kind='stable')]
+        order = order[np.argsort(rows[order], kind='stable')]
+        rows, columns, similarities = rows[order], columns[order], similarities[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        keep = rank < k
         
-        max_pop = self.events_df['popularity'].max()
-        self.events_df['popularity_score'] = (
-            self.events_df['popularity'] / max_pop if max_pop > 0 else 0
+        return csr_matrix(
+            (similarities[keep], (rows[keep], columns[keep])), shape=(n_events, n_events)
         )
+    
+    @staticmethod
+    def _exact_neighbour_pairs(vectors, event_rows, k):
+        """(row, column, similarity) of the k most similar other events of each event_rows event"""
+        n_events = vectors.shape[0]
+        block_size = max(1, 4_000_000 // n_events)
+        
+        rows = [np.array([], dtype=int)]
+        columns = [np.array([], dtype=int)]
+        similarities = [np.array([])]
+        for start in range(0, len(event_rows), block_size):
+            block_rows = event_rows[start:start + block_size]
+            block = vectors[block_rows] @ vectors.T
+            block[np.arange(len(block_rows)), block_rows] = -1  # not its own neighbour
+            
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            rows.append(np.repeat(block_rows, k))
+            columns.append(top.ravel())
+            similarities.append(np.take_along_axis(block, top, axis=1).ravel())
+        
+        return np.concatenate(rows), np.concatenate(columns), np.concatenate(similarities)
+    
+    def _approximate_neighbour_pairs(self, vectors, k):
+        """
+        (row, column, similarity) of each event's k most similar events within
+        every SimHash bucket it falls in, one bucket per LSH band
+        """
+        n_events, n_features = vectors.shape
+        planes = np.random.default_rng(0).standard_normal((n_features, self.LSH_BANDS * self.LSH_BITS))
+        bits = (vectors @ planes) > 0
+        weights = 1 << np.arange(self.LSH_BITS)
+        
+        rows, columns, similarities = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+        for band in range(self.LSH_BANDS):
+            keys = bits[:, band * self.LSH_BITS:(band + 1) * self.LSH_BITS] @ weights
+            order = np.argsort(keys, kind='stable')
+            for bucket in np.split(order, np.flatnonzero(np.diff(keys[order])) + 1):
+                if len(bucket) < 2:
+                    continue
+                
+                bucket = bucket[:self.LSH_MAX_BUCKET]
+                block = vectors[bucket] @ vectors[bucket].T
+                np.fill_diagonal(block, -1)  # not its own neighbour
+                
+                bucket_k = min(k, len(bucket) - 1)
+                top = np.argpartition(-block, bucket_k - 1, axis=1)[:, :bucket_k]
+                rows.append(np.repeat(bucket, bucket_k))
+                columns.append(bucket[top].ravel())
+                similarities.append(np.take_along_axis(block, top, axis=1).ravel())
+        
+        return np.concatenate(rows), np.concatenate(columns), np.concatenate(similarities)
+    
+    def _calculate_popularity(self):
+        """
+        Time-decayed registration counts per event
+        
+        Each registration weighs 2 ** (age / TRENDING_HALF_LIFE_DAYS) less
+        than a new one (see trending.Trending), so recent registrations
+        outweigh old ones. popularity_counts holds every event row's weight.
+        """
+        trending = Trending(self.TRENDING_HALF_LIFE_DAYS * 86400)
+        registrations = self.registrations_df
+        popularity = np.zeros(len(self.events_df))
+        if len(registrations) > 0 and len(self.events_df) > 0:
+            events = registrations['eventId'].cat
+            codes = events.codes.to_numpy()
+            weights = trending.weights(registrations['registeredAt'].to_numpy(dtype=float))
+            valid = codes >= 0
+            event_weights = pd.Series(
+                np.bincount(codes[valid], weights=weights[valid], minlength=len(events.categories)),
+                index=events.categories
+            )
+            # A writable copy: registrations applied live update it in place
+            popularity = np.array(self.events_df['eventId'].map(event_weights).fillna(0), dtype=float)
+        
+        self.popularity_counts = popularity
+        self._scale_popularity()
+        self._build_trending(trending)
+    
+    def _build_trending(self, trending):
+        """Fill trending with the event and club weights in popularity_counts"""
+        club_ids = self.event_columns['clubId']
+        self._club_rows = {}
+        for event_id, pos in self.event_index.items():
+            if self.popularity_counts[pos] > 0:
+                trending.add(event_id, club_ids[pos], self.popularity_counts[pos])
+            if club_ids[pos] is not None:
+                self._club_rows.setdefault(club_ids[pos], pos)
+        self.trending = trending
+    
+    def _scale_popularity(self):
+        """popularity_scores: popularity_counts relative to the most popular event"""
+        popularity = self.popularity_counts
+        max_pop = self._max_popularity = popularity.max() if len(popularity) > 0 else 0
+        self.popularity_scores = popularity / max_pop if max_pop > 0 else np.zeros(len(popularity))
+    
+    def _compute_interest_scores(self, content):
+        """
+        Per-interest match scores for each row of a searchable_content column
+        
+        Each unique keyword is tested once against the whole column, and the
+        keyword hits are summed into per-interest match counts with a single
+        product against keyword_membership.
+        """
+        keyword_hits = np.zeros((len(content), len(self.keywords)), dtype=np.int64)
+        for k, keyword in enumerate(self.keywords):
+            keyword_hits[:, k] = content.str.contains(keyword, regex=False).to_numpy(dtype=bool)
+        
+        return self._interest_scores_from_counts(keyword_hits @ self.keyword_membership)
+    
+    def start_sync(self):
+        """
+        Attach Firestore listeners that queue document changes for sync()
+        
+        Each listener's first snapshot replays its whole collection; documents
+        whose update_time matches what _load_data saw are skipped by sync().
+        """
+        if self.db is None:
+            raise RuntimeError('Snapshot-loaded models have no Firestore client to sync from')
+        
+        self.stop_sync()
+        self._sync_watches = [
+            self.db.collection(collection).on_snapshot(
+                lambda docs, changes, read_time, collection=collection:
+                    self._latest[0]._queue_changes(collection, changes)
+            )
+            for collection in self.COLLECTION_ID_COLUMNS
+        ]
+        self.sync_enabled = True
+    
+    def stop_sync(self):
+        """Detach the Firestore listeners started by start_sync()"""
+        for watch in self._sync_watches:
+            watch.unsubscribe()
+        self._sync_watches = []
+        self.sync_enabled = False
+    
+    def _queue_changes(self, collection, changes):
+        """
+        Listener callback: keep the latest snapshot of each changed document
+        
+        Registration changes are also applied to the live model right away
+        (see apply_registration).
+        """
+        with self._pending_lock:
+            pending = self._pending_changes.setdefault(collection, {})
+            for change in changes:
+                doc = change.document
+                pending[doc.id] = None if change.type.name == 'REMOVED' else doc
+        
+        if collection == 'event_registrations':
+            versions = self._doc_versions.get(collection, {})
+            for change in changes:
+                doc = change.document
+                version = getattr(doc, 'update_time', None)
+                if change.type.name == 'REMOVED':
+                    self.apply_registration(doc.id, None)
+                elif version is None or versions.get(doc.id) != version:
+                    # Skips the listener's initial replay of documents _load_data read
+                    self.apply_registration(
+                        doc.id, self._record_from_doc(collection, doc.id, doc.to_dict())
+                    )
+    
+    def apply_registration(self, registration_id, record):
+        """
+        Apply one registration change to the live model without waiting for sync()
+        
+        record is the registration's studentUid/eventId/attended (and
+        optionally registeredAt) fields, or None when it was deleted. Without
+        registeredAt it counts as made at the trending origin, as it does
+        when the registration is loaded by a rebuild or sync(). The
+        student's registered and attended events and the event's popularity
+        and trending weight are updated in place, and only that student's
+        version is bumped, so only their cached results are dropped.
+        registrations_df picks the change up with the next sync(). On a
+        shard, other shards' students only move popularity and trending.
+        
+        Returns the uids of the affected students.
+        """
+        new = None
+        if record is not None:
+            registered_at = timestamp_seconds(record.get('registeredAt'))
+            student_uid = record.get('studentUid')
+            new = (
+                student_uid if self.owns_student(student_uid) else None,
+                record.get('eventId'),
+                record.get('attended') == True,
+                registered_at
+            )
+        
+        with self._sync_lock:
+            latest = self._latest[0]
+            if latest is not self:
+                # sync() published a newer copy since the caller looked this one up
+                return latest.apply_registration(registration_id, record)
+            
+            old = self._registration_record(registration_id)
+            if old == new:
+                return set()
+            
+            affected = set()
+            for registration, delta in ((old, -1), (new, 1)):
+                if registration is None:
+                    continue
+                student_uid, event_id, attended, registered_at = registration
+                self._shift_popularity(event_id, delta * self.trending.weight(registered_at))
+                if student_uid is None:
+                    continue
+                registered_events, attended_events = self.registration_index.get(
+                    student_uid, (set(), set())
+                )
+                registered_events, attended_events = set(registered_events), set(attended_events)
+                if delta > 0:
+                    registered_events.add(event_id)
+                    if attended:
+                        attended_events.add(event_id)
+                else:
+                    registered_events.discard(event_id)
+                    attended_events.discard(event_id)
+                self.registration_index.set(student_uid, registered_events, attended_events)
+                affected.add(student_uid)
+            
+            self._live_registrations[registration_id] = new
+            self._bump_student_versions(affected)
+            return affected
+    
+    def _registration_record(self, registration_id):
+        """(studentUid, eventId, attended, registeredAt) the model holds for a registration, or None"""
+        if registration_id in self._live_registrations:
+            return self._live_registrations[registration_id]
+        if self.registrations_df is None:
+            if self.registration_records is None:
+                return None
+            return self.registration_records.get(registration_id)
+        if len(self.registrations_df) == 0:
+            return None
+        
+        if self._registration_positions is None:
+            self._registration_positions = pd.Index(self.registrations_df['registrationId'])
+        try:
+            pos = self._registration_positions.get_loc(registration_id)
+        except KeyError:
+            return None
+        if not isinstance(pos, (int, np.integer)):
+            return None  # duplicate ids: left to sync()
+        
+        row = self.registrations_df.iloc[pos]
+        registered_at = row['registeredAt']
+        return (
+            row['studentUid'] if isinstance(row['studentUid'], str) else None,
+            row['eventId'], bool(row['attended']),
+            None if np.isnan(registered_at) else float(registered_at)
+        )
+    
+    def _registration_columns(self):
+        """
+        registrationId, studentUid, eventId, attended and registeredAt arrays
+        for every registration the model counts, live changes included
+        
+        Saved with snapshots, so models loaded from them can still look up
+        (and undo) a registration in _registration_record.
+        """
+        if self.registrations_df is not None:
+            registrations = self.registrations_df
+            columns = [
+                registrations['registrationId'].to_numpy(dtype=object),
+                registrations['studentUid'].astype(object).to_numpy(),
+                registrations['eventId'].astype(object).to_numpy(),
+                registrations['attended'].to_numpy(dtype=bool),
+                registrations['registeredAt'].to_numpy(dtype=float)
+            ]
+        elif self.registration_records is not None:
+            columns = list(self.registration_records.columns())
+        else:
+            columns = [np.zeros(0, dtype=object)] * 3 + [np.zeros(0, dtype=bool), np.zeros(0)]
+        
+        if self._live_registrations:
+            keep = ~np.isin(columns[0], list(self._live_registrations))
+            live = [
+                (registration_id,) + record
+                for registration_id, record in self._live_registrations.items()
+                if record is not None
+            ]
+            added = [
+                np.array([row[0] for row in live], dtype=object),
+                np.array([row[1] for row in live], dtype=object),
+                np.array([row[2] for row in live], dtype=object),
+                np.array([row[3] for row in live], dtype=bool),
+                np.array([np.nan if row[4] is None else row[4] for row in live], dtype=float)
+            ]
+            columns = [np.concatenate([column[keep], extra]) for column, extra in zip(columns, added)]
+        return columns
+    
+    def _shift_popularity(self, event_id, weight):
+        """Add (or, with a negative weight, remove) registration weight to an event"""
+        pos = self.event_index.get(event_id)
+        if pos is None:
+            return
+        self.trending.add(event_id, self.event_columns['clubId'][pos], weight)
+        
+        counts = self.popularity_counts
+        was_most_popular = counts[pos] == self._max_popularity
+        counts[pos] += weight
+        if counts[pos] <= abs(weight) * 1e-9:
+            counts[pos] = 0.0  # removed back to nothing, up to rounding
+        if counts[pos] > self._max_popularity or (was_most_popular and weight < 0):
+            # The top count changed, so every score is rescaled
+            self._scale_popularity()
+        else:
+            self.popularity_scores[pos] = counts[pos] / self._max_popularity
+    
+    def trending_events(self, top_n=10, upcoming_only=True):
+        """Events with the highest decayed registration counts, best first"""
+        keep = self._is_upcoming if upcoming_only else None
+        return [
+            self._format_event(self.event_index[event_id], count)
+            for event_id, count in self.trending.top('events', top_n, keep=keep)
+        ]
+    
+    def trending_clubs(self, top_n=10):
+        """Clubs with the highest decayed registration counts over their events, best first"""
+        columns = self.event_columns
+        clubs = []
+        for club_id, registrations in self.trending.top('clubs', top_n, keep=self._club_rows.__contains__):
+            pos = self._club_rows[club_id]
+            clubs.append({
+                'clubId': club_id,
+                'clubName': columns['clubName'][pos],
+                'clubCategory': columns['clubCategory'][pos],
+                'score': round(float(registrations), 4)
+            })
+        return clubs
+    
+    def trending_token(self):
+        """Like cache_token(), for the trending lists"""
+        return (self.model_version, self.trending.version, self._started_events())
+    
+    def _diff_versions(self, collection, docs):
+        """
+        Split queued snapshots into upserted records and removed ids
+        
+        Also returns the update_time of each changed document (None for
+        removed ones); sync() records them once its copy is published.
+        """
+        versions = self._doc_versions.get(collection, {})
+        upserts = {}
+        removed = set()
+        seen = {}
+        
+        for doc_id, doc in docs.items():
+            if doc is None:
+                if doc_id in versions:
+                    removed.add(doc_id)
+                    seen[doc_id] = None
+                continue
+            
+            version = getattr(doc, 'update_time', None)
+            if version is not None and versions.get(doc_id) == version:
+                continue
+            seen[doc_id] = version
+            upserts[doc_id] = self._record_from_doc(collection, doc_id, doc.to_dict())
+        
+        return upserts, removed, seen
+    
+    @staticmethod
+    def _apply_frame_changes(df, id_column, rows, removed):
+        """
+        Upsert rows and drop removed ids in a frame keyed by id_column
         
-        self.popular_events = self.events_df.sort_values('popularity', ascending=False)
+        Edited rows keep their position and new rows are appended. Also
+        returns, for every row of the result, its position in df (-1 for rows
+        taken from rows).
+        """
+        ids = df[id_column].values if id_column in df.columns else np.array([], dtype=object)
+        upserted = rows[id_column].values if len(rows) > 0 else np.array([], dtype=object)
+        changed = pd.Index(ids).isin(set(upserted) | set(removed))
+        
+        # Edited rows sort into their old slot, new rows after everything else
+        old_positions = dict(zip(ids[changed], np.flatnonzero(changed)))
+        kept = np.flatnonzero(~changed)
+        keys = np.concatenate([
+            kept,
+            np.array(
+                [old_positions.get(doc_id, len(df) + i) for i, doc_id in enumerate(upserted)],
+                dtype=int
+            )
+        ])
+        order = np.argsort(keys, kind='stable')
+        source = np.concatenate([kept, np.full(len(upserted), -1, dtype=int)])[order]
+        
+        parts = [part for part in (df[~changed], rows) if len(part) > 0]
+        merged = pd.concat(parts, ignore_index=True) if parts else df.iloc[0:0]
+        return merged.iloc[order].reset_index(drop=True), source
+    
+    def _vocabulary_drift(self, removed_content, added_content):
+        """
+        Update corpus term counts; share of the vocabulary a refit would change
+        
+        TfidfVectorizer keeps the max_features most frequent terms, so a term
+        outside the vocabulary only gets in by overtaking a term inside it (or
+        by taking a free slot while the vocabulary is below max_features).
+        Vocabulary terms that no longer occur count as drifted too.
+        """
+        analyze = self.vectorizer.build_analyzer()
+        self._term_counts = Counter(self._term_counts)  # shared with the model sync() copied
+        for text in removed_content:
+            self._term_counts.subtract(analyze(text))
+        for text in added_content:
+            self._term_counts.update(analyze(text))
+        
+        vocabulary = self.vectorizer.vocabulary_
+        inside = np.sort([self._term_counts[term] for term in vocabulary])
+        outside = -np.sort([
+            -count for term, count in self._term_counts.items()
+            if count > 0 and term not in vocabulary
+        ])
+        
+        # Outside terms, most frequent first, against the slots they could take
+        limit = self.vectorizer.max_features
+        free_slots = len(outside) if limit is None else max(limit - len(vocabulary), 0)
+        slots = np.concatenate([np.zeros(free_slots), inside])
+        n = min(len(slots), len(outside))
+        swapped = np.count_nonzero(outside[:n] > slots[:n])
+        dead = np.count_nonzero(inside <= 0)
+        
+        return float(max(swapped, dead) / max(len(vocabulary), 1))
+    
+    def _sync_events(self, upserts, removed, changed_club_ids):
+        """
+        Apply event changes (and club renames) to events_df and the model
+        
+        Only new, edited or renamed-club rows get new content, TF-IDF rows and
+        interest scores, and the neighbour graph is patched; the event index,
+        lookup columns and upcoming schedule are rebuilt over all rows. Returns
+        True if the vocabulary drifted past VOCABULARY_DRIFT_THRESHOLD and the
+        vectorizer was refit.
+        """
+        rows = pd.DataFrame(list(upserts.values()))
+        if len(rows) > 0:
+            rows = self._merge_club_columns(rows)
+        events, source = self._apply_frame_changes(self.events_df, 'eventId', rows, removed)
+        
+        stale = source < 0
+        if not hasattr(self, 'interest_scores'):
+            stale[:] = True
+        
+        # Events of edited clubs pick up the new club name/category
+        if changed_club_ids and len(self.clubs_df) > 0 and 'clubId' in events.columns:
+            renamed = events['clubId'].isin(changed_club_ids).values & ~stale
+            if renamed.any():
+                clubs = self.clubs_df.drop_duplicates('clubId').set_index('clubId')
+                for column in ('clubName', 'clubCategory'):
+                    events.loc[renamed, column] = (
+                        events.loc[renamed, 'clubId'].map(clubs[column]).values
+                    )
+                stale |= renamed
+        
+        if len(events) == 0:
+            self.events_df = events
+            self._build_event_index()
+            self._build_neighbour_index()
+            self.club_features = None
+            return False
+        
+        if stale.any():
+            events.loc[stale, 'searchable_content'] = (
+                self._build_searchable_content(events[stale]).values
+            )
+        stale_content = events['searchable_content'][stale]
+        interest_scores = self._compute_interest_scores(stale_content)
+        
+        refit = not hasattr(self, 'vectorizer')
+        if not refit:
+            # Old text of removed and re-computed rows leaves the term counts
+            replaced = np.ones(len(self.events_df), dtype=bool)
+            replaced[source[~stale]] = False
+            self.vocabulary_drift = self._vocabulary_drift(
+                self.events_df['searchable_content'][replaced],
+                stale_content
+            )
+            refit = self.vocabulary_drift > self.VOCABULARY_DRIFT_THRESHOLD
+            if refit:
+                print(f"   🔁 Vocabulary drift {self.vocabulary_drift:.1%}: refitting TF-IDF")
+        
+        if hasattr(self, 'interest_scores'):
+            # Reuse unchanged rows; stale rows are appended and picked by position
+            take = source.copy()
+            take[stale] = self.interest_scores.shape[0] + np.arange(stale.sum())
+            interest_scores = np.vstack([self.interest_scores, interest_scores])[take]
+            if not refit:
+                event_vectors = vstack([
+                    self.event_vectors,
+                    self.vectorizer.transform(stale_content)
+                ]).tocsr()[take]
+        
+        self.events_df = events
+        if refit:
+            self._fit_vectorizer()
+        else:
+            self.event_vectors = event_vectors
+        self.interest_scores = interest_scores
+        self._build_event_index()
+        if refit:
+            self._build_neighbour_index()
+        else:
+            self._update_neighbour_index(source, stale)
+        return refit
+    
+    def sync(self):
+        """
+        Apply document changes queued by the Firestore listeners
+        
+        Only changed documents are applied to the frames and to the student
+        index, TF-IDF rows and neighbour graph. The event and registration
+        indexes, popularity and club profiles are rebuilt from the updated
+        frames when their inputs changed. The TF-IDF model is refit only when
+        the changed events would alter more of its vocabulary than
+        VOCABULARY_DRIFT_THRESHOLD; otherwise their rows are transformed with
+        the current one.
+        
+        The changes are applied to a copy, so requests using this model keep
+        reading a consistent one while sync runs. Serve the copy by swapping
+        it in with one assignment (as api.py does); listeners and
+        apply_registration move to it. If applying fails, the changes stay
+        queued for the next sync.
+        
+        Returns (model, summary): the copy, or this model when nothing
+        changed, and the number of applied changes per collection.
+        """
+        with self._pending_lock:
+            pending = dict(self._pending_changes)
+            self._pending_changes.clear()
+        
+        with self._sync_lock, stage_seconds.time('sync'):
+            try:
+                changes = {
+                    collection: self._diff_versions(collection, pending.get(collection, {}))
+                    for collection in self.COLLECTION_ID_COLUMNS
+                }
+                summary = {
+                    collection: len(upserts) + len(removed)
+                    for collection, (upserts, removed, seen) in changes.items()
+                }
+                if not any(summary.values()):
+                    return self, dict(summary, refit=False)
+                
+                model = copy.copy(self)
+                summary['refit'] = model._apply_changes(changes, summary)
+            except Exception:
+                # Put the changes back, under any that arrived since
+                with self._pending_lock:
+                    for collection, docs in pending.items():
+                        self._pending_changes[collection] = dict(
+                            docs, **self._pending_changes.get(collection, {})
+                        )
+                raise
+            
+            for collection, (upserts, removed, seen) in changes.items():
+                versions = self._doc_versions.setdefault(collection, {})
+                for doc_id, version in seen.items():
+                    if version is None:
+                        versions.pop(doc_id, None)
+                    else:
+                        versions[doc_id] = version
+            self._latest[0] = model
+        
+        return model, summary
+    
+    def _apply_changes(self, changes, summary):
+        """
+        sync() on its copy: apply the diffed changes; True if TF-IDF was refit
+        
+        The copy shares its arrays and frames with the model still serving,
+        so they are replaced, never changed in place; the dicts changed in
+        place are copied first.
+        """
+        refit = False
+        upserts, removed, seen = changes['students']
+        if self.shard is not None:
+            upserts = {uid: record for uid, record in upserts.items() if self.owns_student(uid)}
+            removed = set(filter(self.owns_student, removed))
+        if upserts or removed or summary['event_registrations']:
+            self.student_versions = dict(self.student_versions)
+            self.student_changed_at = dict(self.student_changed_at)
+        if upserts or removed:
+            self.students_df, _ = self._apply_frame_changes(
+                self.students_df, 'uid', pd.DataFrame(list(upserts.values())), removed
+            )
+            self.student_index = dict(self.student_index)
+            self._build_student_index(set(upserts) | removed)
+            self._bump_student_versions(set(upserts) | removed)
+        
+        upserts, removed, seen = changes['clubs']
+        changed_club_ids = set(upserts) | removed
+        if changed_club_ids:
+            self.clubs_df, _ = self._apply_frame_changes(
+                self.clubs_df, 'clubId', pd.DataFrame(list(upserts.values())), removed
+            )
+        
+        upserts, removed, seen = changes['events']
+        if upserts or removed or changed_club_ids:
+            refit = self._sync_events(upserts, removed, changed_club_ids)
+        
+        upserts, removed, seen = changes['event_registrations']
+        if upserts or removed:
+            old = self.registrations_df
+            affected = {record.get('studentUid') for record in upserts.values()}
+            if 'registrationId' in old.columns:
+                affected |= set(old.loc[
+                    old['registrationId'].isin(set(upserts) | removed), 'studentUid'
+                ])
+            old, rows = self._share_registration_categories(old, self._own_registrations(
+                self._compact_registrations(pd.DataFrame(list(upserts.values())))
+            ))
+            self.registrations_df, _ = self._apply_frame_changes(old, 'registrationId', rows, removed)
+            self._build_registration_index()
+            self._bump_student_versions(set(filter(self.owns_student, affected)))
+        
+        if summary['events'] or summary['event_registrations']:
+            self._calculate_popularity()
+        if (summary['events'] or summary['clubs']) and len(self.events_df) > 0:
+            self._build_club_profiles()
+        
+        # Event and club changes can move every student's ranking. Popularity
+        # shifts from other students' registrations don't bump the version.
+        if summary['events'] or summary['clubs']:
+            self.model_version = next(_model_versions)
+        return refit
+    
+    def _bump_student_versions(self, student_uids):
+        changed_at = time.time()
+        for student_uid in student_uids:
+            self.student_versions[student_uid] = next(_model_versions)
+            self.student_changed_at[student_uid] = changed_at
+    
+    def cache_token(self, student_uid):
+        """
+        Value that changes whenever recommend(student_uid) may change
+        
+        Covers the model version, the student's own profile/registration
+        version and the number of events that have started so far.
+        """
+        return (
+            self.model_version,
+            self.student_versions.get(student_uid, 0),
+            self._started_events()
+        )
+    
+    def _started_events(self):
+        """Number of scheduled events that have started by now"""
+        now = np.datetime64(datetime.now(), 'ns')
+        return int(np.searchsorted(self._schedule_starts, now, side='right'))
+    
+    @staticmethod
+    def _interest_scores_from_counts(matches):
+        """Score: 0.3 base + 0.1 per match, capped at 1.0 (0 if nothing matched)"""
+        return np.where(matches > 0, np.minimum(1.0, 0.3 + (matches * 0.1)), 0.0)
     
     def _get_interest_match_score(self, content, interests):
         """Calculate how well event matches student's interests"""
@@ -203,49 +1519,46 @@ class ClubHubRecommender:
         if not isinstance(interests, list):
             return 0.0
         
-        total_score = 0
+        content = content.lower()
+        keyword_hits = np.array([keyword in content for keyword in self.keywords], dtype=np.int64)
+        scores = self._interest_scores_from_counts(keyword_hits @ self.keyword_membership)
         
+        total_score = 0
         for interest in interests:
-            if interest not in self.interest_keywords:
-                continue
-            
-            keywords = self.interest_keywords[interest]
-            matches = sum(1 for keyword in keywords if keyword in content.lower())
-            
-            if matches > 0:
-                # Score: 0.3 base + 0.1 per match, capped at 1.0
-                score = min(1.0, 0.3 + (matches * 0.1))
-                total_score += score
+            if interest in self.interest_columns:
+                total_score += scores[self.interest_columns[interest]]
         
         # Average across all interests
         return total_score / len(interests) if interests else 0.0
     
+    def _get_interest_match_scores(self, rows, interests):
+        """Interest match scores for event rows, read from interest_scores"""
+        total_score = np.zeros(len(rows))
+        if not isinstance(interests, list) or not interests:
+            return total_score
+        
+        # Accumulate in the student's interest order (repeats count twice)
+        event_scores = self.interest_scores[rows]
+        for interest in interests:
+            if interest in self.interest_columns:
+                total_score += event_scores[:, self.interest_columns[interest]]
+        
+        # Average across all interests
+        return total_score / len(interests)
+    
     def _get_attended_events(self, student_uid):
         """Get events student attended (not just registered)"""
-        if len(self.registrations_df) == 0:
-            return set()
-        
-        attended = self.registrations_df[
-            (self.registrations_df['studentUid'] == student_uid) &
-            (self.registrations_df['attended'] == True)
-        ]
-        return set(attended['eventId'].values)
+        return self.registration_index.get(student_uid, (set(), set()))[1]
     
     def _get_registered_events(self, student_uid):
         """Get all events student registered for"""
-        if len(self.registrations_df) == 0:
-            return set()
-        
-        registered = self.registrations_df[
-            self.registrations_df['studentUid'] == student_uid
-        ]
-        return set(registered['eventId'].values)
+        return self.registration_index.get(student_uid, (set(), set()))[0]
     
     def _calculate_content_similarity(self, event_id1, event_id2):
         """Calculate similarity between two events"""
         try:
-            idx1 = self.events_df[self.events_df['eventId'] == event_id1].index[0]
-            idx2 = self.events_df[self.events_df['eventId'] == event_id2].index[0]
+            idx1 = self.event_index[event_id1]
+            idx2 = self.event_index[event_id2]
             
             return cosine_similarity(
                 self.event_vectors[idx1],
@@ -256,24 +1569,88 @@ class ClubHubRecommender:
     
     def _is_upcoming(self, event_id):
         """Check if event is upcoming"""
-        event = self.events_df[self.events_df['eventId'] == event_id]
-        if len(event) == 0:
+        if event_id not in self.event_index:
             return False
         
-        event_row = event.iloc[0]
-        event_date = event_row.get('eventDate')
+        start = self.event_starts[self.event_index[event_id]]
+        return not np.isnat(start) and start > np.datetime64(datetime.now(), 'ns')
+    
+    def _get_upcoming_rows(self):
+        """Row positions of upcoming events, in events_df order"""
+        now = np.datetime64(datetime.now(), 'ns')
+        cutoff = np.searchsorted(self._schedule_starts, now, side='right')
         
-        # Check if event date is valid and upcoming
-        if pd.isna(event_date) or event_date is None:
-            return False
-            
-        try:
-            return (
-                event_date > datetime.now() and
-                not event_row.get('isCompleted', False)
-            )
-        except (TypeError, AttributeError):
-            return False
+        # Only re-slice when an event has started since the last call
+        cache = self._upcoming_cache
+        if cache is None or cache[0] != cutoff:
+            cache = (cutoff, np.sort(self._schedule_rows[cutoff:]))
+            self._upcoming_cache = cache
+        return cache[1]
+    
+    def _score_candidates(self, candidate_idx, attended_events, interests):
+        """
+        Score candidate event rows for one student
+        
+        Computes the attended-event similarity for all candidates with a single
+        sparse product against the attended rows of event_vectors, then blends
+        it with the interest and popularity columns.
+        """
+        # 1. Interest match score
+        with stage_seconds.time('recommend.interest_scores'):
+            interest_scores = self._get_interest_match_scores(candidate_idx, interests)
+        
+        # 2. Popularity boost
+        popularity_boost = self.popularity_scores[candidate_idx] * 0.1
+        
+        if len(attended_events) == 0:
+            # New user: 95% interest + 5% popularity
+            return (interest_scores * 0.95) + popularity_boost
+        
+        # 3. Similarity to attended events (unknown attended ids count as 0.0)
+        attended_idx = [
+            self.event_index[event_id]
+            for event_id in attended_events
+            if event_id in self.event_index
+        ]
+        if len(attended_idx) > 0:
+            with stage_seconds.time('recommend.attended_similarity'):
+                attended_similarity = self._attended_similarity(candidate_idx, attended_idx).max(axis=1)
+        else:
+            attended_similarity = np.zeros(len(candidate_idx))
+        
+        # Blend: 60% attended similarity + 40% interest
+        return (
+            (attended_similarity * 0.6) +
+            (interest_scores * 0.4) +
+            popularity_boost
+        )
+    
+    def _attended_similarity(self, candidate_idx, attended_idx):
+        """
+        candidates x attended events cosine similarity
+        
+        Exact for normal catalogs. From NEIGHBOUR_SCORING_MIN_EVENTS events on,
+        it is read from the attended events' neighbour lists, and candidates
+        outside those lists count as 0.0.
+        """
+        if len(self.event_ids) >= self.NEIGHBOUR_SCORING_MIN_EVENTS:
+            return self.event_neighbours[attended_idx][:, candidate_idx].T.toarray()
+        return cosine_similarity(self.event_vectors[candidate_idx], self.event_vectors[attended_idx])
+    
+    def get_stats(self, include_upcoming=True):
+        """Row counts (and upcoming events) for /api/stats"""
+        if self.snapshot_counts is not None:
+            stats = dict(self.snapshot_counts)
+        else:
+            stats = {
+                'total_students': len(self.students_df),
+                'total_events': len(self.events_df),
+                'total_clubs': len(self.clubs_df),
+                'total_registrations': len(self.registrations_df),
+            }
+        if include_upcoming:
+            stats['upcoming_events'] = len(self._get_upcoming_rows())
+        return stats
     
     def recommend(self, student_uid, top_n=5):
         """
@@ -286,96 +1663,257 @@ class ClubHubRecommender:
         4. Blend: 60% attended-event similarity + 40% interest match
         """
         
-        if student_uid not in self.students_df['uid'].values:
-            return {
-                'studentUid': student_uid,
-                'type': 'error',
-                'message': 'Student not found',
-                'recommendations': []
-            }
+        with stage_seconds.time('recommend.profile'):
+            profile = self._student_profile(student_uid)
+        if profile is None:
+            return self._student_not_found(student_uid)
+        student, interests, registered_events, attended_events = profile
         
-        student = self.students_df[self.students_df['uid'] == student_uid].iloc[0]
-        interests = student.get('fieldOfInterest', [])
+        # Get upcoming events only, excluding registered ones
+        with stage_seconds.time('recommend.candidates'):
+            candidate_idx = np.array([
+                pos for pos in self._get_upcoming_rows()
+                if self.event_ids[pos] not in registered_events
+            ], dtype=int)
         
-        # Ensure interests is a list (handle NaN or invalid data)
-        if not isinstance(interests, list):
-            interests = []
+        if len(candidate_idx) == 0:
+            return self._no_events_result(student_uid, student, attended_events)
         
-        # Get events to exclude (already registered)
-        registered_events = self._get_registered_events(student_uid)
-        attended_events = self._get_attended_events(student_uid)
+        # Score every candidate in one vectorized pass (events_df order keeps ties stable)
+        scores = self._score_candidates(candidate_idx, attended_events, interests)
         
-        # Get upcoming events only
-        upcoming_events = self.events_df[
-            self.events_df['eventId'].apply(self._is_upcoming)
-        ]['eventId'].values
+        # Top n by score, without sorting the other candidates
+        with stage_seconds.time('recommend.ranking'):
+            top_events = [(candidate_idx[i], scores[i]) for i in self._top_columns(scores, top_n)]
         
-        # Exclude registered events
-        candidate_events = set(upcoming_events) - registered_events
+        with stage_seconds.time('recommend.formatting'):
+            return self._recommendation_result(student_uid, student, interests, attended_events, top_events)
+    
+    def recommend_many(self, student_uids, top_n=5):
+        """
+        Generate recommendations for several students at once
         
-        if len(candidate_events) == 0:
-            return {
-                'studentUid': student_uid,
-                'studentName': student.get('fullName', 'Unknown'),
-                'type': 'no_events',
-                'hasAttendedEvents': len(attended_events) > 0,
-                'recommendations': []
-            }
+        Returns one result per uid, in order, identical to recommend(uid, top_n).
+        """
+        with stage_seconds.time('recommend_many.ranking'):
+            ranked = self._rank_many(student_uids, top_n)
         
-        # Calculate scores for each candidate event
-        event_scores = {}
+        results = []
+        for student_uid, (profile, top_events) in zip(student_uids, ranked):
+            if profile is None:
+                results.append(self._student_not_found(student_uid))
+                continue
+            
+            student, interests, registered_events, attended_events = profile
+            if top_events is None:
+                results.append(self._no_events_result(student_uid, student, attended_events))
+            else:
+                results.append(self._recommendation_result(
+                    student_uid, student, interests, attended_events, top_events
+                ))
+        return results
+    
+    def _rank_many(self, student_uids, top_n):
+        """
+        (profile, [(row position, score)]) per uid, ranked as in recommend()
+        
+        profile is None for unknown students and the ranking is None when a
+        student has no candidate events. The upcoming candidates and their
+        interest/popularity columns are computed once. Each chunk of students is
+        then scored as a students x events matrix against the chunk's attended
+        events (each computed once), with registered events masked out and the
+        top n picked with argpartition.
+        """
+        ranked = [(None, None)] * len(student_uids)
+        profiles = {}
+        for i, student_uid in enumerate(student_uids):
+            profile = self._student_profile(student_uid)
+            if profile is not None:
+                profiles[i] = profile
+                ranked[i] = (profile, None)
         
-        for event_id in candidate_events:
-            event = self.events_df[self.events_df['eventId'] == event_id].iloc[0]
+        upcoming = self._get_upcoming_rows()
+        if len(upcoming) == 0:
+            return ranked
+        
+        # Candidate columns per eventId (a duplicated id masks all of its rows)
+        candidate_columns = defaultdict(list)
+        for column, pos in enumerate(upcoming):
+            candidate_columns[self.event_ids[pos]].append(column)
+        
+        candidate_interest_scores = self.interest_scores[upcoming].T
+        popularity_boost = self.popularity_scores[upcoming] * 0.1
+        
+        batch = list(profiles)
+        for start in range(0, len(batch), self.BATCH_CHUNK_SIZE):
+            chunk = batch[start:start + self.BATCH_CHUNK_SIZE]
+            chunk_profiles = [profiles[i] for i in chunk]
             
-            # 1. Interest match score
-            interest_score = self._get_interest_match_score(
-                event['searchable_content'], 
-                interests
+            # Similarity of every candidate to every attended event in the chunk
+            attended_columns = {}
+            for student, interests, registered_events, attended_events in chunk_profiles:
+                for event_id in attended_events:
+                    if event_id in self.event_index:
+                        attended_columns.setdefault(self.event_index[event_id], len(attended_columns))
+            attended_similarity = (
+                self._attended_similarity(upcoming, list(attended_columns))
+                if attended_columns else np.zeros((len(upcoming), 0))
             )
             
-            # 2. Similarity to attended events
-            attended_similarity = 0.0
-            if len(attended_events) > 0:
-                similarities = []
-                for attended_id in attended_events:
-                    sim = self._calculate_content_similarity(event_id, attended_id)
-                    similarities.append(sim)
-                attended_similarity = max(similarities) if similarities else 0.0
-            
-            # 3. Popularity boost
-            popularity_boost = event.get('popularity_score', 0) * 0.1
+            scores = self._score_batch(
+                chunk_profiles, candidate_interest_scores, popularity_boost,
+                attended_similarity, attended_columns
+            )
             
-            # Final score calculation
-            if len(attended_events) > 0:
-                # Blend: 60% attended similarity + 40% interest
-                final_score = (
-                    (attended_similarity * 0.6) +
-                    (interest_score * 0.4) +
-                    popularity_boost
-                )
-            else:
-                # New user: 95% interest + 5% popularity
-                final_score = (interest_score * 0.95) + popularity_boost
+            # Mask registered events
+            for row, (student, interests, registered_events, attended_events) in enumerate(chunk_profiles):
+                for event_id in registered_events:
+                    scores[row, candidate_columns.get(event_id, [])] = -np.inf
             
-            event_scores[event_id] = final_score
+            for row, i in enumerate(chunk):
+                top_columns = self._top_columns(scores[row], top_n)
+                if top_columns is not None:
+                    top_events = [(upcoming[column], scores[row, column]) for column in top_columns]
+                    ranked[i] = (profiles[i], top_events)
         
-        # Sort by score
-        sorted_events = sorted(event_scores.items(), key=lambda x: x[1], reverse=True)
-        top_events = sorted_events[:top_n]
+        return ranked
+    
+    def recommend_precomputed(self, table, student_uid, top_n=5):
+        """
+        recommend() answered from a precomputed RecommendationTable, or None
         
-        # Format recommendations
-        recommendations = []
-        for event_id, score in top_events:
-            event = self.events_df[self.events_df['eventId'] == event_id].iloc[0]
-            recommendations.append({
-                'eventId': event_id,
-                'eventName': event['eventName'],
-                'clubName': event['clubName'],
-                'clubCategory': event['clubCategory'],
-                'eventDescription': event['eventDescription'][:150] + '...' if len(event['eventDescription']) > 150 else event['eventDescription'],
-                'score': round(float(score), 4)
-            })
+        Entries for events that have started, disappeared or been registered
+        for since the table was written are skipped. Returns None (compute it
+        live instead) when the student isn't in the table, fewer than top_n
+        entries are left, or the student's profile or registrations may have
+        changed since their row was computed: this model's data is newer than
+        the row, or the student changed after it.
+        """
+        entries = table.get(student_uid)
+        profile = self._student_profile(student_uid)
+        if entries is None or profile is None:
+            return None
+        if self.student_changed_at.get(student_uid, self.built_at) > table.built_at(student_uid):
+            return None
+        
+        student, interests, registered_events, attended_events = profile
+        top_events = []
+        for event_id, score in entries:
+            if len(top_events) == top_n:
+                break
+            if event_id not in registered_events and self._is_upcoming(event_id):
+                top_events.append((self.event_index[event_id], score))
+        
+        if len(top_events) < top_n:
+            return None
+        return self._recommendation_result(student_uid, student, interests, attended_events, top_events)
+    
+    def _score_batch(self, profiles, candidate_interest_scores, popularity_boost,
+                     attended_similarity, attended_columns):
+        """
+        Students x candidates score matrix, blended the same way as _score_candidates
+        
+        Interest scores are accumulated one interest position at a time so every
+        student's sum runs in the same order as in _get_interest_match_scores.
+        """
+        n_students, n_candidates = len(profiles), len(popularity_boost)
+        
+        # 1. Interest match score
+        interest_scores = np.zeros((n_students, n_candidates))
+        max_interests = max((len(profile[1]) for profile in profiles), default=0)
+        for k in range(max_interests):
+            rows = []
+            columns = []
+            for row, (student, interests, registered_events, attended_events) in enumerate(profiles):
+                if k < len(interests) and interests[k] in self.interest_columns:
+                    rows.append(row)
+                    columns.append(self.interest_columns[interests[k]])
+            interest_scores[rows] += candidate_interest_scores[columns]
+        
+        n_interests = np.array([len(profile[1]) for profile in profiles], dtype=float)
+        has_interests = n_interests > 0
+        interest_scores[has_interests] /= n_interests[has_interests, None]
+        
+        # 3. Similarity to attended events: max over each student's attended columns
+        similarity = np.zeros((n_students, n_candidates))
+        hybrid = np.zeros(n_students, dtype=bool)
+        for row, (student, interests, registered_events, attended_events) in enumerate(profiles):
+            if len(attended_events) == 0:
+                continue
+            hybrid[row] = True
+            columns = [
+                attended_columns[self.event_index[event_id]]
+                for event_id in attended_events
+                if event_id in self.event_index
+            ]
+            if columns:
+                similarity[row] = attended_similarity[:, columns].max(axis=1)
+        
+        # New users: 95% interest + 5% popularity; others: 60% similarity + 40% interest
+        return np.where(
+            hybrid[:, None],
+            (similarity * 0.6) + (interest_scores * 0.4) + popularity_boost,
+            (interest_scores * 0.95) + popularity_boost
+        )
+    
+    @staticmethod
+    def _top_columns(scores, top_n):
+        """
+        Columns of the top_n finite scores, best first, ties in column order
+        
+        Returns None if every column is masked.
+        """
+        n_valid = int(np.isfinite(scores).sum())
+        if n_valid == 0:
+            return None
+        
+        k = min(n_valid, top_n)
+        if k <= 0:
+            return []
+        
+        # argpartition finds the k-th best score; keep everything at least that good
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        selected = np.flatnonzero(scores >= kth)
+        return selected[np.argsort(-scores[selected], kind='stable')][:k]
+    
+    def _student_profile(self, student_uid):
+        """(student, interests, registered eventIds, attended eventIds), or None if unknown"""
+        if student_uid not in self.student_index:
+            return None
+        
+        student = self.student_index[student_uid]
+        interests = student.get('fieldOfInterest', [])
+        
+        # Ensure interests is a list (handle NaN or invalid data)
+        if not isinstance(interests, list):
+            interests = []
+        
+        # Get events to exclude (already registered)
+        registered_events, attended_events = self.registration_index.get(student_uid, (set(), set()))
+        return student, interests, registered_events, attended_events
+    
+    @staticmethod
+    def _student_not_found(student_uid):
+        return {
+            'studentUid': student_uid,
+            'type': 'error',
+            'message': 'Student not found',
+            'recommendations': []
+        }
+    
+    @staticmethod
+    def _no_events_result(student_uid, student, attended_events):
+        return {
+            'studentUid': student_uid,
+            'studentName': student.get('fullName', 'Unknown'),
+            'type': 'no_events',
+            'hasAttendedEvents': len(attended_events) > 0,
+            'recommendations': []
+        }
+    
+    def _recommendation_result(self, student_uid, student, interests, attended_events, top_events):
+        """Format (row position, score) pairs as a recommendation response"""
+        recommendations = [self._format_event(pos, score) for pos, score in top_events]
         
         return {
             'studentUid': student_uid,
@@ -386,10 +1924,224 @@ class ClubHubRecommender:
             'attendedCount': len(attended_events),
             'recommendations': recommendations
         }
+    
+    def _format_event(self, pos, score):
+        """An event row as it appears in API responses, read from event_columns"""
+        columns = self.event_columns
+        return {
+            'eventId': columns['eventId'][pos],
+            'eventName': columns['eventName'][pos],
+            'clubName': columns['clubName'][pos],
+            'clubCategory': columns['clubCategory'][pos],
+            'eventDescription': columns['eventDescription'][pos],
+            'score': round(float(score), 4)
+        }
+    
+    def similar_events(self, event_id, top_n=5, upcoming_only=True):
+        """
+        Events most similar to event_id ("more like this"), from the neighbour index
+        
+        With upcoming_only, events that have started or are completed are skipped.
+        """
+        if event_id not in self.event_index:
+            return {
+                'eventId': event_id,
+                'type': 'error',
+                'message': 'Event not found',
+                'similar': []
+            }
+        
+        neighbours = self.event_neighbours[self.event_index[event_id]]
+        order = np.lexsort((neighbours.indices, -neighbours.data))
+        now = np.datetime64(datetime.now(), 'ns')
+        
+        similar = []
+        for pos, score in zip(neighbours.indices[order], neighbours.data[order]):
+            if len(similar) >= top_n:
+                break
+            if self.event_ids[pos] == event_id:
+                continue
+            if upcoming_only and (np.isnat(self.event_starts[pos]) or self.event_starts[pos] <= now):
+                continue
+            similar.append(self._format_event(pos, score))
+        
+        return {
+            'eventId': event_id,
+            'eventName': self.event_columns['eventName'][self.event_index[event_id]],
+            'similar': similar
+        }
+    
+    def recommend_clubs(self, student_uid, top_n=5):
+        """
+        Rank clubs for a student against the club centroids
+        
+        The student's profile is one vector over the club_features columns:
+        the normalised mean of their attended events' TF-IDF rows (60%) and
+        their interests (40%; 95% with nothing attended), blended like
+        recommend(). Every club is scored with one product against it, plus
+        10% for the club's share of registrations.
+        """
+        profile = self._student_profile(student_uid)
+        if profile is None:
+            return {
+                'studentUid': student_uid,
+                'type': 'error',
+                'message': 'Student not found',
+                'clubs': []
+            }
+        student, interests, registered_events, attended_events = profile
+        
+        if self.club_features is None or len(self.club_features) == 0:
+            return {
+                'studentUid': student_uid,
+                'studentName': student.get('fullName', 'Unknown'),
+                'type': 'no_clubs',
+                'clubs': []
+            }
+        
+        n_terms = self.event_vectors.shape[1]
+        weights = np.zeros(self.club_features.shape[1])
+        for interest in interests:
+            if interest in self.interest_columns:
+                weights[n_terms + self.interest_columns[interest]] += 1 / len(interests)
+        
+        attended_idx = [
+            self.event_index[event_id]
+            for event_id in attended_events
+            if event_id in self.event_index
+        ]
+        if len(attended_events) > 0:
+            if attended_idx:
+                centroid = normalize(csr_matrix(self.event_vectors[attended_idx].mean(axis=0)))
+                weights[:n_terms] = centroid.toarray().ravel() * 0.6
+            weights[n_terms:] *= 0.4
+        else:
+            weights[n_terms:] *= 0.95
+        
+        scores = self.club_features @ weights
+        club_popularity = self.club_events @ self.popularity_counts
+        max_popularity = club_popularity.max()
+        if max_popularity > 0:
+            scores += club_popularity / max_popularity * 0.1
+        
+        columns = self.club_columns
+        clubs = [
+            {
+                'clubId': columns['clubId'][pos],
+                'clubName': columns['clubName'][pos],
+                'clubCategory': columns['clubCategory'][pos],
+                'score': round(float(scores[pos]), 4)
+            }
+            for pos in self._top_columns(scores, top_n)
+        ]
+        
+        return {
+            'studentUid': student_uid,
+            'studentName': student.get('fullName', 'Unknown'),
+            'type': 'hybrid' if len(attended_events) > 0 else 'interest-based',
+            'clubs': clubs
+        }
+
+
+_worker_recommender = None
+
+
+def _init_precompute_worker(snapshot_dir, version):
+    """Process pool initializer: map the model snapshot once per worker"""
+    global _worker_recommender
+    _worker_recommender = ClubHubRecommender.from_snapshot(snapshot_dir, version)
+
+
+def _precompute_shard(student_uids, top_k):
+    """Top-k (eventId, score) lists for one shard of students, with the time of the data they come from"""
+    rows = []
+    for student_uid, (profile, top_events) in zip(
+        student_uids, _worker_recommender._rank_many(student_uids, top_k)
+    ):
+        entries = [(_worker_recommender.event_ids[pos], score) for pos, score in top_events or []]
+        rows.append((student_uid, entries, _worker_recommender.built_at))
+    return rows
+
+
+def precompute_all(table_dir, snapshot_dir=None, firebase_cred_path=None,
+                   top_k=30, workers=None, shard_size=1000):
+    """
+    Precompute top-k recommendations for every student and publish them as a table
+    
+    Uses the model snapshot in snapshot_dir if one is published, otherwise
+    builds the model from Firestore and snapshots it (to a temporary directory
+    if snapshot_dir isn't given). Students are sharded across a process pool
+    whose workers map that snapshot. Returns the table version.
+    """
+    started = time.perf_counter()
+    temp_dir = None
+    
+    if snapshot_dir and model_snapshot.current_version(snapshot_dir):
+        recommender = ClubHubRecommender.from_snapshot(snapshot_dir)
+        print(f"✅ Using model snapshot {recommender.snapshot_version}")
+    else:
+        recommender = ClubHubRecommender(firebase_cred_path)
+        if not snapshot_dir:
+            temp_dir = tempfile.mkdtemp(prefix='clubhub-model-')
+            snapshot_dir = temp_dir
+        recommender.save_snapshot(snapshot_dir)
+    
+    try:
+        student_uids = list(recommender.student_index)
+        shards = [
+            student_uids[start:start + shard_size]
+            for start in range(0, len(student_uids), shard_size)
+        ]
+        print(f"🧮 Precomputing top {top_k} for {len(student_uids)} students in {len(shards)} shards...")
+        
+        # spawn: workers map the snapshot instead of inheriting Firestore client threads
+        rows = []
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_precompute_worker,
+            initargs=(snapshot_dir, recommender.snapshot_version)
+        ) as pool:
+            for shard_rows in pool.map(_precompute_shard, shards, [top_k] * len(shards)):
+                rows.extend(shard_rows)
+        
+        version = model_snapshot.save_recommendation_table(
+            table_dir, rows, top_k, model_version=recommender.snapshot_version
+        )
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    print(f"✅ Published recommendation table {version} ({time.perf_counter() - started:.1f}s)")
+    return version
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='ClubHub event recommender')
+    subparsers = parser.add_subparsers(dest='command')
+    
+    precompute = subparsers.add_parser(
+        'precompute', help='Write top-k recommendations for every student to a table'
+    )
+    precompute.add_argument('table_dir', help='Directory to publish the table in')
+    precompute.add_argument('--snapshot-dir', help='Model snapshot to use (built from Firestore if empty)')
+    precompute.add_argument('--cred', default='serviceAccountKey.json', help='Firebase service account key')
+    precompute.add_argument('--top-k', type=int, default=30, help='Recommendations kept per student')
+    precompute.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    precompute.add_argument('--shard-size', type=int, default=1000, help='Students per worker task')
+    return parser.parse_args()
 
 
 # Example usage
 if __name__ == "__main__":
+    args = _parse_args()
+    if args.command == 'precompute':
+        precompute_all(
+            args.table_dir, snapshot_dir=args.snapshot_dir, firebase_cred_path=args.cred,
+            top_k=args.top_k, workers=args.workers, shard_size=args.shard_size
+        )
+        exit(0)
+    
     # Initialize
     recommender = ClubHubRecommender('serviceAccountKey.json')
     
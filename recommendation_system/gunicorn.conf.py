@@ -0,0 +1,27 @@
+"""
+gunicorn.conf.py
+gunicorn settings for the recommendation API
+
+    gunicorn -c gunicorn.conf.py 'api:create_app()'
+
+With GUNICORN_PRELOAD=true the master process imports the app and loads the
+model before forking the workers, so they share its pages copy-on-write
+instead of each loading its own copy. Threads (Firestore listeners, the
+snapshot reconcile job) are only started in the workers, after the fork.
+"""
+
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+if preload_app:
+    # Read by api.create_app() when the master loads it
+    os.environ.setdefault('API_WARM_UP', 'preload')
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import api
+        api.start_background_work()
@@ -0,0 +1,116 @@
+"""
+metrics.py
+Low-overhead timing histograms, rendered in the Prometheus text format
+"""
+
+from bisect import bisect_left
+import threading
+import time
+
+
+# Upper bounds in seconds, from sub-millisecond request stages to full model builds
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'started')
+    
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+class Histogram:
+    """
+    Thread-safe histogram of durations, one series per combination of label values
+    
+    observe() only bumps one bucket; counts are made cumulative when rendered.
+    """
+    
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, seconds, *label_values):
+        slot = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][slot] += 1
+            series[1] += seconds
+    
+    def time(self, *label_values):
+        """Context manager that observes the duration of its block"""
+        return _Timer(self, label_values)
+    
+    def summary(self):
+        """label values -> (count, total seconds)"""
+        with self._lock:
+            return {labels: (sum(counts), total) for labels, (counts, total) in self._series.items()}
+    
+    def render(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values in sorted(series, key=lambda values: tuple(map(str, values))):
+            counts, total = series[label_values]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, label_values)} {total!r}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, label_values)} {cumulative}')
+        return lines
+
+
+def render_values(name, documentation, kind, samples, label_names=()):
+    """
+    Text-format lines for a gauge or counter
+    
+    samples is a number, or {label values tuple: number} with label_names.
+    """
+    if not isinstance(samples, dict):
+        samples = {(): samples}
+    
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}']
+    for label_values, value in samples.items():
+        if value is None:
+            continue
+        lines.append(f'{name}{_labels(label_names, label_values)} {float(value)!r}')
+    return lines
+
+
+# Durations of model build, startup and recommendation stages (rendered at /metrics)
+stage_seconds = Histogram(
+    'clubhub_stage_seconds', 'Time spent in each model build and recommendation stage', ('stage',)
+)
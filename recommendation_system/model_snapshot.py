@@ -0,0 +1,581 @@
+"""
+model_snapshot.py
+Versioned on-disk snapshots of a built ClubHubRecommender, and of
+precomputed recommendation tables
+
+A snapshot is a directory of .npy arrays plus meta.json. Arrays are
+memory-mapped read-only on load, so every worker serving the same snapshot
+shares one physical copy of its pages. Snapshots live in versioned
+subdirectories of a root directory; the CURRENT file names the one to serve.
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+FORMAT_VERSION = 8
+KEEP_VERSIONS = 3
+CURRENT_FILE = 'CURRENT'
+
+# Event columns the recommendation formatter and trending read (eventDescription as its snippet)
+EVENT_COLUMNS = ['eventId', 'eventName', 'clubId', 'clubName', 'clubCategory', 'eventDescription']
+# Club columns recommend_clubs returns
+CLUB_COLUMNS = ['clubId', 'clubName', 'clubCategory']
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _save_array(directory, name, array):
+    np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array))
+
+
+def _save_csr(directory, name, matrix):
+    _save_array(directory, f'{name}.data', matrix.data)
+    _save_array(directory, f'{name}.indices', matrix.indices)
+    _save_array(directory, f'{name}.indptr', matrix.indptr)
+
+
+def _load_csr(directory, name, shape):
+    return csr_matrix(
+        tuple(_load_array(directory, f'{name}.{part}') for part in ('data', 'indices', 'indptr')),
+        shape=shape
+    )
+
+
+def _load_array(directory, name):
+    array = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+    # Empty arrays can't be mapped and come back as plain arrays; keep them read-only too
+    if isinstance(array, np.ndarray) and array.flags.writeable:
+        array.flags.writeable = False
+    return array
+
+
+class StringColumn:
+    """Read-only column of optional strings stored as UTF-8 bytes plus offsets"""
+    
+    def __init__(self, data, offsets, nulls):
+        self.data = data
+        self.offsets = offsets
+        self.nulls = nulls
+    
+    def __len__(self):
+        return len(self.nulls)
+    
+    def __getitem__(self, pos):
+        if self.nulls[pos]:
+            return None
+        return bytes(self.data[self.offsets[pos]:self.offsets[pos + 1]]).decode('utf-8')
+    
+    def __iter__(self):
+        return (self[pos] for pos in range(len(self)))
+    
+    @staticmethod
+    def save(directory, name, values):
+        encoded = [None if _is_missing(value) else str(value).encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(value) if value is not None else 0 for value in encoded])
+        
+        _save_array(directory, f'{name}.data', np.frombuffer(
+            b''.join(value for value in encoded if value is not None), dtype=np.uint8
+        ))
+        _save_array(directory, f'{name}.offsets', offsets)
+        _save_array(directory, f'{name}.nulls', np.array([value is None for value in encoded], dtype=bool))
+    
+    @classmethod
+    def load(cls, directory, name):
+        return cls(*(_load_array(directory, f'{name}.{part}') for part in ('data', 'offsets', 'nulls')))
+
+
+class StudentTable:
+    """uid -> student record, read from the snapshot's student columns"""
+    
+    def __init__(self, uids, names, interest_offsets, interests):
+        self.names = names
+        self.interest_offsets = interest_offsets
+        self.interests = interests
+        self.rows = {}
+        for pos, uid in enumerate(uids):
+            self.rows.setdefault(uid, pos)
+    
+    def __contains__(self, uid):
+        return uid in self.rows
+    
+    def __iter__(self):
+        return iter(self.rows)
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    def __getitem__(self, uid):
+        pos = self.rows[uid]
+        start, end = self.interest_offsets[pos], self.interest_offsets[pos + 1]
+        record = {
+            'uid': uid,
+            'fieldOfInterest': [self.interests[i] for i in range(start, end)]
+        }
+        if self.names[pos] is not None:
+            record['fullName'] = self.names[pos]
+        return record
+    
+    def get(self, uid, default=None):
+        return self[uid] if uid in self.rows else default
+
+
+class RegistrationTable:
+    """
+    studentUid -> (registered eventIds, attended eventIds), stored CSR-style per student
+    
+    set() replaces one student's entry without touching the arrays, for
+    registrations applied as they happen.
+    """
+    
+    def __init__(self, student_rows, indptr, codes, attended, event_ids):
+        self.student_rows = student_rows
+        self.indptr = indptr
+        self.codes = codes
+        self.attended = attended
+        self.event_ids = event_ids
+        self.overrides = {}
+    
+    def set(self, uid, registered, attended):
+        self.overrides[uid] = (registered, attended)
+    
+    def get(self, uid, default=None):
+        if uid in self.overrides:
+            return self.overrides[uid]
+        
+        pos = self.student_rows.get(uid)
+        if pos is None or self.indptr[pos] == self.indptr[pos + 1]:
+            return default
+        
+        start, end = self.indptr[pos], self.indptr[pos + 1]
+        event_ids = [self.event_ids[code] for code in self.codes[start:end].tolist()]
+        attended = self.attended[start:end].tolist()
+        return set(event_ids), {event_id for event_id, was_attended in zip(event_ids, attended) if was_attended}
+
+
+class RegistrationRecords:
+    """
+    registrationId -> (studentUid, eventId, attended, registeredAt), so
+    registration changes can undo what a snapshot-loaded model already counts
+    
+    Rows are sorted by registrationId and found by binary search, so loading
+    builds nothing per registration. Ids that appear more than once give None,
+    as they do on a model with registrations_df.
+    """
+    
+    def __init__(self, ids, student_uids, event_ids, attended, registered_at):
+        self.ids = ids
+        self.student_uids = student_uids
+        self.event_ids = event_ids
+        self.attended = attended
+        self.registered_at = registered_at
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def _find(self, registration_id):
+        """Row of registration_id, or None if it is missing or not unique"""
+        low, high = 0, len(self.ids)
+        while low < high:
+            mid = (low + high) // 2
+            if self.ids[mid] < registration_id:
+                low = mid + 1
+            else:
+                high = mid
+        if low == len(self.ids) or self.ids[low] != registration_id:
+            return None
+        if low + 1 < len(self.ids) and self.ids[low + 1] == registration_id:
+            return None
+        return low
+    
+    def get(self, registration_id, default=None):
+        pos = self._find(registration_id)
+        if pos is None:
+            return default
+        registered_at = float(self.registered_at[pos])
+        return (
+            self.student_uids[pos], self.event_ids[pos], bool(self.attended[pos]),
+            None if np.isnan(registered_at) else registered_at
+        )
+    
+    def columns(self):
+        """ids, studentUids, eventIds, attended and registeredAt as arrays, for saving again"""
+        return (
+            np.array(list(self.ids), dtype=object),
+            np.array(list(self.student_uids), dtype=object),
+            np.array(list(self.event_ids), dtype=object),
+            np.asarray(self.attended, dtype=bool),
+            np.asarray(self.registered_at, dtype=float)
+        )
+    
+    @staticmethod
+    def save(directory, ids, student_uids, event_ids, attended, registered_at):
+        order = np.argsort(np.asarray(ids, dtype=str), kind='stable')
+        StringColumn.save(directory, 'registrations.ids', ids[order])
+        StringColumn.save(directory, 'registrations.studentUid', student_uids[order])
+        StringColumn.save(directory, 'registrations.eventId', event_ids[order])
+        _save_array(directory, 'registrations.attended_flags', attended[order])
+        _save_array(directory, 'registrations.registeredAt', registered_at[order])
+    
+    @classmethod
+    def load(cls, directory):
+        return cls(
+            StringColumn.load(directory, 'registrations.ids'),
+            StringColumn.load(directory, 'registrations.studentUid'),
+            StringColumn.load(directory, 'registrations.eventId'),
+            _load_array(directory, 'registrations.attended_flags'),
+            _load_array(directory, 'registrations.registeredAt')
+        )
+
+
+def current_version(root):
+    """Version named by root/CURRENT, or None if nothing was published yet"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _start_version(root):
+    """New version name and the staging directory to write it in"""
+    os.makedirs(root, exist_ok=True)
+    version = time.strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:8]
+    staging = os.path.join(root, f'.{version}.tmp')
+    os.makedirs(staging)
+    return version, staging
+
+
+def _publish_version(root, staging, version, meta):
+    """
+    Write meta.json, move staging into place and make it the CURRENT version
+    
+    The version directory is renamed into place and CURRENT is replaced
+    atomically, so readers never see a partial snapshot.
+    """
+    with open(os.path.join(staging, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    
+    os.rename(staging, os.path.join(root, version))
+    current_tmp = os.path.join(root, f'.{CURRENT_FILE}.{version}.tmp')
+    with open(current_tmp, 'w') as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+    
+    _prune(root, version)
+
+
+def save_snapshot(recommender, root):
+    """
+    Write recommender's model as a new snapshot version and make it current
+    
+    Returns the new version and its creation time.
+    """
+    version, staging = _start_version(root)
+    
+    # TF-IDF matrix as CSR arrays
+    n_events = len(recommender.event_ids)
+    if n_events > 0:
+        vectors = recommender.event_vectors.tocsr()
+        vectors.sort_indices()
+        neighbours = recommender.event_neighbours.tocsr()
+        interest_scores = recommender.interest_scores
+        popularity_counts = recommender.popularity_counts
+    else:
+        vectors = csr_matrix((0, 0))
+        neighbours = csr_matrix((0, 0))
+        interest_scores = np.zeros((0, len(recommender.interest_names)))
+        popularity_counts = np.zeros(0)
+    _save_csr(staging, 'event_vectors', vectors)
+    _save_csr(staging, 'event_neighbours', neighbours)
+    
+    # Event metadata, columnar
+    _save_array(staging, 'interest_scores', interest_scores)
+    _save_array(staging, 'popularity_counts', popularity_counts)
+    _save_array(staging, 'event_starts', recommender.event_starts)
+    _save_array(staging, 'schedule_rows', recommender._schedule_rows)
+    _save_array(staging, 'schedule_starts', recommender._schedule_starts)
+    for column in EVENT_COLUMNS:
+        StringColumn.save(staging, f'events.{column}', recommender.event_columns[column])
+    
+    # Club centroids (dense) and club -> event membership
+    if recommender.club_features is not None:
+        club_features = recommender.club_features
+        club_events = recommender.club_events.tocsr()
+        club_columns = recommender.club_columns
+    else:
+        club_features = np.zeros((0, 0))
+        club_events = csr_matrix((0, n_events))
+        club_columns = {column: [] for column in CLUB_COLUMNS}
+    _save_array(staging, 'club_features', club_features)
+    _save_csr(staging, 'club_events', club_events)
+    for column in CLUB_COLUMNS:
+        StringColumn.save(staging, f'clubs.{column}', club_columns[column])
+    
+    # Students, with interests flattened CSR-style
+    uids = list(recommender.student_index)
+    records = [recommender.student_index[uid] for uid in uids]
+    interests = [
+        record.get('fieldOfInterest') if isinstance(record.get('fieldOfInterest'), list) else []
+        for record in records
+    ]
+    StringColumn.save(staging, 'students.uid', uids)
+    StringColumn.save(staging, 'students.fullName', [record.get('fullName') for record in records])
+    StringColumn.save(staging, 'students.interests', [i for values in interests for i in values])
+    _save_array(staging, 'students.interest_offsets', np.concatenate(
+        [[0], np.cumsum([len(values) for values in interests])]
+    ).astype(np.int64))
+    
+    # Registrations per student: codes into a table of distinct eventIds
+    registration_event_ids = {}
+    indptr = [0]
+    codes = []
+    attended = []
+    for uid in uids:
+        registered_set, attended_set = recommender.registration_index.get(uid, (set(), set()))
+        for event_id in registered_set:
+            codes.append(registration_event_ids.setdefault(event_id, len(registration_event_ids)))
+            attended.append(event_id in attended_set)
+        indptr.append(len(codes))
+    StringColumn.save(staging, 'registrations.event_ids', list(registration_event_ids))
+    _save_array(staging, 'registrations.indptr', np.array(indptr, dtype=np.int64))
+    _save_array(staging, 'registrations.codes', np.array(codes, dtype=np.int32))
+    _save_array(staging, 'registrations.attended', np.array(attended, dtype=bool))
+    # ... and per registration, so changes to them can be applied after loading
+    RegistrationRecords.save(staging, *recommender._registration_columns())
+    
+    created_at = time.time()
+    meta = {
+        'format': FORMAT_VERSION,
+        'version': version,
+        'createdAt': created_at,
+        'vectorShape': list(vectors.shape),
+        'clubEventsShape': list(club_events.shape),
+        'interestNames': recommender.interest_names,
+        'keywords': recommender.keywords,
+        'counts': recommender.get_stats(include_upcoming=False),
+        'trendingOrigin': recommender.trending.origin,
+        'trendingHalfLife': recommender.trending.half_life,
+        'shard': list(recommender.shard) if recommender.shard is not None else None,
+    }
+    _save_array(staging, 'keyword_membership', recommender.keyword_membership)
+    _publish_version(root, staging, version, meta)
+    return version, created_at
+
+
+def _prune(root, current):
+    """Remove all but the newest KEEP_VERSIONS snapshots (mapped pages stay valid)"""
+    versions = sorted(
+        name for name in os.listdir(root)
+        if not name.startswith('.') and name != CURRENT_FILE
+        and os.path.isdir(os.path.join(root, name))
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def read_meta(root, version=None):
+    """meta.json of a snapshot (CURRENT unless a version is given), or None if there is none"""
+    version = version or current_version(root)
+    if not version:
+        return None
+    
+    try:
+        with open(os.path.join(root, version, 'meta.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_snapshot(root, version=None):
+    """
+    Map a snapshot read-only and return the model attributes it holds
+    
+    Loads the CURRENT version unless one is given.
+    """
+    meta = read_meta(root, version)
+    if not meta:
+        raise FileNotFoundError(f'No model snapshot {version or "published"} in {root}')
+    
+    version = meta['version']
+    directory = os.path.join(root, version)
+    if meta['format'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {meta['format']}")
+    
+    event_vectors = _load_csr(directory, 'event_vectors', tuple(meta['vectorShape']))
+    event_columns = {
+        column: StringColumn.load(directory, f'events.{column}')
+        for column in EVENT_COLUMNS
+    }
+    
+    # eventId -> row position (first row wins), rebuilt per process
+    event_ids = np.array(list(event_columns['eventId']), dtype=object)
+    event_index = {}
+    for pos, event_id in enumerate(event_ids):
+        event_index.setdefault(event_id, pos)
+    
+    student_index = StudentTable(
+        StringColumn.load(directory, 'students.uid'),
+        StringColumn.load(directory, 'students.fullName'),
+        _load_array(directory, 'students.interest_offsets'),
+        StringColumn.load(directory, 'students.interests')
+    )
+    registration_index = RegistrationTable(
+        student_index.rows,
+        _load_array(directory, 'registrations.indptr'),
+        _load_array(directory, 'registrations.codes'),
+        _load_array(directory, 'registrations.attended'),
+        StringColumn.load(directory, 'registrations.event_ids')
+    )
+    
+    club_columns = {
+        column: StringColumn.load(directory, f'clubs.{column}')
+        for column in CLUB_COLUMNS
+    }
+    
+    interest_names = meta['interestNames']
+    return {
+        'snapshot_version': version,
+        'snapshot_created_at': meta['createdAt'],
+        'snapshot_counts': meta['counts'],
+        'event_vectors': event_vectors,
+        'event_neighbours': _load_csr(directory, 'event_neighbours', (len(event_ids),) * 2),
+        'event_columns': event_columns,
+        'event_ids': event_ids,
+        'event_index': event_index,
+        'event_starts': _load_array(directory, 'event_starts'),
+        '_schedule_rows': _load_array(directory, 'schedule_rows'),
+        '_schedule_starts': _load_array(directory, 'schedule_starts'),
+        '_upcoming_cache': None,
+        'interest_scores': _load_array(directory, 'interest_scores'),
+        # Copied, since registrations applied live update them in place
+        'popularity_counts': np.array(_load_array(directory, 'popularity_counts')),
+        '_trending_origin': meta['trendingOrigin'],
+        '_trending_half_life': meta['trendingHalfLife'],
+        'shard': tuple(meta['shard']) if meta['shard'] is not None else None,
+        'club_features': _load_array(directory, 'club_features') if len(club_columns['clubId']) > 0 else None,
+        'club_events': _load_csr(directory, 'club_events', tuple(meta['clubEventsShape'])),
+        'club_columns': club_columns,
+        'interest_names': interest_names,
+        'interest_columns': {name: j for j, name in enumerate(interest_names)},
+        'keywords': meta['keywords'],
+        'keyword_membership': _load_array(directory, 'keyword_membership'),
+        'student_index': student_index,
+        'registration_index': registration_index,
+        'registration_records': RegistrationRecords.load(directory),
+    }
+
+
+class RecommendationTable:
+    """
+    uid -> precomputed [(eventId, score)], best first, read from a published table
+    
+    Each row also keeps the built_at time of the model it was computed from,
+    so a serving model can tell whether the student changed since.
+    """
+    
+    def __init__(self, meta, uids, offsets, codes, scores, event_ids, built_at):
+        self.version = meta['version']
+        self.created_at = meta['createdAt']
+        self.top_k = meta['topK']
+        self.offsets = offsets
+        self.codes = codes
+        self.scores = scores
+        self.event_ids = event_ids
+        self.row_built_at = built_at
+        self.rows = {uid: pos for pos, uid in enumerate(uids)}
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    def is_fresh(self, max_age):
+        return time.time() - self.created_at <= max_age
+    
+    def built_at(self, uid):
+        """When the data behind uid's row was read (a model's built_at), or None"""
+        pos = self.rows.get(uid)
+        return None if pos is None else float(self.row_built_at[pos])
+    
+    def get(self, uid, default=None):
+        pos = self.rows.get(uid)
+        if pos is None:
+            return default
+        
+        start, end = self.offsets[pos], self.offsets[pos + 1]
+        return [
+            (self.event_ids[code], float(score))
+            for code, score in zip(self.codes[start:end], self.scores[start:end])
+        ]
+
+
+def save_recommendation_table(root, rows, top_k, model_version=None):
+    """
+    Publish precomputed recommendations as a new table version
+    
+    rows is an iterable of (uid, [(eventId, score), ...], built_at) with each
+    list best first and built_at the time of the model data it came from. Scores are stored as float32 after rounding to the 4 decimals the
+    API returns. Returns the new version.
+    """
+    version, staging = _start_version(root)
+    
+    uids = []
+    built_at = []
+    offsets = [0]
+    codes = []
+    scores = []
+    event_codes = {}
+    for uid, entries, row_built_at in rows:
+        uids.append(uid)
+        built_at.append(row_built_at)
+        for event_id, score in entries:
+            codes.append(event_codes.setdefault(event_id, len(event_codes)))
+            scores.append(round(float(score), 4))
+        offsets.append(len(codes))
+    
+    StringColumn.save(staging, 'uids', uids)
+    StringColumn.save(staging, 'event_ids', list(event_codes))
+    _save_array(staging, 'offsets', np.array(offsets, dtype=np.int64))
+    _save_array(staging, 'codes', np.array(codes, dtype=np.int32))
+    _save_array(staging, 'scores', np.array(scores, dtype=np.float32))
+    _save_array(staging, 'built_at', np.array(built_at, dtype=np.float64))
+    
+    _publish_version(root, staging, version, {
+        'format': FORMAT_VERSION,
+        'kind': 'recommendations',
+        'version': version,
+        'createdAt': time.time(),
+        'topK': top_k,
+        'modelVersion': model_version,
+        'students': len(uids),
+    })
+    return version
+
+
+def load_recommendation_table(root, version=None):
+    """Map a published recommendation table (CURRENT unless a version is given)"""
+    meta = read_meta(root, version)
+    if not meta or meta.get('kind') != 'recommendations':
+        raise FileNotFoundError(f'No recommendation table {version or "published"} in {root}')
+    if meta['format'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported table format {meta['format']}")
+    
+    directory = os.path.join(root, meta['version'])
+    return RecommendationTable(
+        meta,
+        StringColumn.load(directory, 'uids'),
+        _load_array(directory, 'offsets'),
+        _load_array(directory, 'codes'),
+        _load_array(directory, 'scores'),
+        StringColumn.load(directory, 'event_ids'),
+        _load_array(directory, 'built_at')
+    )
@@ -0,0 +1,89 @@
+"""
+request_coalescer.py
+Groups concurrent single-student recommendation requests into batch calls
+"""
+
+import threading
+
+
+class _Group:
+    def __init__(self):
+        self.student_uids = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class RequestCoalescer:
+    """
+    Answers recommend(uid) calls made concurrently from several threads with
+    one recommend_many() call
+    
+    The first caller for a (model, top_n) pair leads a group: it waits up to
+    window seconds for other callers to join (or until max_size have), then
+    scores the whole group with score_many(recommender, student_uids, top_n)
+    while the others wait for their result. A leader that is the only request
+    in flight scores right away, so serial servers pay no extra latency.
+    Results are identical to recommend().
+    """
+    
+    def __init__(self, score_many, window=0.002, max_size=64):
+        self.score_many = score_many
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        self.coalesced = 0
+        self._open = {}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+    
+    def recommend(self, recommender, student_uid, top_n=5):
+        key = (recommender, top_n)
+        with self._lock:
+            self._in_flight += 1
+            group = self._open.get(key)
+            leader = group is None
+            if leader:
+                group = self._open[key] = _Group()
+            position = len(group.student_uids)
+            group.student_uids.append(student_uid)
+            if len(group.student_uids) >= self.max_size:
+                group.full.set()
+            alone = self._in_flight == 1
+        
+        try:
+            if leader:
+                self._run(recommender, key, group, wait=not alone)
+            else:
+                group.done.wait()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        
+        if group.error is not None:
+            raise group.error
+        return group.results[position]
+    
+    def _run(self, recommender, key, group, wait):
+        if wait and self.window > 0:
+            group.full.wait(self.window)
+        with self._lock:
+            # Later callers start a new group
+            if self._open.get(key) is group:
+                del self._open[key]
+            self.batches += 1
+            self.coalesced += len(group.student_uids)
+        
+        try:
+            group.results = self.score_many(recommender, group.student_uids, key[1])
+        except Exception as e:
+            group.error = e
+        finally:
+            group.done.set()
+    
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'requests': self.coalesced,
+        }
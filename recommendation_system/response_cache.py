@@ -0,0 +1,62 @@
+"""
+response_cache.py
+LRU + TTL cache of serialized API responses
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache whose entries expire after ttl seconds
+    
+    Each entry is stored with a token (e.g. a model version); a lookup with a
+    different token drops the entry and misses, so callers invalidate entries
+    just by passing the current token.
+    """
+    
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def get(self, key, token):
+        """Cached value for key if it's unexpired and was stored with token, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_token, expires, value = entry
+                if entry_token == token and expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            
+            self.misses += 1
+            return None
+    
+    def put(self, key, token, value):
+        with self._lock:
+            self._entries[key] = (token, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
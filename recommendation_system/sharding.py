@@ -0,0 +1,141 @@
+"""
+sharding.py
+Students partitioned across recommender nodes by uid hash, and the HTTP
+client the API router uses to reach those nodes
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import http.client
+import json
+import threading
+import zlib
+
+
+def shard_of(student_uid, shard_count):
+    """Shard that owns a student; the same in every process (unlike hash())"""
+    return zlib.crc32(student_uid.encode('utf-8')) % shard_count
+
+
+class ShardClient:
+    """
+    HTTP/1.1 client for a list of shard nodes, given as base URLs in shard order
+    
+    Each thread keeps one keep-alive connection per shard. A request sent on
+    a reused connection that the shard has since closed is retried once on a
+    new one. request_all() sends several requests in parallel.
+    """
+    
+    def __init__(self, urls, timeout=30.0):
+        self.urls = [url.rstrip('/') for url in urls]
+        self.timeout = timeout
+        self._targets = [urlsplit(url) for url in self.urls]
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=8 * len(self.urls), thread_name_prefix='shard')
+    
+    def __len__(self):
+        return len(self.urls)
+    
+    def shard_of(self, student_uid):
+        return shard_of(student_uid, len(self.urls))
+    
+    def _connect(self, shard):
+        target = self._targets[shard]
+        connection_class = http.client.HTTPSConnection if target.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(target.netloc, timeout=self.timeout)
+    
+    def request(self, shard, method, path, body=None, headers=None):
+        """(status, headers, body) of one request to a shard"""
+        connections = self._local.__dict__.setdefault('connections', {})
+        url = self._targets[shard].path + path
+        while True:
+            connection = connections.pop(shard, None)
+            reused = connection is not None
+            if connection is None:
+                connection = self._connect(shard)
+            try:
+                connection.request(method, url, body=body, headers=headers or {})
+                response = connection.getresponse()
+                content = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            connections[shard] = connection
+            return response.status, dict(response.getheaders()), content
+    
+    def request_json(self, shard, method, path, payload):
+        return self.request(
+            shard, method, path, body=json.dumps(payload), headers={'Content-Type': 'application/json'}
+        )
+    
+    def request_all(self, requests):
+        """
+        Run request(shard, method, path, body, headers) for each tuple in parallel
+        
+        Returns one result per request, in order; a request that failed (e.g.
+        an unreachable shard) gives its exception instead.
+        """
+        futures = [self._pool.submit(self.request, *args) for args in requests]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+    
+    def stream_lines(self, shard, path, payload):
+        """
+        POST payload as JSON and return an iterator of the response's lines
+        
+        The request is sent right away, so streams opened on several shards
+        are computed in parallel, and the response is read as the iterator
+        is. Each stream has a connection of its own, closed by close(), so
+        the shard stops when the caller stops reading. Iterating raises for
+        non-200 responses.
+        """
+        connection = self._connect(shard)
+        try:
+            connection.request(
+                'POST', self._targets[shard].path + path, body=json.dumps(payload),
+                headers={'Content-Type': 'application/json'}
+            )
+        except Exception:
+            connection.close()
+            raise
+        return LineStream(self.urls[shard], connection)
+
+
+class LineStream:
+    """Iterator over the non-empty lines of a streamed response; close() drops its connection"""
+    
+    def __init__(self, url, connection):
+        self.url = url
+        self._connection = connection
+        self._lines = None
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        if self._lines is None:
+            self._lines = self._read_lines()
+        return next(self._lines)
+    
+    def _read_lines(self):
+        response = self._connection.getresponse()
+        if response.status != 200:
+            raise http.client.HTTPException(
+                f'{self.url} answered {response.status}: {response.read()[:200]!r}'
+            )
+        for line in response:
+            if line.strip():
+                yield line
+    
+    def close(self):
+        self._connection.close()
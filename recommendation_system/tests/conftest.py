@@ -0,0 +1,160 @@
+"""
+Shared fixtures: synthetic Firestore data from benchmark.py, models built on it,
+and copies of the api module serving them
+"""
+
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+import copy
+import importlib.util
+import io
+import os
+import sys
+import threading
+import time
+
+import pytest
+from werkzeug.serving import make_server
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_PATH = os.path.join(PACKAGE_DIR, 'api.py')
+
+sys.path.insert(0, PACKAGE_DIR)
+
+from benchmark import FakeDocument, FakeFirestore, make_dataset
+from clubhub_recommender import ClubHubRecommender
+
+
+class FakeChange:
+    """A listener document change: type.name is ADDED, MODIFIED or REMOVED"""
+    
+    class _Type:
+        def __init__(self, name):
+            self.name = name
+    
+    def __init__(self, kind, document):
+        self.type = self._Type(kind)
+        self.document = document
+
+
+@pytest.fixture(scope='session')
+def dataset():
+    return make_dataset(events=300, students=300, clubs=8, registrations_per_student=4, seed=1)
+
+
+@pytest.fixture
+def collections(dataset):
+    """A copy of the dataset a test can edit"""
+    return copy.deepcopy(dataset)
+
+
+def build(collections, **kwargs):
+    """A recommender built from collections, without the build output"""
+    with redirect_stdout(io.StringIO()):
+        return ClubHubRecommender(db=FakeFirestore(collections), **kwargs)
+
+
+def queue_change(recommender, collections, collection, doc_id, data=None):
+    """
+    Edit collections and queue the matching listener change on recommender
+    
+    data=None removes the document. Changed documents get a newer update_time
+    than the one the model loaded, so sync() applies them.
+    """
+    docs = collections[collection]
+    existing = [pos for pos, (other_id, _) in enumerate(docs) if other_id == doc_id]
+    if data is None:
+        kind = 'REMOVED'
+        for pos in reversed(existing):
+            del docs[pos]
+    else:
+        kind = 'MODIFIED' if existing else 'ADDED'
+        if existing:
+            docs[existing[0]] = (doc_id, data)
+        else:
+            docs.append((doc_id, data))
+    
+    update_time = datetime.now(timezone.utc) + timedelta(seconds=1)
+    recommender._queue_changes(collection, [FakeChange(kind, FakeDocument(doc_id, data or {}, update_time))])
+
+
+def event_doc(name, description, club_id, days_from_now):
+    return {
+        'eventName': name,
+        'eventDescription': description,
+        'clubId': club_id,
+        'eventDate': datetime.now(timezone.utc) + timedelta(days=days_from_now),
+        'isCompleted': False,
+    }
+
+
+def student_uids(collections):
+    return [doc_id for doc_id, _ in collections['students']] + ['nobody']
+
+
+def assert_same_model(model, reference, collections):
+    """Same recommendations, similar events, club rankings and stats"""
+    uids = student_uids(collections)
+    assert model.recommend_many(uids, 5) == reference.recommend_many(uids, 5)
+    for uid in uids[:50]:
+        assert model.recommend_clubs(uid, 3) == reference.recommend_clubs(uid, 3)
+    for event_id, _ in collections['events'][:50]:
+        assert model.similar_events(event_id, 5) == reference.similar_events(event_id, 5)
+    assert model.trending_events(10) == reference.trending_events(10)
+    assert model.get_stats() == reference.get_stats()
+
+
+def edit_everything(model, collections):
+    """Queue an edit of every kind; new ids sort last so a fresh build keeps the same row order"""
+    events = collections['events']
+    queue_change(model, collections, 'events', 'event9999990', event_doc(
+        'Robot Hackathon', 'python robot hackathon programming night', 'club000001', 5
+    ))
+    edited_id, edited = events[3]
+    queue_change(model, collections, 'events', edited_id, dict(edited, eventDescription='music concert band night'))
+    queue_change(model, collections, 'events', events[10][0])
+    
+    club_id, club = collections['clubs'][2]
+    queue_change(model, collections, 'clubs', club_id, dict(club, clubName='Renamed Club'))
+    
+    queue_change(model, collections, 'students', 'student9999990', {
+        'fullName': 'New Student', 'fieldOfInterest': ['Music & Dance']
+    })
+    queue_change(model, collections, 'students', collections['students'][5][0])
+    
+    queue_change(model, collections, 'event_registrations', 'reg999999990', {
+        'studentUid': collections['students'][7][0], 'eventId': 'event9999990', 'attended': False,
+        'registeredAt': datetime.now(timezone.utc)
+    })
+    queue_change(model, collections, 'event_registrations', collections['event_registrations'][3][0])
+
+
+def load_api(name, monkeypatch, recommender=None, **env):
+    """A fresh copy of the api module, imported with env set"""
+    for variable in ('MODEL_SNAPSHOT_DIR', 'RECOMMENDATION_TABLE_DIR', 'SHARD_COUNT', 'SHARD_INDEX', 'SHARD_URLS'):
+        monkeypatch.delenv(variable, raising=False)
+    for variable, value in env.items():
+        monkeypatch.setenv(variable, value)
+    
+    spec = importlib.util.spec_from_file_location(name, API_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.recommender = recommender
+    return module
+
+
+def serve(module):
+    """Serve a node's app on a free local port; returns (url, server)"""
+    server = make_server('127.0.0.1', 0, module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def wait_for_job(client, job_id, timeout=60):
+    """Poll /api/refresh/<job_id> until the job is done or failed; returns the job"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f'/api/refresh/{job_id}').get_json()
+        if job['status'] in ('done', 'failed') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
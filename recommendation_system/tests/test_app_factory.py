@@ -0,0 +1,71 @@
+"""
+create_app(): background and eager warm-up, liveness and readiness
+"""
+
+import threading
+import time
+
+import pytest
+
+from conftest import build, load_api
+
+
+def slow_model(api, monkeypatch, collections):
+    """Make api's warm-up wait for the returned event before it gets a model"""
+    loaded = threading.Event()
+    
+    def load_or_build(on_progress=None):
+        loaded.wait(30)
+        return build(collections)
+    
+    monkeypatch.setattr(api, 'load_or_build', load_or_build)
+    return loaded
+
+
+def test_background_warm_up_answers_liveness_at_once(collections, monkeypatch):
+    api = load_api('api_background', monkeypatch)
+    loaded = slow_model(api, monkeypatch, collections)
+    uid = collections['students'][0][0]
+    
+    client = api.create_app('background').test_client()
+    
+    assert client.get('/health/live').status_code == 200
+    assert client.get('/health/ready').status_code == 503
+    assert client.get(f'/api/recommendations/{uid}').status_code == 503
+    assert client.post('/api/recommendations/batch', json={'student_uids': [uid]}).status_code == 503
+    
+    loaded.set()
+    deadline = time.monotonic() + 30
+    while client.get('/health/ready').status_code != 200 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    
+    ready = client.get('/health/ready').get_json()
+    assert ready['status'] == 'ready' and ready['stage'] == 'done'
+    assert {'model_imports', 'model_load', 'warm_up'} <= set(ready['startup_seconds'])
+    assert client.get(f'/api/recommendations/{uid}').status_code == 200
+
+
+def test_eager_warm_up_is_ready_on_return(collections, monkeypatch):
+    api = load_api('api_eager', monkeypatch)
+    slow_model(api, monkeypatch, collections).set()
+    
+    client = api.create_app('eager').test_client()
+    
+    assert client.get('/health/ready').status_code == 200
+    assert client.get(f"/api/recommendations/{collections['students'][0][0]}").status_code == 200
+
+
+def test_failed_warm_up_stays_live(collections, monkeypatch):
+    api = load_api('api_failed', monkeypatch)
+    monkeypatch.setattr(api, 'load_or_build', lambda on_progress=None: None)
+    
+    client = api.create_app('eager').test_client()
+    
+    assert client.get('/health/live').status_code == 200
+    ready = client.get('/health/ready')
+    assert ready.status_code == 503 and ready.get_json()['status'] == 'failed'
+
+
+def test_unknown_warm_up_mode(monkeypatch):
+    with pytest.raises(ValueError):
+        load_api('api_unknown_mode', monkeypatch).create_app('lazy')
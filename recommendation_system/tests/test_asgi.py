@@ -0,0 +1,105 @@
+"""
+ASGI serving mode: asgi.py's app around the api module, and request coalescing
+"""
+
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import threading
+
+import httpx
+import pytest
+
+from conftest import PACKAGE_DIR, build, load_api, student_uids
+from request_coalescer import RequestCoalescer
+
+
+@pytest.fixture
+def asgi(collections, monkeypatch):
+    """(asgi module, api module) serving a model of collections"""
+    api = load_api('api', monkeypatch, build(collections), RECOMMEND_COALESCE_WINDOW_MS='20')
+    monkeypatch.setitem(sys.modules, 'api', api)
+    spec = importlib.util.spec_from_file_location('asgi', os.path.join(PACKAGE_DIR, 'asgi.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    yield module, api
+    module.request_executor.shutdown(wait=False)
+    module.control_executor.shutdown(wait=False)
+
+
+def run(module, *requests):
+    """Send (method, path, kwargs) requests to the ASGI app at once; returns the responses"""
+    async def send_all():
+        transport = httpx.ASGITransport(app=module.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await asyncio.gather(*(
+                client.request(method, path, **kwargs) for method, path, kwargs in requests
+            ))
+    return asyncio.run(send_all())
+
+
+def test_asgi_app_serves_the_flask_routes(asgi, collections):
+    module, api = asgi
+    uid = collections['students'][0][0]
+    
+    live, ready, response = run(module, ('GET', '/health/live', {}), ('GET', '/health/ready', {}),
+                                ('GET', f'/api/recommendations/{uid}?top_n=3', {}))
+    
+    assert live.status_code == 200 and ready.status_code == 200
+    assert response.status_code == 200
+    assert response.json() == json.loads(json.dumps(api.recommender.recommend(uid, 3)))
+    
+    cached, = run(module, ('GET', f'/api/recommendations/{uid}?top_n=3',
+                           {'headers': {'If-None-Match': response.headers['ETag']}}))
+    assert cached.status_code == 304
+
+
+def test_asgi_app_coalesces_concurrent_requests(asgi, collections):
+    module, api = asgi
+    uids = student_uids(collections)[:40]
+    
+    responses = run(module, *(('GET', f'/api/recommendations/{uid}?top_n=5', {}) for uid in uids))
+    
+    for uid, response in zip(uids, responses):
+        assert response.json() == json.loads(json.dumps(api.recommender.recommend(uid, 5)))
+    stats = api.request_coalescer.stats()
+    assert stats['requests'] == len(uids)
+    assert stats['batches'] < len(uids)
+
+
+def test_asgi_app_streams_batches(asgi, collections):
+    module, api = asgi
+    uids = student_uids(collections)
+    
+    batch, stream = run(
+        module,
+        ('POST', '/api/recommendations/batch', {'json': {'student_uids': uids[:50], 'top_n': 2}}),
+        ('POST', '/api/recommendations/batch/stream', {'json': {'student_uids': uids, 'top_n': 2}}),
+    )
+    
+    assert batch.json()['recommendations'] == json.loads(json.dumps(api.recommender.recommend_many(uids[:50], 2)))
+    lines = [json.loads(line) for line in stream.text.splitlines()]
+    assert lines[:-1] == json.loads(json.dumps(api.recommender.recommend_many(uids, 2)))
+    assert lines[-1] == {'type': 'summary', 'total': len(uids), 'errors': 1}
+
+
+def test_coalescer_matches_recommend(collections):
+    model = build(collections)
+    coalescer = RequestCoalescer(lambda rec, uids, top_n: rec.recommend_many(uids, top_n), window=0.01)
+    uids = student_uids(collections)[:40]
+    results = {}
+    
+    def request(uid):
+        results[uid] = coalescer.recommend(model, uid, 5)
+    
+    threads = [threading.Thread(target=request, args=(uid,)) for uid in uids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert results == {uid: model.recommend(uid, 5) for uid in uids}
+    assert coalescer.stats()['requests'] == len(uids)
+    assert coalescer.stats()['batches'] < len(uids)
@@ -0,0 +1,35 @@
+"""
+Batch recommendations: one recommend_many pass per chunk, errors reported per entry
+"""
+
+from conftest import build, load_api, student_uids
+
+
+def test_recommend_many_matches_recommend(collections):
+    model = build(collections)
+    uids = student_uids(collections)
+    
+    assert model.recommend_many(uids, 5) == [model.recommend(uid, 5) for uid in uids]
+
+
+def test_batch_reports_errors_per_entry(dataset, monkeypatch):
+    node = load_api('api_batch_errors', monkeypatch, build(dataset))
+    client = node.app.test_client()
+    uids = [doc_id for doc_id, _ in dataset['students']][:100]
+    
+    results = client.post('/api/recommendations/batch', json={'student_uids': [uids[0], 7, uids[1]], 'top_n': 3})
+    
+    assert results.status_code == 200
+    entries = results.get_json()['recommendations']
+    assert entries[1] == {'studentUid': 7, 'type': 'error', 'message': 'studentUid must be a string',
+                          'recommendations': []}
+    assert [entries[0], entries[2]] == node.recommender.recommend_many([uids[0], uids[1]], 3)
+    
+    # A chunk that fails to score only fails its own students
+    recommend_many = node.recommender.recommend_many
+    monkeypatch.setattr(node.recommender, 'recommend_many', lambda chunk, top_n: (
+        recommend_many(chunk, top_n) if uids[0] not in chunk else 1 / 0
+    ))
+    entries = client.post('/api/recommendations/batch', json={'student_uids': uids, 'top_n': 3}).get_json()
+    failed = [entry['studentUid'] for entry in entries['recommendations'] if entry.get('type') == 'error']
+    assert failed == uids[:node.recommender.BATCH_CHUNK_SIZE]
@@ -0,0 +1,63 @@
+"""
+Collection loading: paged, projected reads in _load_data
+"""
+
+import pytest
+
+import benchmark
+from conftest import assert_same_model, build, event_doc, queue_change
+from clubhub_recommender import ClubHubRecommender
+
+
+@pytest.mark.parametrize('page_size', [7, 50])  # 300 events: a short last page, then an empty one
+def test_paged_reads_load_every_document(collections, monkeypatch, page_size):
+    reference = build(collections)
+    pages = []
+    stream = benchmark.FakeQuery.stream
+    
+    def counted_stream(query):
+        docs = list(stream(query))
+        pages.append(len(docs))
+        return iter(docs)
+    
+    monkeypatch.setattr(benchmark.FakeQuery, 'stream', counted_stream)
+    monkeypatch.setattr(ClubHubRecommender, 'LOAD_PAGE_SIZE', page_size)
+    records, versions, seconds = reference._read_collection('events')
+    
+    assert [record['eventId'] for record in records] == sorted(doc_id for doc_id, _ in collections['events'])
+    assert set(versions) == {doc_id for doc_id, _ in collections['events']}
+    n_events = len(collections['events'])
+    assert pages == [page_size] * (n_events // page_size) + [n_events % page_size]
+    
+    paged = build(collections)
+    assert_same_model(paged, reference, collections)
+    assert paged.events_df.equals(reference.events_df)
+    assert paged.registrations_df.equals(reference.registrations_df)
+
+
+def test_reads_fetch_only_the_fields_the_model_uses(collections):
+    doc_id, data = collections['events'][0]
+    collections['events'][0] = (doc_id, dict(data, organiserNotes='x' * 1000, attendees=['a', 'b']))
+    
+    model = build(collections)
+    records, versions, seconds = model._read_collection('events')
+    
+    assert set(records[0]) == set(ClubHubRecommender.COLLECTION_FIELDS['events']) | {'eventId'}
+    assert 'organiserNotes' not in model.events_df.columns
+
+
+def test_club_ids_are_interned(collections):
+    # Fresh strings per document, as the Firestore client returns them
+    collections['events'] = [
+        (doc_id, dict(data, clubId=''.join(data['clubId']))) for doc_id, data in collections['events']
+    ]
+    model = build(collections)
+    queue_change(model, collections, 'events', 'event9999990', event_doc(
+        'Robot Night', 'python robot night', ''.join(['club', '000001']), 3
+    ))
+    synced, summary = model.sync()
+    
+    for events in (model.events_df, synced.events_df):
+        club_ids = [club_id for club_id in events['clubId'] if club_id == 'club000001']
+        assert len(club_ids) > 1
+        assert all(club_id is club_ids[0] for club_id in club_ids)
@@ -0,0 +1,52 @@
+"""
+Timing histograms and the /metrics endpoint
+"""
+
+import re
+
+import metrics
+from conftest import build, load_api
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram('test_seconds', 'Test durations', ('stage',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, 'load')
+    histogram.observe(0.5, 'load')
+    histogram.observe(5.0, 'load')
+    
+    assert histogram.render() == [
+        '# HELP test_seconds Test durations',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{stage="load",le="0.1"} 1',
+        'test_seconds_bucket{stage="load",le="1.0"} 2',
+        'test_seconds_bucket{stage="load",le="+Inf"} 3',
+        'test_seconds_sum{stage="load"} 5.55',
+        'test_seconds_count{stage="load"} 3',
+    ]
+    assert histogram.summary() == {('load',): (3, 5.55)}
+
+
+def test_metrics_endpoint(collections, monkeypatch):
+    api = load_api('api_metrics', monkeypatch, build(collections))
+    client = api.app.test_client()
+    uid = collections['students'][0][0]
+    client.get(f'/api/recommendations/{uid}')
+    client.get(f'/api/recommendations/{uid}')
+    
+    response = client.get('/metrics')
+    
+    assert response.status_code == 200
+    assert response.content_type == metrics.CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    samples = dict(re.findall(r'^([^#\s][^ ]*) (\S+)$', text, re.MULTILINE))
+    assert samples['clubhub_model_ready'] == '1.0'
+    assert samples['clubhub_response_cache_hits_total'] == '1.0'
+    assert samples['clubhub_response_cache_misses_total'] == '1.0'
+    assert samples['clubhub_response_cache_hit_ratio'] == '0.5'
+    assert samples['clubhub_model_rows{collection="students"}'] == f"{float(len(collections['students']))!r}"
+    assert float(samples['clubhub_model_build_seconds']) > 0
+    
+    route = 'method="GET",route="/api/recommendations/<student_uid>",status="200"'
+    assert samples[f'clubhub_http_request_seconds_count{{{route}}}'] == '2'
+    assert 'clubhub_stage_seconds_count{stage="prepare.club_profiles"}' in samples
+    assert 'clubhub_stage_seconds_count{stage="api.serialize"}' in samples
@@ -0,0 +1,54 @@
+"""
+Event neighbour graph: patched on sync, equal to a rebuild
+"""
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from conftest import build, edit_everything, event_doc, queue_change
+
+
+def test_neighbour_lists_are_the_most_similar_events(collections):
+    model = build(collections)
+    similarity = cosine_similarity(model.event_vectors)
+    np.fill_diagonal(similarity, -1)
+    
+    for pos in range(0, len(model.event_ids), 7):
+        row = model.event_neighbours[pos]
+        expected = np.sort(similarity[pos][similarity[pos] > 0])[::-1][:model.NEIGHBOURS_K]
+        assert np.allclose(np.sort(row.data)[::-1], expected)
+        assert np.allclose(row.data, similarity[pos, row.indices])
+    
+    event_id = model.event_ids[0]
+    similar = model.similar_events(event_id, 5, upcoming_only=False)['similar']
+    scores = [event['score'] for event in similar]
+    assert len(similar) == 5 and scores == sorted(scores, reverse=True)
+    assert event_id not in [event['eventId'] for event in similar]
+
+
+def test_patched_neighbour_graph_matches_rebuild(collections):
+    model = build(collections)
+    model.VOCABULARY_DRIFT_THRESHOLD = 1.0
+    edit_everything(model, collections)
+    model, summary = model.sync()
+    
+    patched = model.event_neighbours.copy()
+    model._build_neighbour_index()
+    
+    assert patched.shape == model.event_neighbours.shape
+    assert abs(patched - model.event_neighbours).max() < 1e-9
+
+
+def test_patched_neighbour_graph_matches_rebuild_after_one_new_event(collections):
+    model = build(collections)
+    model.VOCABULARY_DRIFT_THRESHOLD = 1.0
+    queue_change(model, collections, 'events', 'event9999990', event_doc(
+        'Robot Hackathon', 'python robot hackathon programming night', 'club000001', 5
+    ))
+    model, summary = model.sync()
+    
+    patched = model.event_neighbours.copy()
+    model._build_neighbour_index()
+    
+    assert ((patched > 0) != (model.event_neighbours > 0)).nnz == 0
+    assert abs(patched - model.event_neighbours).max() < 1e-9
@@ -0,0 +1,50 @@
+"""
+Precomputed recommendation tables: rows served from the table answer like the live model
+"""
+
+from conftest import build, queue_change, student_uids
+from clubhub_recommender import precompute_all
+import model_snapshot
+
+
+def test_precomputed_table_matches_live(collections, tmp_path):
+    model = build(collections)
+    snapshot_dir, table_dir = str(tmp_path / 'model'), str(tmp_path / 'table')
+    model.save_snapshot(snapshot_dir)
+    
+    precompute_all(table_dir, snapshot_dir=snapshot_dir, top_k=10, workers=1, shard_size=100)
+    table = model_snapshot.load_recommendation_table(table_dir)
+    
+    answered = 0
+    for uid in student_uids(collections):
+        result = model.recommend_precomputed(table, uid, 5)
+        if result is not None:
+            answered += 1
+            assert result == model.recommend(uid, 5)
+    assert answered > len(collections['students']) // 2
+
+
+def test_students_changed_since_the_table_are_scored_live(collections, tmp_path):
+    model = build(collections)
+    snapshot_dir, table_dir = str(tmp_path / 'model'), str(tmp_path / 'table')
+    model.save_snapshot(snapshot_dir)
+    precompute_all(table_dir, snapshot_dir=snapshot_dir, top_k=10, workers=1, shard_size=100)
+    table = model_snapshot.load_recommendation_table(table_dir)
+    uids = [uid for uid in student_uids(collections) if model.recommend_precomputed(table, uid, 5)]
+    registered, edited, unchanged = uids[:3]
+    
+    # A registration applied live, and a profile edit picked up by sync()
+    model.apply_registration('reg999999990', {
+        'studentUid': registered, 'eventId': collections['events'][20][0], 'attended': False
+    })
+    student = dict(collections['students'])[edited]
+    queue_change(model, collections, 'students', edited, dict(student, fieldOfInterest=['Music & Dance']))
+    synced, summary = model.sync()
+    
+    assert model.recommend_precomputed(table, registered, 5) is None
+    assert synced.recommend_precomputed(table, registered, 5) is None
+    assert synced.recommend_precomputed(table, edited, 5) is None
+    assert synced.recommend_precomputed(table, unchanged, 5) == synced.recommend(unchanged, 5)
+    
+    # A model read from Firestore after the table may know changes the table missed
+    assert build(collections).recommend_precomputed(table, unchanged, 5) is None
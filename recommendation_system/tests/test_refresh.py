@@ -0,0 +1,100 @@
+"""
+Background refresh: sync() builds a new model while the current one keeps serving
+"""
+
+import threading
+
+import pytest
+
+from conftest import build, event_doc, load_api, queue_change, student_uids, wait_for_job
+from clubhub_recommender import ClubHubRecommender
+
+
+def test_sync_leaves_the_serving_model_untouched(collections):
+    """Requests on the current model while a sync adds events see one consistent model"""
+    model = build(collections)
+    model.VOCABULARY_DRIFT_THRESHOLD = 1.0
+    uids = student_uids(collections)[:20]
+    expected = model.recommend_many(uids, 5)
+    stop = threading.Event()
+    errors = []
+    
+    def read():
+        while not stop.is_set():
+            try:
+                assert model.recommend_many(uids, 5) == expected
+                model.recommend_clubs(uids[0], 3)
+                model.similar_events('event0000003', 5)
+            except Exception as e:
+                errors.append(e)
+    
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    latest = model
+    try:
+        for i in range(20):
+            for j in range(5):
+                queue_change(latest, collections, 'events', f'event99{i:03d}{j}', event_doc(
+                    'Robot Night', 'python robot programming', f'club00000{j}', 3
+                ))
+            latest, summary = latest.sync()
+            assert summary['events'] == 5
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+    
+    assert errors == []
+    assert len(latest.event_ids) == len(model.event_ids) + 100
+
+
+def test_changes_after_a_sync_reach_the_new_model(collections):
+    model = build(collections)
+    uid = collections['students'][11][0]
+    queue_change(model, collections, 'students', 'student9999990', {'fullName': 'New', 'fieldOfInterest': []})
+    synced, summary = model.sync()
+    
+    # Listeners and callers still holding the old model update the new one
+    queue_change(model, collections, 'students', 'student9999991', {'fullName': 'Newer', 'fieldOfInterest': []})
+    registration = {'studentUid': uid, 'eventId': collections['events'][20][0], 'attended': True}
+    assert model.apply_registration('reg999999993', registration) == {uid}
+    
+    assert collections['events'][20][0] in synced._get_registered_events(uid)
+    newest, summary = synced.sync()
+    assert summary['students'] == 1
+    assert 'student9999991' in newest.student_index and 'student9999991' not in synced.student_index
+
+
+def test_failed_sync_keeps_changes_queued(collections, monkeypatch):
+    model = build(collections)
+    queue_change(model, collections, 'events', 'event9999990', event_doc('Robot Night', 'python robot', 'club000001', 3))
+    
+    def fail(*args):
+        raise RuntimeError('boom')
+    
+    monkeypatch.setattr(ClubHubRecommender, '_sync_events', fail)
+    with pytest.raises(RuntimeError):
+        model.sync()
+    monkeypatch.undo()
+    
+    synced, summary = model.sync()
+    assert summary['events'] == 1
+    assert 'event9999990' in synced.event_index and 'event9999990' not in model.event_index
+
+
+def test_refresh_endpoint_returns_a_job_to_poll(collections, monkeypatch):
+    """POST /api/refresh answers 202 with a jobId; clients poll it until it is done"""
+    api = load_api('api_refresh', monkeypatch, build(collections))
+    collections['events'] = collections['events'][:-10]
+    monkeypatch.setattr(api, 'build_recommender', lambda on_progress=None: build(collections))
+    client = api.app.test_client()
+    
+    started = client.post('/api/refresh')
+    
+    assert started.status_code == 202
+    job = started.get_json()
+    assert job['status'] == 'queued' and job['mode'] == 'full'
+    assert wait_for_job(client, job['jobId'])['status'] == 'done'
+    assert len(api.recommender.event_ids) == len(collections['events'])
+    assert client.get('/api/refresh/no-such-job').status_code == 404
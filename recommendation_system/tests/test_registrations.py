@@ -0,0 +1,125 @@
+"""
+Live registrations: apply_registration and the webhook against a rebuilt model
+"""
+
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from clubhub_recommender import ClubHubRecommender
+from conftest import build, load_api, queue_change
+
+
+@pytest.mark.parametrize('removed', [False, True])
+def test_apply_registration_matches_rebuild(collections, removed):
+    model = build(collections)
+    uid = collections['students'][11][0]
+    if removed:
+        registration_id, record = next(
+            (doc_id, data) for doc_id, data in collections['event_registrations'] if data['studentUid'] == uid
+        )
+        collections['event_registrations'].remove((registration_id, record))
+        record = None
+    else:
+        registration_id = 'reg999999991'
+        record = {'studentUid': uid, 'eventId': collections['events'][20][0], 'attended': True,
+                  'registeredAt': datetime.now(timezone.utc)}
+        collections['event_registrations'].append((registration_id, record))
+    
+    assert model.apply_registration(registration_id, record) == {uid}
+    
+    reference = build(collections)
+    assert model.recommend(uid, 5) == reference.recommend(uid, 5)
+    assert model._get_registered_events(uid) == reference._get_registered_events(uid)
+
+
+def test_snapshot_model_cancels_and_updates_registrations(collections, tmp_path):
+    model = build(collections)
+    registrations = collections['event_registrations']
+    uid = collections['students'][11][0]
+    added = ('reg999999990', {'studentUid': uid, 'eventId': collections['events'][20][0], 'attended': False})
+    model.apply_registration(*added)  # live when the snapshot is saved
+    registrations.append(added)
+    model.save_snapshot(str(tmp_path))
+    loaded = ClubHubRecommender.from_snapshot(str(tmp_path))
+    
+    cancelled = next(registration for registration in registrations if registration[1]['studentUid'] == uid)
+    attended_id, attended = next(
+        (doc_id, data) for doc_id, data in registrations
+        if data['studentUid'] != uid and not data.get('attended')
+    )
+    attended = dict(attended, attended=True)
+    event_pos = loaded.event_index[attended['eventId']]
+    weight_before = loaded.popularity_counts[event_pos]
+    
+    changes = [(cancelled[0], None), (added[0], None), (attended_id, attended)]
+    for registration_id, record in changes:
+        assert model.apply_registration(registration_id, record)
+        assert loaded.apply_registration(registration_id, record)
+    registrations.remove(cancelled)
+    registrations.remove(added)
+    registrations[[doc_id for doc_id, _ in registrations].index(attended_id)] = (attended_id, attended)
+    
+    reference = build(collections)
+    for student_uid in (uid, attended['studentUid']):
+        assert loaded._get_registered_events(student_uid) == reference._get_registered_events(student_uid)
+        assert loaded._get_attended_events(student_uid) == reference._get_attended_events(student_uid)
+        assert loaded.recommend(student_uid, 5) == model.recommend(student_uid, 5)
+    # Replaced, not counted twice
+    assert loaded.popularity_counts[event_pos] == pytest.approx(weight_before)
+    assert np.allclose(loaded.popularity_counts, model.popularity_counts)
+    assert loaded.trending_events(10) == model.trending_events(10)
+
+
+def test_registration_without_timestamp_weighs_the_same_live_and_synced(collections):
+    model = build(collections)
+    event_id = collections['events'][20][0]
+    record = {'studentUid': collections['students'][0][0], 'eventId': event_id, 'attended': False}
+    model.apply_registration('reg999999995', record)
+    live = model._registration_record('reg999999995')
+    
+    queue_change(model, collections, 'event_registrations', 'reg999999995', record)
+    synced, summary = model.sync()
+    
+    assert live[3] is None
+    assert synced._registration_record('reg999999995') == live
+    assert model.trending.weight(live[3]) == synced.trending.weight(None) == 1.0
+
+
+def test_model_without_events(collections):
+    collections['events'] = []
+    model = build(collections)
+    uid = collections['students'][0][0]
+    
+    assert model.apply_registration('reg999999996', {'studentUid': uid, 'eventId': 'gone', 'attended': False}) == {uid}
+    assert model.trending_events(5) == [] and model.trending_clubs(5) == []
+    assert model.recommend(uid, 5)['recommendations'] == []
+
+
+def test_registration_webhook_validation(dataset, monkeypatch, tmp_path):
+    node = load_api('api_webhook', monkeypatch, build(dataset))
+    client = node.app.test_client()
+    uid = dataset['students'][0][0]
+    
+    ghost = client.post('/api/events/registration', json={
+        'registrationId': 'reg999999998', 'studentUid': 'ghost', 'eventId': 'event0000007'
+    })
+    missing_event = client.post('/api/events/registration', json={
+        'registrationId': 'reg999999998', 'studentUid': uid, 'eventId': 'no-such-event'
+    })
+    
+    assert (ghost.status_code, ghost.get_json()['error']) == (404, 'Student not found')
+    assert (missing_event.status_code, missing_event.get_json()['error']) == (404, 'Event not found')
+    assert 'reg999999998' not in node.recommender._live_registrations
+    
+    applied = client.post('/api/events/registration', json={
+        'registrationId': 'reg999999998', 'studentUid': uid, 'eventId': 'event0000007'
+    })
+    assert applied.status_code == 200 and 'message' not in applied.get_json()
+    
+    node.SNAPSHOT_DIR = str(tmp_path)
+    applied = client.post('/api/events/registration', json={
+        'registrationId': 'reg999999999', 'studentUid': uid, 'eventId': 'event0000008'
+    })
+    assert 'this worker only' in applied.get_json()['message']
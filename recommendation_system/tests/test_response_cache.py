@@ -0,0 +1,55 @@
+"""
+Response cache: ETags, 304s, and entries dropped when the student or the model changes
+"""
+
+from conftest import build, event_doc, load_api, queue_change
+from response_cache import ResponseCache
+
+
+def test_response_cache_evicts_expires_and_checks_tokens():
+    cache = ResponseCache(max_entries=2, ttl=300)
+    cache.put('a', 1, 'A')
+    cache.put('b', 1, 'B')
+    assert cache.get('a', 1) == 'A'
+    cache.put('c', 1, 'C')  # 'b' is the least recently used
+    
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 2) is None and cache.get('a', 1) is None  # another token drops the entry
+    assert cache.get('c', 1) == 'C'
+    
+    expired = ResponseCache(ttl=0)
+    expired.put('a', 1, 'A')
+    assert expired.get('a', 1) is None
+
+
+def test_recommendations_are_cached_until_the_student_or_model_changes(collections, monkeypatch):
+    api = load_api('api_cache', monkeypatch, build(collections))
+    client = api.app.test_client()
+    uid, other = collections['students'][0][0], collections['students'][1][0]
+    path = f'/api/recommendations/{uid}?top_n=5'
+    
+    first = client.get(path)
+    etag = first.headers['ETag']
+    cached = client.get(path, headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.get_data() == b''
+    assert api.response_cache.stats()['hits'] == 1
+    
+    # A registration bumps only that student's version
+    client.get(f'/api/recommendations/{other}?top_n=5')
+    event_id = first.get_json()['recommendations'][0]['eventId']
+    api.recommender.apply_registration('reg999999990', {'studentUid': uid, 'eventId': event_id, 'attended': False})
+    
+    changed = client.get(path, headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert event_id not in [event['eventId'] for event in changed.get_json()['recommendations']]
+    assert client.get(f'/api/recommendations/{other}?top_n=5').status_code == 200
+    assert api.response_cache.stats()['hits'] == 2
+    
+    # An event change bumps the model version, dropping every student's entry
+    queue_change(api.recommender, collections, 'events', 'event9999990', event_doc(
+        'Robot Night', 'python robot programming', 'club000001', 3
+    ))
+    api.recommender, summary = api.recommender.sync()
+    misses = api.response_cache.stats()['misses']
+    client.get(f'/api/recommendations/{other}?top_n=5')
+    assert api.response_cache.stats()['misses'] == misses + 1
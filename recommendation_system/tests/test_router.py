@@ -0,0 +1,186 @@
+"""
+Partitioned mode: the router against an unsharded node, shard failures and shard snapshots
+
+Each node is its own copy of the api module (module state is per node);
+shard nodes serve on local ports so the router reaches them over HTTP.
+"""
+
+import json
+import socket
+
+import pytest
+
+from conftest import build, load_api, serve, student_uids
+from clubhub_recommender import ClubHubRecommender
+
+
+def closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+
+@pytest.fixture(scope='module')
+def cluster(dataset):
+    """(router client, unsharded client, student uids) for two shards behind a router"""
+    monkeypatch = pytest.MonkeyPatch()
+    servers = []
+    try:
+        urls = []
+        for index in range(2):
+            shard = load_api(
+                f'api_shard{index}', monkeypatch, build(dataset, shard=(index, 2)),
+                SHARD_COUNT='2', SHARD_INDEX=str(index)
+            )
+            url, server = serve(shard)
+            urls.append(url)
+            servers.append(server)
+        
+        router = load_api('api_router', monkeypatch, SHARD_URLS=','.join(urls))
+        unsharded = load_api('api_unsharded', monkeypatch, build(dataset))
+        uids = [doc_id for doc_id, _ in dataset['students']]
+        yield router.app.test_client(), unsharded.app.test_client(), uids
+    finally:
+        for server in servers:
+            server.shutdown()
+        monkeypatch.undo()
+
+
+def lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_router_single_student_routes(cluster):
+    router, unsharded, uids = cluster
+    for uid in uids[:60] + ['nobody']:
+        for path in (f'/api/recommendations/{uid}?top_n=5', f'/api/recommendations/{uid}/clubs?top_n=3'):
+            routed, expected = router.get(path), unsharded.get(path)
+            assert routed.status_code == expected.status_code
+            assert routed.get_json() == expected.get_json()
+
+
+def test_router_passes_etags_through(cluster):
+    router, unsharded, uids = cluster
+    response = router.get(f'/api/recommendations/{uids[0]}')
+    assert response.headers['ETag']
+    
+    cached = router.get(f'/api/recommendations/{uids[0]}', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+
+def test_router_merges_batches_in_request_order(cluster):
+    router, unsharded, uids = cluster
+    body = {'student_uids': uids[::-1][:120] + ['nobody', 5, None] + uids[:5], 'top_n': 4}
+    
+    routed = router.post('/api/recommendations/batch', json=body)
+    expected = unsharded.post('/api/recommendations/batch', json=body)
+    
+    assert routed.status_code == 200
+    assert routed.get_json() == expected.get_json()
+    
+    only_invalid = {'student_uids': [5, None], 'top_n': 4}
+    assert router.post('/api/recommendations/batch', json=only_invalid).get_json() == \
+        unsharded.post('/api/recommendations/batch', json=only_invalid).get_json()
+
+
+def test_router_merges_streams_in_request_order(cluster):
+    router, unsharded, uids = cluster
+    body = {'student_uids': uids * 3 + ['nobody', 5, None], 'top_n': 3}
+    
+    routed = router.post('/api/recommendations/batch/stream', json=body)
+    expected = unsharded.post('/api/recommendations/batch/stream', json=body)
+    
+    assert routed.mimetype == 'application/x-ndjson'
+    assert lines(routed) == lines(expected)
+    assert lines(routed)[-1] == {'type': 'summary', 'total': len(body['student_uids']), 'errors': 3}
+
+
+def test_router_forwards_invalid_bodies(cluster):
+    router, unsharded, uids = cluster
+    for path in ('/api/recommendations/batch', '/api/recommendations/batch/stream'):
+        for body in ({'top_n': 3}, {'student_uids': 'x'}):
+            routed, expected = router.post(path, json=body), unsharded.post(path, json=body)
+            assert (routed.status_code, routed.get_json()) == (expected.status_code, expected.get_json())
+
+
+def test_router_event_routes_and_stats(cluster):
+    router, unsharded, uids = cluster
+    similar = '/api/events/event0000003/similar?top_n=4'
+    assert router.get(similar).get_json() == unsharded.get(similar).get_json()
+    
+    trending = router.get('/api/trending?top_n=5').get_json()
+    expected = unsharded.get('/api/trending?top_n=5').get_json()
+    assert [event['eventId'] for event in trending['events']] == [event['eventId'] for event in expected['events']]
+    
+    stats = router.get('/api/stats').get_json()
+    assert stats['shards'] == 2
+    assert stats['total_students'] == unsharded.get('/api/stats').get_json()['total_students']
+    
+    ready = router.get('/health/ready')
+    assert ready.status_code == 200
+    assert [shard['status'] for shard in ready.get_json()['shards']] == ['ready', 'ready']
+
+
+def test_router_broadcasts_registrations(cluster):
+    router, unsharded, uids = cluster
+    registration = {'registrationId': 'reg999999992', 'studentUid': uids[3], 'eventId': 'event0000007',
+                    'attended': True}
+    
+    routed = router.post('/api/events/registration', json=registration)
+    expected = unsharded.post('/api/events/registration', json=registration)
+    
+    assert routed.status_code == 200
+    assert routed.get_json() == expected.get_json()
+    path = f'/api/recommendations/{uids[3]}?top_n=5'
+    assert router.get(path).get_json() == unsharded.get(path).get_json()
+
+
+def test_router_rejects_unknown_students_before_broadcasting(cluster):
+    router, unsharded, uids = cluster
+    stats = router.get('/api/stats').get_json()
+    registration = {'registrationId': 'reg999999997', 'studentUid': 'ghost', 'eventId': 'event0000007'}
+    
+    response = router.post('/api/events/registration', json=registration)
+    
+    assert response.status_code == 404
+    assert response.get_json()['error'] == 'Student not found'
+    assert router.get('/api/stats').get_json() == stats
+
+
+def test_router_reports_unreachable_shards(dataset, monkeypatch):
+    shard = load_api('api_shard_alive', monkeypatch, build(dataset, shard=(0, 2)),
+                     SHARD_COUNT='2', SHARD_INDEX='0')
+    url, server = serve(shard)
+    try:
+        router = load_api(
+            'api_router_degraded', monkeypatch, SHARD_URLS=f'{url},{closed_port_url()}', SHARD_TIMEOUT_SECONDS='2'
+        ).app.test_client()
+        uids = [doc_id for doc_id, _ in dataset['students']]
+        down = [uid for uid in uids if not shard.recommender.owns_student(uid)]
+        
+        assert router.get('/health/ready').status_code == 503
+        assert router.get(f'/api/recommendations/{down[0]}').status_code == 503
+        batch = router.post('/api/recommendations/batch', json={'student_uids': uids[:20], 'top_n': 2})
+        assert batch.status_code == 503
+        assert batch.get_json()['error'] == 'Shard unavailable'
+        
+        streamed = lines(router.post('/api/recommendations/batch/stream', json={'student_uids': uids, 'top_n': 2}))
+        errors = [record['studentUid'] for record in streamed[:-1] if record.get('type') == 'error']
+        assert errors == down
+        assert streamed[-1] == {'type': 'summary', 'total': len(uids), 'errors': len(down)}
+    finally:
+        server.shutdown()
+
+
+def test_sharded_snapshot_round_trip(collections, tmp_path):
+    full = build(collections)
+    shard = build(collections, shard=(1, 2))
+    shard.save_snapshot(str(tmp_path))
+    
+    loaded = ClubHubRecommender.from_snapshot(str(tmp_path))
+    owned = [uid for uid in student_uids(collections) if loaded.owns_student(uid)]
+    
+    assert loaded.shard == (1, 2)
+    assert 0 < len(owned) < len(collections['students'])
+    assert loaded.recommend_many(owned, 5) == full.recommend_many(owned, 5)
+    assert loaded.trending_events(10) == full.trending_events(10)
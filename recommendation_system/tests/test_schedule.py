@@ -0,0 +1,58 @@
+"""
+Upcoming events: the start-time schedule rolls forward as events start
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import clubhub_recommender
+from conftest import build
+
+
+class Clock(datetime):
+    """datetime whose now() is set by the test"""
+    current = None
+    
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+def upcoming_by_scan(model, now):
+    """Rows of events that start after now and aren't completed, by a full scan"""
+    starts = model.event_starts
+    return [
+        pos for pos in sorted(model.event_index.values())
+        if not np.isnat(starts[pos]) and starts[pos] > np.datetime64(now, 'ns')
+    ]
+
+
+def test_upcoming_events_roll_forward_as_events_start(collections, monkeypatch):
+    collections['events'][0][1]['isCompleted'] = True
+    model = build(collections)
+    uid = collections['students'][0][0]
+    monkeypatch.setattr(clubhub_recommender, 'datetime', Clock)
+    Clock.current = datetime.now()
+    
+    upcoming = list(model._get_upcoming_rows())
+    assert upcoming == upcoming_by_scan(model, Clock.current)
+    assert 0 not in upcoming
+    token = model.cache_token(uid)
+    
+    # The next event to start drops out once its start time passes
+    first = model._schedule_rows[np.searchsorted(model._schedule_starts, np.datetime64(Clock.current, 'ns'), 'right')]
+    first_id = model.event_ids[first]
+    assert model._is_upcoming(first_id)
+    Clock.current = model.event_starts[first].astype('datetime64[us]').astype(datetime) + timedelta(seconds=1)
+    
+    assert not model._is_upcoming(first_id)
+    assert list(model._get_upcoming_rows()) == upcoming_by_scan(model, Clock.current)
+    assert list(model._get_upcoming_rows()) == [pos for pos in upcoming if pos != first]
+    assert model.cache_token(uid) != token
+    assert first_id not in [event['eventId'] for event in model.recommend(uid, 20)['recommendations']]
+    
+    # A week on, every event that started in between is gone as well
+    Clock.current += timedelta(days=7)
+    assert list(model._get_upcoming_rows()) == upcoming_by_scan(model, Clock.current)
+    assert len(model._get_upcoming_rows()) < len(upcoming) - 1
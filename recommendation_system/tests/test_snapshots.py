@@ -0,0 +1,51 @@
+"""
+Model snapshots: a model loaded with from_snapshot answers like the one saved
+"""
+
+from conftest import assert_same_model, build, load_api, student_uids, wait_for_job
+from clubhub_recommender import ClubHubRecommender
+import model_snapshot
+
+
+def test_snapshot_round_trip(collections, tmp_path):
+    model = build(collections)
+    model.save_snapshot(str(tmp_path))
+    
+    loaded = ClubHubRecommender.from_snapshot(str(tmp_path))
+    
+    assert loaded.snapshot_version == model_snapshot.current_version(str(tmp_path))
+    assert_same_model(loaded, model, collections)
+    assert loaded.trending_clubs(5) == model.trending_clubs(5)
+
+
+def test_cold_start_maps_a_fresh_snapshot(collections, monkeypatch, tmp_path):
+    model = build(collections)
+    model.save_snapshot(str(tmp_path))
+    api = load_api('api_cold_start', monkeypatch, MODEL_SNAPSHOT_DIR=str(tmp_path),
+                   MODEL_RECONCILE_AFTER_SECONDS='3600', FIREBASE_CRED_PATH=str(tmp_path / 'missing.json'))
+    
+    client = api.create_app('eager').test_client()
+    
+    ready = client.get('/health/ready').get_json()
+    assert ready['status'] == 'ready' and 'reconcile_job' not in ready
+    assert ready['snapshot_version'] == model_snapshot.current_version(str(tmp_path))
+    assert api.recommender.db is None
+    uids = student_uids(collections)[:20]
+    assert api.recommender.recommend_many(uids, 5) == model.recommend_many(uids, 5)
+
+
+def test_cold_start_reconciles_a_stale_snapshot(collections, monkeypatch, tmp_path):
+    build(collections).save_snapshot(str(tmp_path))
+    collections['events'] = collections['events'][:-10]  # Firestore moved on since
+    api = load_api('api_stale_start', monkeypatch, MODEL_SNAPSHOT_DIR=str(tmp_path),
+                   MODEL_RECONCILE_AFTER_SECONDS='0')
+    monkeypatch.setattr(api, 'build_recommender', lambda on_progress=None: build(collections))
+    
+    client = api.create_app('eager').test_client()
+    
+    ready = client.get('/health/ready').get_json()
+    assert ready['status'] == 'ready' and ready['reconcile_job']
+    assert wait_for_job(client, ready['reconcile_job'])['status'] == 'done'
+    assert api.recommender.db is not None
+    assert len(api.recommender.event_ids) == len(collections['events'])
+    assert model_snapshot.read_meta(str(tmp_path))['version'] == api.recommender.snapshot_version
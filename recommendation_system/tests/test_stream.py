@@ -0,0 +1,52 @@
+"""
+Streamed batches: NDJSON lines in request order, errors per student, a summary line
+"""
+
+import json
+
+from conftest import build, load_api, student_uids
+
+
+def lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_stream_matches_recommend_many(collections, monkeypatch):
+    api = load_api('api_stream', monkeypatch, build(collections))
+    client = api.app.test_client()
+    uids = student_uids(collections) * 2
+    
+    response = client.post('/api/recommendations/batch/stream', json={'student_uids': uids + [5], 'top_n': 3})
+    
+    assert response.mimetype == 'application/x-ndjson'
+    records = lines(response)
+    assert records[:-2] == json.loads(json.dumps(api.recommender.recommend_many(uids, 3)))
+    assert records[-2] == {'studentUid': 5, 'type': 'error', 'message': 'studentUid must be a string'}
+    assert records[-1] == {'type': 'summary', 'total': len(uids) + 1, 'errors': 3}
+
+
+def test_stream_reports_failed_chunks_and_goes_on(collections, monkeypatch):
+    api = load_api('api_stream_failure', monkeypatch, build(collections))
+    client = api.app.test_client()
+    uids = student_uids(collections)[:-1]
+    recommend_many = api.recommender.recommend_many
+    monkeypatch.setattr(api.recommender, 'recommend_many', lambda chunk, top_n: (
+        recommend_many(chunk, top_n) if uids[0] not in chunk else 1 / 0
+    ))
+    
+    records = lines(client.post('/api/recommendations/batch/stream', json={'student_uids': uids, 'top_n': 3}))
+    
+    chunk_size = api.recommender.BATCH_CHUNK_SIZE
+    assert [record['studentUid'] for record in records[:chunk_size]] == uids[:chunk_size]
+    assert all(record['type'] == 'error' for record in records[:chunk_size])
+    assert all(record.get('type') != 'error' for record in records[chunk_size:-1])
+    assert records[-1] == {'type': 'summary', 'total': len(uids), 'errors': chunk_size}
+
+
+def test_stream_rejects_oversized_requests(collections, monkeypatch):
+    api = load_api('api_stream_limit', monkeypatch, build(collections), MAX_STREAM_STUDENTS='10')
+    client = api.app.test_client()
+    
+    response = client.post('/api/recommendations/batch/stream', json={'student_uids': ['a'] * 11})
+    
+    assert response.status_code == 400
@@ -0,0 +1,67 @@
+"""
+Incremental sync: listener changes applied to the model against a fresh build
+"""
+
+import numpy as np
+
+from benchmark import FakeDocument
+from conftest import FakeChange, assert_same_model, build, edit_everything
+from clubhub_recommender import ClubHubRecommender
+
+
+def test_sync_matches_fresh_build(collections):
+    model = build(collections)
+    model.VOCABULARY_DRIFT_THRESHOLD = -1  # always refit, like a fresh build
+    edit_everything(model, collections)
+    
+    model, summary = model.sync()
+    
+    assert summary['refit']
+    assert summary['events'] == 3 and summary['students'] == 2 and summary['event_registrations'] == 2
+    assert_same_model(model, build(collections), collections)
+
+
+def test_sync_without_refit_keeps_rows_consistent(collections):
+    model = build(collections)
+    model.VOCABULARY_DRIFT_THRESHOLD = 1.0  # never refit
+    vocabulary = dict(model.vectorizer.vocabulary_)
+    edit_everything(model, collections)
+    
+    model, summary = model.sync()
+    
+    assert not summary['refit']
+    
+    content = model.events_df['searchable_content']
+    assert model.vectorizer.vocabulary_ == vocabulary
+    assert abs(model.event_vectors - model.vectorizer.transform(content)).max() < 1e-12
+    assert np.array_equal(model.interest_scores, model._compute_interest_scores(content))
+    assert list(model.event_ids) == [doc_id for doc_id, _ in collections['events']]
+
+
+def test_sync_skips_unchanged_documents(collections):
+    model = build(collections)
+    version = model.model_version
+    # A listener's first snapshot replays every document the model already loaded
+    model._queue_changes('events', [
+        FakeChange('ADDED', FakeDocument(doc_id, data, model.db.update_time))
+        for doc_id, data in collections['events']
+    ])
+    
+    synced, summary = model.sync()
+    
+    assert summary == {'students': 0, 'clubs': 0, 'events': 0, 'event_registrations': 0, 'refit': False}
+    assert synced is model
+    assert model.model_version == version
+
+
+def test_apply_frame_changes_keeps_slots():
+    import pandas as pd
+    
+    frame = pd.DataFrame({'id': ['a', 'b', 'c'], 'value': [1, 2, 3]})
+    rows = pd.DataFrame({'id': ['b', 'd'], 'value': [20, 4]})
+    
+    merged, source = ClubHubRecommender._apply_frame_changes(frame, 'id', rows, {'a'})
+    
+    assert list(merged['id']) == ['b', 'c', 'd']
+    assert list(merged['value']) == [20, 3, 4]
+    assert list(source) == [-1, 2, -1]
@@ -0,0 +1,62 @@
+"""
+Trending: decayed registration counts, rebuilt on sync and served at /api/trending
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import build, load_api, queue_change
+from trending import Trending
+
+
+def test_trending_counts_halve_every_half_life():
+    trending = Trending(half_life=100, origin=1000)
+    trending.add('old', 'club', trending.weight(900))
+    trending.add('new', 'club', trending.weight(1000))
+    trending.add('new', None, trending.weight(None))
+    
+    assert trending.top('events', 5, now=1000) == [('new', 2.0), ('old', pytest.approx(0.5))]
+    assert trending.top('clubs', 5, now=1100) == [('club', pytest.approx(0.75))]
+    
+    trending.add('new', 'club', -trending.weight(1000))
+    trending.add('new', None, -1.0)
+    assert trending.top('events', 5, now=1000) == [('old', pytest.approx(0.5))]
+
+
+def test_trending_token_changes_when_sync_rebuilds_counts(collections):
+    model = build(collections)
+    unregistered = next(event_id for event_id in model.event_ids if event_id not in model.trending.events)
+    # Applied live by the listener callback, then again by the sync's rebuild
+    queue_change(model, collections, 'event_registrations', 'reg999999994', {
+        'studentUid': collections['students'][0][0], 'eventId': unregistered, 'attended': False,
+        'registeredAt': datetime.now(timezone.utc)
+    })
+    token = model.trending_token()
+    
+    synced, summary = model.sync()
+    
+    assert summary['event_registrations'] == 1 and synced.model_version == model.model_version
+    assert synced.trending is not model.trending
+    assert synced.trending_token() != token
+
+
+def test_removing_every_event_clears_trending(collections):
+    model = build(collections)
+    for event_id, _ in list(collections['events']):
+        queue_change(model, collections, 'events', event_id)
+    
+    synced, summary = model.sync()
+    
+    assert len(synced.event_ids) == 0
+    assert synced.trending_events(5, upcoming_only=False) == [] and synced.trending_clubs(5) == []
+
+
+def test_trending_without_events(dataset, monkeypatch):
+    collections = dict(dataset, events=[])
+    client = load_api('api_no_events', monkeypatch, build(collections)).app.test_client()
+    
+    response = client.get('/api/trending')
+    
+    assert response.status_code == 200
+    assert response.get_json()['events'] == [] and response.get_json()['clubs'] == []
@@ -0,0 +1,38 @@
+"""
+TF-IDF vocabulary: one analysis pass per fit, refit on sync only past the drift threshold
+"""
+
+from collections import Counter
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from conftest import build, event_doc, queue_change
+
+
+def test_vocabulary_drift_triggers_refit(collections):
+    model = build(collections)
+    model.VOCABULARY_DRIFT_THRESHOLD = 0.02
+    for i in range(40):
+        queue_change(model, collections, 'events', f'event99999{i:02d}', event_doc(
+            f'Quantum Origami {i}', 'quantum origami quantum origami lecture', 'club000001', 3
+        ))
+    
+    model, summary = model.sync()
+    
+    assert summary['refit']
+    assert 'quantum' in model.vectorizer.vocabulary_
+    assert model.vocabulary_drift == 0.0
+
+
+def test_vectorizer_fit_analyses_each_event_once(collections):
+    model = build(collections)
+    content = model.events_df['searchable_content']
+    reference = TfidfVectorizer(max_features=200, stop_words='english', ngram_range=(1, 2), min_df=1)
+    vectors = reference.fit_transform(content)
+    analyze = reference.build_analyzer()
+    
+    assert model.vectorizer.get_params() == reference.get_params()
+    assert model.vectorizer.vocabulary_ == reference.vocabulary_
+    assert abs(model.event_vectors - vectors).max() < 1e-12
+    assert abs(model.vectorizer.transform(content[:20]) - vectors[:20]).max() < 1e-12
+    assert model._term_counts == Counter(term for text in content for term in analyze(text))
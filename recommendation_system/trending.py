@@ -0,0 +1,108 @@
+"""
+trending.py
+Exponentially decayed registration counts per event and per club
+"""
+
+from datetime import datetime, timezone
+from itertools import count, islice
+import threading
+import time
+
+import numpy as np
+
+
+# Source of Trending.version values, unique within a process so a rebuilt
+# Trending never repeats a version an earlier one had
+_versions = count(1)
+
+
+def timestamp_seconds(value):
+    """Unix seconds of a datetime (naive ones are taken as UTC), or None"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return None
+
+
+class Trending:
+    """
+    Registration counts that halve every half_life seconds, per event and club
+    
+    Counts are kept in "forward decay" form: a registration made at time t
+    adds 2 ** ((t - origin) / half_life) to its event and club, so adding or
+    removing one is O(1). The decayed count at time now is that weight times
+    2 ** (-(now - origin) / half_life); every key shares the factor, so the
+    ranking only changes when registrations do. Registrations with no
+    timestamp count as made at origin.
+    
+    Rankings are sorted once per change and reused until the next one.
+    version changes with every change, and never repeats across instances.
+    """
+    
+    def __init__(self, half_life, origin=None):
+        self.half_life = half_life
+        self.origin = time.time() if origin is None else origin
+        self.events = {}
+        self.clubs = {}
+        self.version = next(_versions)
+        self._rankings = {}
+        self._lock = threading.Lock()
+    
+    def weight(self, timestamp):
+        """Weight of one registration made at timestamp (Unix seconds or None)"""
+        if timestamp is None or timestamp != timestamp:
+            return 1.0
+        return float(np.exp2((timestamp - self.origin) / self.half_life))
+    
+    def weights(self, timestamps):
+        """weight() of an array of timestamps, NaN for missing"""
+        timestamps = np.asarray(timestamps, dtype=float)
+        return np.where(
+            np.isnan(timestamps), 1.0, np.exp2((np.nan_to_num(timestamps) - self.origin) / self.half_life)
+        )
+    
+    def add(self, event_id, club_id, weight):
+        """Add (or, with a negative weight, remove) registration weight"""
+        with self._lock:
+            self._add(self.events, event_id, weight)
+            if club_id is not None:
+                self._add(self.clubs, club_id, weight)
+            self.version = next(_versions)
+    
+    @staticmethod
+    def _add(weights, key, weight):
+        total = weights.get(key, 0.0) + weight
+        if total > abs(weight) * 1e-9:
+            weights[key] = total
+        else:
+            # Removed back to nothing (up to rounding)
+            weights.pop(key, None)
+    
+    def decay(self, now=None):
+        """Factor turning stored weights into counts at time now"""
+        now = time.time() if now is None else now
+        return 2.0 ** (-(now - self.origin) / self.half_life)
+    
+    def _ranking(self, kind):
+        with self._lock:
+            version, ranking = self._rankings.get(kind, (None, None))
+            if version != self.version:
+                weights = getattr(self, kind)
+                ranking = sorted(
+                    (key for key, weight in weights.items() if weight > 0),
+                    key=lambda key: (-weights[key], key)
+                )
+                self._rankings[kind] = (self.version, ranking)
+            return ranking
+    
+    def top(self, kind, n, keep=None, now=None):
+        """
+        [(key, decayed count)] of the n highest 'events' or 'clubs', best first
+        
+        keep, when given, filters keys while walking the ranking.
+        """
+        weights = getattr(self, kind)
+        keys = (key for key in self._ranking(kind) if keep is None or keep(key))
+        decay = self.decay(now)
+        return [(key, weights.get(key, 0.0) * decay) for key in islice(keys, n)]